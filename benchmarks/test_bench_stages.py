@@ -0,0 +1,87 @@
+"""Per-stage benchmarks for pytest-benchmark, on the same workloads as `relief bench`.
+
+Run with ``pytest benchmarks --benchmark-only``; compare runs with pytest-benchmark's
+``--benchmark-autosave`` / ``--benchmark-compare``.
+"""
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from twod_to_threed_relief.core.bench import (  # noqa: E402
+    BENCH_MESH_RES,
+    BENCH_SIZES,
+    synthetic_image,
+)
+from twod_to_threed_relief.core.imageproc import (  # noqa: E402
+    build_heightmap,
+    load_image,
+    map_height_range,
+)
+from twod_to_threed_relief.core.mesh import build_relief_mesh, write_binary_stl  # noqa: E402
+from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings  # noqa: E402
+from twod_to_threed_relief.core.palette import auto_palette  # noqa: E402
+from twod_to_threed_relief.core.pipeline import mesh_dims  # noqa: E402
+from twod_to_threed_relief.core.plan import build_swap_plan, preview_plan_image  # noqa: E402
+from twod_to_threed_relief.core.tdblend import composite, plan_layer_lut  # noqa: E402
+
+
+@pytest.fixture(scope="module", params=BENCH_SIZES, ids=lambda s: f"{s[0]}x{s[1]}")
+def image_path(request, tmp_path_factory):
+    path = tmp_path_factory.mktemp("bench") / "synthetic.png"
+    synthetic_image(*request.param).save(path, compress_level=1)
+    return path
+
+
+@pytest.fixture(scope="module")
+def image(image_path):
+    return load_image(str(image_path))
+
+
+@pytest.fixture(scope="module", params=BENCH_MESH_RES, ids=lambda r: f"mesh{r}")
+def case(request, image):
+    relief = ReliefSettings(mesh_res=request.param)
+    mx, my, h_mm = mesh_dims(image.size, relief)
+    hm = build_heightmap(image, mesh_x=mx, mesh_y=my)
+    thickness = map_height_range(hm, relief.min_mm, relief.max_mm)
+    palette = auto_palette(image, PlanSettings().colors, "kmeans")
+    plan = build_swap_plan(image, PlanSettings(), palette=palette, heightmap=hm)
+    return relief, (mx, my, h_mm), hm, thickness, plan
+
+
+def test_load_image(benchmark, image_path):
+    benchmark(load_image, str(image_path))
+
+
+def test_build_heightmap(benchmark, image, case):
+    _, (mx, my, _), *_ = case
+    benchmark(build_heightmap, image, mesh_x=mx, mesh_y=my)
+
+
+def test_auto_palette(benchmark, image):
+    benchmark(auto_palette, image, PlanSettings().colors, "kmeans")
+
+
+def test_build_relief_mesh(benchmark, case):
+    relief, (_, _, h_mm), _, thickness, _ = case
+    benchmark(build_relief_mesh, thickness, relief.width_mm, h_mm, relief.min_mm)
+
+
+def test_write_binary_stl(benchmark, case, tmp_path):
+    relief, (_, _, h_mm), _, thickness, _ = case
+    triangles = build_relief_mesh(thickness, relief.width_mm, h_mm, relief.min_mm)
+    benchmark(write_binary_stl, tmp_path / "bench.stl", triangles)
+
+
+def test_build_swap_plan(benchmark, image, case):
+    *_, hm, _, plan = case
+    benchmark(build_swap_plan, image, PlanSettings(), palette=plan.palette, heightmap=hm)
+
+
+def test_preview_plan_image(benchmark, image, case):
+    benchmark(preview_plan_image, image, case[-1])
+
+
+def test_composite(benchmark, case):
+    relief, _, _, thickness, plan = case
+    benchmark(composite, thickness, plan_layer_lut(plan, relief.max_mm))
@@ -1,30 +1,101 @@
 from __future__ import annotations
 
+import json
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Annotated
 
 import typer
 from rich.console import Console
 from rich.progress import Progress
+from rich.table import Table
 
+from twod_to_threed_relief.core.batch import BatchOptions, collect_jobs, run_batch
+from twod_to_threed_relief.core.bench import (
+    BENCH_MESH_RES,
+    BENCH_SIZES,
+    REGRESSION_THRESHOLD,
+    compare_results,
+    run_bench,
+)
+from twod_to_threed_relief.core.cache import ArtifactCache
 from twod_to_threed_relief.core.config import load_config
-from twod_to_threed_relief.core.imageproc import build_heightmap, heightmap_to_image, load_image, map_height_range
-from twod_to_threed_relief.core.io import ensure_dir, load_filaments, write_swap_plan, write_text
-from twod_to_threed_relief.core.mesh import build_relief_mesh, write_binary_stl
-from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings
-from twod_to_threed_relief.core.palette import auto_palette, load_palette
-from twod_to_threed_relief.core.plan import build_swap_plan, export_snippet, plan_to_text, preview_plan_image
+from twod_to_threed_relief.core.imageproc import heightmap_to_image, load_image
+from twod_to_threed_relief.core.io import ensure_dir, load_filaments, read_data, write_text
+from twod_to_threed_relief.core.models import FilamentProfile, PlanSettings, ReliefSettings
+from twod_to_threed_relief.core.palette import color_histogram, load_palette
+from twod_to_threed_relief.core.pipeline import PipelineContext
+from twod_to_threed_relief.core.profiling import profile
+from twod_to_threed_relief.core.stages import StageGraph
 
 app = typer.Typer(help="2D→3D Relief Studio CLI")
+cache_app = typer.Typer(help="Inspect and prune the artifact cache")
+app.add_typer(cache_app, name="cache")
 console = Console()
 
+CACHE_DIR_OPTION = typer.Option(None, "--cache-dir", help="Artifact cache directory")
+NO_CACHE_OPTION = typer.Option(False, "--no-cache", help="Recompute every stage")
+PROFILE_OPTION = typer.Option(
+    None, "--profile", help="Write a Chrome/Perfetto trace of every stage to this JSON file"
+)
 
-def _mesh_dims(img_size: tuple[int, int], settings: ReliefSettings) -> tuple[int, int, float]:
-    mx = settings.mesh_x or settings.mesh_res
-    my = settings.mesh_y or settings.mesh_res
-    ratio = img_size[1] / img_size[0]
-    h_mm = settings.height_mm or settings.width_mm * ratio
-    return mx, my, h_mm
+
+def _check_export(settings: ReliefSettings) -> None:
+    if (settings.stream or settings.workers > 1) and (
+        settings.mesh_format != "stl" or settings.tolerance_mm is not None
+    ):
+        raise typer.BadParameter("--stream and --workers only support uniform --format stl meshes")
+
+
+def _write_relief(ctx: PipelineContext, output: Path, export_heightmap: Path | None) -> None:
+    with Progress() as progress:
+        task = progress.add_task("Generating relief", total=2)
+        hmap = ctx.heightmap
+        progress.advance(task)
+        ctx.write_relief(output)
+        progress.advance(task)
+    if export_heightmap:
+        heightmap_to_image(hmap).save(export_heightmap)
+    console.print(f"[green]{ctx.relief.mesh_format.upper()} written:[/green] {output}")
+
+
+def _write_plan(
+    ctx: PipelineContext,
+    out: Path,
+    palette: list[str] | None = None,
+    filaments: list[FilamentProfile] | None = None,
+) -> None:
+    ctx.write_plan(out, palette=palette, filaments=filaments)
+    console.print(f"[green]Plan outputs written:[/green] {out}")
+
+
+def _print_stages(graph: StageGraph) -> None:
+    ran = ", ".join(n for n, status in graph.report.items() if status == "ran") or "none"
+    reused = ", ".join(n for n, status in graph.report.items() if status == "reused") or "none"
+    console.print(f"Stages run: {ran}; reused: {reused}")
+
+
+@contextmanager
+def _profiling(path: Path | None) -> Iterator[None]:
+    """Trace the block to ``path`` (if given) and print the per-stage summary."""
+    with profile(path) as prof:
+        yield
+    if prof is None:
+        return
+    table = Table("Span", "Calls", "Wall ms", "CPU ms", "Peak MiB", title="Profile")
+    for row in prof.summary():
+        peak = row["peak_bytes"]
+        table.add_row(
+            row["name"],
+            str(row["calls"]),
+            f"{row['wall_ms']:.1f}",
+            f"{row['cpu_ms']:.1f}",
+            "-" if peak is None else f"{peak / (1 << 20):.1f}",
+        )
+    console.print(table)
+    console.print(f"[green]Trace written:[/green] {path}")
 
 
 @app.command("relief")
@@ -38,12 +109,32 @@ def relief_cmd(
     gamma: float = 1.0,
     invert: bool = False,
     blur: float = 0.0,
-    dither: bool = False,
+    dither: bool = typer.Option(False, "--dither", help="Dither heights to --layer-height"),
+    dither_mode: str = typer.Option(
+        "bayer", "--dither-mode", help="bayer, blue-noise or diffusion"
+    ),
+    layer_height: float = typer.Option(0.2, "--layer-height", help="Print layer height in mm"),
     mesh_res: int = 256,
     mesh_x: int | None = None,
     mesh_y: int | None = None,
-    smooth: int = 0,
+    smooth: int = typer.Option(0, "--smooth", help="Heightmap smoothing radius in cells"),
+    smooth_mode: str = typer.Option("gaussian", "--smooth-mode", help="box, gaussian or guided"),
+    mesh_format: str = typer.Option("stl", "--format", help="stl, ply, obj or 3mf"),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Build heightmap and STL in row strips (bounded memory). Only uncompressed "
+        "TIFF, PPM/PGM and BMP sources are read in strips; others are decoded whole.",
+    ),
+    strip_rows: int = typer.Option(64, "--strip-rows", help="Grid rows per strip with --stream"),
+    tolerance_mm: float | None = typer.Option(
+        None, "--tolerance-mm", help="Adaptive mesh: max vertical error in mm"
+    ),
+    workers: int = typer.Option(1, "--workers", help="Processes for STL generation"),
     export_heightmap: Path | None = typer.Option(None, "--export-heightmap"),
+    cache_dir: Path | None = CACHE_DIR_OPTION,
+    no_cache: bool = NO_CACHE_OPTION,
+    profile_path: Path | None = PROFILE_OPTION,
 ) -> None:
     settings = ReliefSettings(
         width_mm=width_mm,
@@ -54,25 +145,24 @@ def relief_cmd(
         invert=invert,
         blur=blur,
         dither=dither,
+        dither_mode=dither_mode,
+        layer_height=layer_height,
         mesh_res=mesh_res,
         mesh_x=mesh_x,
         mesh_y=mesh_y,
         smooth=smooth,
+        smooth_mode=smooth_mode,
+        mesh_format=mesh_format,
+        stream=stream,
+        strip_rows=strip_rows,
+        tolerance_mm=tolerance_mm,
+        workers=workers,
     )
-    image = load_image(str(input))
-    mx, my, hm = _mesh_dims(image.size, settings)
-    with Progress() as progress:
-        task = progress.add_task("Generating relief", total=3)
-        hmap = build_heightmap(image, gamma=gamma, invert=invert, blur=blur, mesh_x=mx, mesh_y=my)
-        progress.advance(task)
-        th = map_height_range(hmap, min_mm=min_mm, max_mm=max_mm)
-        tris = build_relief_mesh(th, width_mm=width_mm, height_mm=hm, min_mm=min_mm)
-        progress.advance(task)
-        write_binary_stl(output, tris)
-        progress.advance(task)
-    if export_heightmap:
-        heightmap_to_image(hmap).save(export_heightmap)
-    console.print(f"[green]STL written:[/green] {output}")
+    _check_export(settings)
+    cache = ArtifactCache(cache_dir, enabled=not no_cache)
+    ctx = PipelineContext(input, relief=settings, cache=cache)
+    with _profiling(profile_path):
+        _write_relief(ctx, output, export_heightmap)
 
 
 @app.command("plan")
@@ -93,13 +183,15 @@ def plan_cmd(
     gcode_style: str = "none",
     seed: int = 42,
     preview_scale: float = 0.5,
+    time_budget: float = typer.Option(
+        5.0, "--time-budget", help="Seconds the optimize strategy may search"
+    ),
+    workers: int = typer.Option(1, "--workers", help="Processes for the optimize strategy"),
+    cache_dir: Path | None = CACHE_DIR_OPTION,
+    no_cache: bool = NO_CACHE_OPTION,
+    profile_path: Path | None = PROFILE_OPTION,
 ) -> None:
     out = ensure_dir(output_dir)
-    image = load_image(str(input))
-    pal = load_palette(palette) if palette else None
-    if auto_palette_n:
-        pal = auto_palette(image, auto_palette_n, palette_method, seed)
-    filament_list = load_filaments(filaments) if filaments else None
     settings = PlanSettings(
         strategy=strategy,
         layer_height=layer_height,
@@ -112,14 +204,17 @@ def plan_cmd(
         gcode_style=gcode_style,
         seed=seed,
         preview_scale=preview_scale,
+        time_budget=time_budget,
+        workers=workers,
     )
-    plan = build_swap_plan(image, settings=settings, palette=pal, filaments=filament_list)
-    write_swap_plan(out / "swap_plan.json", plan)
-    write_text(out / "swap_plan.txt", plan_to_text(plan))
-    preview_plan_image(image, plan, scale=preview_scale).save(out / "preview.png")
-    if gcode_style != "none":
-        export_snippet(out / "swap_snippets.gcode", plan)
-    console.print(f"[green]Plan outputs written:[/green] {out}")
+    cache = ArtifactCache(cache_dir, enabled=not no_cache)
+    ctx = PipelineContext(input, plan=settings, cache=cache)
+    pal = load_palette(palette) if palette else None
+    filament_list = load_filaments(filaments) if filaments else None
+    with _profiling(profile_path):
+        if auto_palette_n:
+            pal = ctx.auto_palette(auto_palette_n)
+        _write_plan(ctx, out, palette=pal, filaments=filament_list)
 
 
 @app.command("pipeline")
@@ -128,6 +223,10 @@ def pipeline_cmd(
     output_dir: Path = typer.Option(..., "--output-dir"),
     config: Path | None = typer.Option(None, "--config"),
     width_mm: float | None = None,
+    mesh_format: str | None = typer.Option(None, "--format", help="stl, ply, obj or 3mf"),
+    cache_dir: Path | None = CACHE_DIR_OPTION,
+    no_cache: bool = NO_CACHE_OPTION,
+    profile_path: Path | None = PROFILE_OPTION,
 ) -> None:
     cfg = load_config(config) if config else None
     in_path = input if input else cfg.input
@@ -136,9 +235,94 @@ def pipeline_cmd(
     relief_args = cfg.relief.model_dump() if cfg else ReliefSettings().model_dump()
     if width_mm is not None:
         relief_args["width_mm"] = width_mm
-    relief_cmd(input=in_path, output=out_dir / "relief.stl", **relief_args)
-    plan_args = cfg.plan.model_dump() if cfg else PlanSettings().model_dump()
-    plan_cmd(input=in_path, output_dir=out_dir, **plan_args)
+    if mesh_format is not None:
+        relief_args["mesh_format"] = mesh_format
+    relief = ReliefSettings(**relief_args)
+    _check_export(relief)
+    plan = cfg.plan if cfg else PlanSettings()
+    graph = StageGraph(in_path, cache=ArtifactCache(cache_dir, enabled=not no_cache))
+    with _profiling(profile_path), Progress() as progress:
+        task = progress.add_task("Running pipeline", total=None)
+        result = graph.run(
+            relief, plan, out_dir, progress=lambda name: progress.update(task, description=name)
+        )
+    console.print(f"[green]{relief.mesh_format.upper()} written:[/green] {result['stl']}")
+    console.print(f"[green]Plan outputs written:[/green] {out_dir}")
+    _print_stages(graph)
+
+
+@app.command("batch")
+def batch_cmd(
+    output_dir: Path = typer.Option(..., "--output-dir"),
+    input_dir: Path | None = typer.Option(None, "--input-dir", exists=True, file_okay=False),
+    manifest: Path | None = typer.Option(None, "--manifest", exists=True, dir_okay=False),
+    config: Path | None = typer.Option(None, "--config"),
+    mesh_format: str | None = typer.Option(None, "--format", help="stl, ply, obj or 3mf"),
+    palette: str | None = None,
+    filaments: Path | None = None,
+    workers: int = typer.Option(0, "--workers", help="Worker processes (0 = all cores)"),
+    results: Path | None = typer.Option(None, "--results", help="JSONL results manifest"),
+    force: bool = typer.Option(False, "--force", help="Rerun inputs with complete outputs"),
+    cache_dir: Path | None = CACHE_DIR_OPTION,
+    no_cache: bool = NO_CACHE_OPTION,
+) -> None:
+    if not input_dir and not manifest:
+        raise typer.BadParameter("pass --input-dir and/or --manifest")
+    data = read_data(config) if config else {}
+    relief = ReliefSettings(**data.get("relief", {}))
+    if mesh_format is not None:
+        relief = ReliefSettings(**{**relief.model_dump(), "mesh_format": mesh_format})
+    _check_export(relief)
+    opts = BatchOptions(
+        relief=relief,
+        plan=PlanSettings(**data.get("plan", {})),
+        palette=load_palette(palette) if palette else None,
+        filaments=load_filaments(filaments) if filaments else None,
+        cache_dir=cache_dir,
+        no_cache=no_cache,
+        force=force,
+    )
+    out = ensure_dir(output_dir)
+    try:
+        jobs = collect_jobs(out, input_dir, manifest)
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc), param_hint="--manifest") from exc
+    results_path = results or out / "results.jsonl"
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+    with Progress(console=console) as progress:
+        task = progress.add_task("Batch", total=len(jobs))
+        for res in run_batch(jobs, opts, workers or os.cpu_count() or 1, results_path):
+            counts[res["status"]] += 1
+            if res["status"] == "error":
+                progress.console.print(f"[red]{res['input']}:[/red] {res['error']}")
+            progress.advance(task)
+    console.print(
+        f"[green]Batch done:[/green] {counts['ok']} ok, {counts['skipped']} skipped, "
+        f"{counts['error']} failed"
+    )
+    if counts["error"]:
+        raise typer.Exit(1)
+
+
+@cache_app.command("stats")
+def cache_stats_cmd(cache_dir: Path | None = CACHE_DIR_OPTION) -> None:
+    stats = ArtifactCache(cache_dir).stats()
+    console.print(f"Cache: {stats['root']}")
+    console.print(f"Entries: {stats['entries']} ({stats['bytes'] / 1024**2:.1f} MB)")
+    for kind, info in sorted(stats["kinds"].items()):
+        console.print(f"  {kind}: {info['entries']} ({info['bytes'] / 1024**2:.1f} MB)")
+
+
+@cache_app.command("prune")
+def cache_prune_cmd(
+    cache_dir: Path | None = CACHE_DIR_OPTION,
+    max_mb: float | None = typer.Option(None, "--max-mb", help="Evict down to this size"),
+    clear: bool = typer.Option(False, "--clear", help="Remove every entry"),
+) -> None:
+    cache = ArtifactCache(cache_dir)
+    limit = 0 if clear else None if max_mb is None else int(max_mb * 1024**2)
+    removed = cache.prune(limit)
+    console.print(f"[green]Removed {removed} cache entries[/green]")
 
 
 @app.command("calibrate")
@@ -158,6 +342,71 @@ def calibrate_cmd(output_dir: Path = typer.Option(Path("calibration"), "--output
     console.print(f"[green]Calibration assets written:[/green] {out}")
 
 
+def _int_list(value: str, name: str) -> list[int]:
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise typer.BadParameter(f"{name} must be comma-separated integers") from None
+
+
+@app.command("bench")
+def bench_cmd(
+    output: Path = typer.Option(Path("bench.json"), "--output", help="Results JSON"),
+    sizes: str = typer.Option(
+        ",".join(f"{w}x{h}" for w, h in BENCH_SIZES), "--sizes", help="Image sizes, e.g. 640x480"
+    ),
+    mesh_res: str = typer.Option(
+        ",".join(map(str, BENCH_MESH_RES)), "--mesh-res", help="Mesh resolutions"
+    ),
+    repeat: int = typer.Option(3, "--repeat", min=1, help="Timed runs per stage (best is kept)"),
+    seed: int = 0,
+    compare: Path | None = typer.Option(
+        None, "--compare", exists=True, dir_okay=False, help="Baseline results JSON"
+    ),
+    threshold: float = typer.Option(
+        REGRESSION_THRESHOLD, "--threshold", help="Allowed slowdown/memory growth (0.25 = 25%)"
+    ),
+) -> None:
+    """Time every stage on synthetic images; with --compare, fail on regressions."""
+    try:
+        size_list = [tuple(int(v) for v in s.lower().split("x")) for s in sizes.split(",")]
+    except ValueError:
+        raise typer.BadParameter("--sizes must look like 640x480,2048x1536") from None
+    if any(len(s) != 2 for s in size_list):
+        raise typer.BadParameter("--sizes must look like 640x480,2048x1536")
+    results = run_bench(
+        size_list,
+        _int_list(mesh_res, "--mesh-res"),
+        repeat=repeat,
+        seed=seed,
+        progress=lambda name: console.print(f"Benchmarking {name}"),
+    )
+    write_text(output, json.dumps(results, indent=2))
+    table = Table("Case", "Stage", "Best (ms)", "Mean (ms)", "Peak MiB")
+    for case in results["cases"]:
+        for stage, m in case["stages"].items():
+            table.add_row(
+                case["name"],
+                stage,
+                f"{m['seconds'] * 1e3:.1f}",
+                f"{m['mean'] * 1e3:.1f}",
+                f"{m['peak_bytes'] / 2**20:.1f}",
+            )
+    console.print(table)
+    console.print(f"[green]Benchmark results written:[/green] {output}")
+    if compare is None:
+        return
+    regressions = compare_results(results, json.loads(compare.read_text()), threshold)
+    for r in regressions:
+        console.print(
+            f"[red]Regression[/red] {r.case} {r.stage} {r.metric}: "
+            f"{r.baseline:.4g} -> {r.current:.4g} ({r.ratio:.2f}x)"
+        )
+    if regressions:
+        raise typer.Exit(1)
+    console.print(f"No regressions beyond {threshold:.0%} against {compare}")
+
+
 @app.command("inspect")
 def inspect_cmd(
     input: Path | None = typer.Option(None, "--input"),
@@ -167,6 +416,10 @@ def inspect_cmd(
     if input:
         image = load_image(str(input))
         console.print(f"Image size: {image.size[0]}x{image.size[1]}")
+        hist = color_histogram(image)
+        console.print(f"Distinct colors ({hist.bits}-bit bins): {len(hist.colors)}")
+        top = ", ".join(f"{c} {share:.1%}" for c, share in hist.top(5))
+        console.print(f"Dominant colors: {top}")
     if filaments:
         items = load_filaments(filaments)
         console.print(f"Filaments: {len(items)}")
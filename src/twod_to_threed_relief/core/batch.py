@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+import traceback
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any
+
+from twod_to_threed_relief.core.cache import ArtifactCache
+from twod_to_threed_relief.core.io import ensure_dir, read_data
+from twod_to_threed_relief.core.models import FilamentProfile, PlanSettings, ReliefSettings
+from twod_to_threed_relief.core.pipeline import PipelineContext
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
+DONE_MARKER = ".done.json"
+# Relief settings that change how a mesh is produced but not its bytes.
+RUNTIME_FIELDS = {"stream", "strip_rows", "workers"}
+
+
+@dataclass
+class BatchJob:
+    input: Path
+    output_dir: Path
+
+
+@dataclass
+class BatchOptions:
+    relief: ReliefSettings
+    plan: PlanSettings
+    palette: list[str] | None = None
+    filaments: list[FilamentProfile] | None = None
+    cache_dir: Path | None = None
+    no_cache: bool = False
+    force: bool = False
+
+
+def collect_jobs(
+    output_root: str | Path,
+    input_dir: str | Path | None = None,
+    manifest: str | Path | None = None,
+) -> list[BatchJob]:
+    """Gather inputs from a directory and/or a manifest, one output directory per image.
+
+    A manifest is either a text file with one image path per line (``#`` comments allowed)
+    or a JSON/YAML list, each entry a path or a mapping with ``input`` and an optional
+    ``output_dir``. Relative manifest paths resolve against the manifest's directory.
+    Automatic output directories get a numeric suffix where a name is taken; two inputs
+    with the same explicit ``output_dir`` raise `ValueError`.
+    """
+    root = Path(output_root)
+    entries: list[tuple[Path, Path | None]] = []
+    if input_dir:
+        files = sorted(p for p in Path(input_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        entries += [(p, None) for p in files]
+    if manifest:
+        entries += _read_manifest(Path(manifest))
+
+    # Explicit output directories are claimed first, so automatic names steer around them.
+    used: set[Path] = set()
+    for explicit in [out for _, out in entries if out is not None]:
+        if explicit.resolve() in used:
+            raise ValueError(f"Manifest output_dir {explicit} is used by more than one input")
+        used.add(explicit.resolve())
+    jobs: list[BatchJob] = []
+    for src, out in entries:
+        if out is None:
+            out = root / src.stem
+            n = 1
+            while out.resolve() in used:
+                n += 1
+                out = root / f"{src.stem}-{n}"
+            used.add(out.resolve())
+        jobs.append(BatchJob(src, out))
+    return jobs
+
+
+def _read_manifest(path: Path) -> list[tuple[Path, Path | None]]:
+    base = path.parent
+    if path.suffix.lower() in {".json", ".yaml", ".yml"}:
+        items = read_data(path)
+    elif path.suffix.lower() == ".jsonl":
+        items = [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+    else:
+        lines = (line.strip() for line in path.read_text().splitlines())
+        items = [line for line in lines if line and not line.startswith("#")]
+    entries = []
+    for item in items:
+        if isinstance(item, dict):
+            out = base / item["output_dir"] if item.get("output_dir") else None
+            entries.append((base / item["input"], out))
+        else:
+            entries.append((base / str(item), None))
+    return entries
+
+
+def _fingerprint(job: BatchJob, opts: BatchOptions) -> dict[str, Any]:
+    st = job.input.stat()
+    return {
+        "input": str(job.input),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "relief": opts.relief.model_dump(mode="json", exclude=RUNTIME_FIELDS),
+        "plan": opts.plan.model_dump(mode="json", exclude=RUNTIME_FIELDS),
+        "palette": opts.palette,
+        "filaments": [f.model_dump() for f in opts.filaments or []],
+    }
+
+
+def is_complete(job: BatchJob, opts: BatchOptions) -> bool:
+    """True when ``job.output_dir`` holds a finished run for the same input and settings."""
+    marker = job.output_dir / DONE_MARKER
+    if not marker.exists():
+        return False
+    try:
+        return json.loads(marker.read_text()) == _fingerprint(job, opts)
+    except (OSError, ValueError):
+        return False
+
+
+def run_job(job: BatchJob, opts: BatchOptions) -> dict[str, Any]:
+    result: dict[str, Any] = {"input": str(job.input), "output_dir": str(job.output_dir)}
+    start = time.perf_counter()
+    try:
+        out = ensure_dir(job.output_dir)
+        (out / DONE_MARKER).unlink(missing_ok=True)
+        cache = ArtifactCache(opts.cache_dir, enabled=not opts.no_cache)
+        ctx = PipelineContext(job.input, relief=opts.relief, plan=opts.plan, cache=cache)
+        ctx.write_relief(out / f"relief.{opts.relief.mesh_format}")
+        ctx.write_plan(out, palette=opts.palette, filaments=opts.filaments)
+        tmp = out / f"{DONE_MARKER}.tmp"
+        tmp.write_text(json.dumps(_fingerprint(job, opts)))
+        os.replace(tmp, out / DONE_MARKER)
+        result["status"] = "ok"
+    except Exception as exc:  # noqa: BLE001
+        result["status"] = "error"
+        result["error"] = f"{type(exc).__name__}: {exc}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def run_batch(
+    jobs: list[BatchJob],
+    opts: BatchOptions,
+    workers: int = 1,
+    results_path: str | Path | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Run every job, yielding results in completion order.
+
+    Jobs whose outputs are already complete are reported as ``skipped`` without being
+    dispatched, unless ``opts.force`` is set. Each result is also appended to
+    ``results_path`` as one JSON line as soon as it is known, so an interrupted batch
+    keeps a record of what finished. Jobs run in a process pool when ``workers > 1``;
+    each job then meshes and plans in one process to avoid oversubscribing the machine.
+    """
+    if workers > 1:
+        single = {"workers": 1}
+        relief, plan = opts.relief.model_copy(update=single), opts.plan.model_copy(update=single)
+        opts = replace(opts, relief=relief, plan=plan)
+    log = Path(results_path).open("a") if results_path else None
+    try:
+        todo = []
+        for job in jobs:
+            if not opts.force and is_complete(job, opts):
+                skipped = {"input": str(job.input), "output_dir": str(job.output_dir)}
+                yield from _logged([{**skipped, "status": "skipped", "seconds": 0.0}], log)
+            else:
+                todo.append(job)
+        if workers <= 1:
+            yield from _logged((run_job(job, opts) for job in todo), log)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(run_job, job, opts) for job in todo]
+                yield from _logged((f.result() for f in as_completed(futures)), log)
+    finally:
+        if log:
+            log.close()
+
+
+def _logged(results: Iterable[dict[str, Any]], log: Any) -> Iterator[dict[str, Any]]:
+    for result in results:
+        if log:
+            log.write(json.dumps(result) + "\n")
+            log.flush()
+        yield result
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.imageproc import build_heightmap, load_image, map_height_range
+from twod_to_threed_relief.core.mesh import build_relief_mesh, write_binary_stl
+from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings
+from twod_to_threed_relief.core.palette import auto_palette
+from twod_to_threed_relief.core.pipeline import mesh_dims
+from twod_to_threed_relief.core.plan import build_swap_plan, preview_plan_image
+from twod_to_threed_relief.core.tdblend import composite, plan_layer_lut
+
+BENCH_VERSION = 1
+BENCH_SIZES = ((640, 480), (2048, 1536))
+BENCH_MESH_RES = (128, 512)
+BENCH_STAGES = (
+    "load_image",
+    "build_heightmap",
+    "auto_palette",
+    "build_relief_mesh",
+    "write_binary_stl",
+    "build_swap_plan",
+    "preview_plan_image",
+    "composite",
+)
+REGRESSION_THRESHOLD = 0.25
+# Differences below these are noise, whatever their ratio.
+REGRESSION_FLOORS = {"seconds": 0.005, "peak_bytes": 1 << 20}
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    """Deterministic test image: smooth gradients, flat colour discs with hard edges, noise."""
+    rng = np.random.default_rng(seed)
+    xs = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :]
+    ys = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    rgb = np.empty((height, width, 3), dtype=np.float32)
+    rgb[..., 0] = 128 + 100 * np.sin(7 * xs + 3 * ys)
+    rgb[..., 1] = 255 * xs * (1 - ys)
+    rgb[..., 2] = 128 + 100 * np.cos(5 * ys - 2 * xs)
+    aspect = height / width
+    for cx, cy, r in rng.uniform([0.1, 0.1, 0.05], [0.9, 0.9, 0.2], (4, 3)):
+        rgb[(xs - cx) ** 2 + ((ys - cy) * aspect) ** 2 < r * r] = rng.integers(0, 256, 3)
+    rgb += rng.standard_normal(rgb.shape, dtype=np.float32) * 6
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8))
+
+
+def measure(fn: Callable[[], Any], repeat: int = 3) -> tuple[Any, dict[str, float]]:
+    """Run ``fn`` ``repeat`` times for timing, then once under tracemalloc for peak memory.
+
+    Returns the last result and ``seconds`` (best run), ``mean`` and ``peak_bytes``.
+    Tracing is kept out of the timed runs, where it would inflate allocation-heavy stages.
+    ``peak_bytes`` covers Python and NumPy allocations; Pillow's image buffers are not
+    traced (see the run's ``max_rss_bytes``).
+    """
+    times = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        value = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return value, {"seconds": min(times), "mean": sum(times) / len(times), "peak_bytes": peak}
+
+
+def bench_case(image_path: Path, mesh_res: int, repeat: int, workdir: Path) -> dict[str, Any]:
+    """Time each of `BENCH_STAGES` on one image at one mesh resolution."""
+    stages: dict[str, dict[str, float]] = {}
+
+    def stage(name: str, fn: Callable[[], Any]) -> Any:
+        value, stages[name] = measure(fn, repeat)
+        return value
+
+    relief, settings = ReliefSettings(mesh_res=mesh_res), PlanSettings()
+    image = stage("load_image", lambda: load_image(str(image_path)))
+    mx, my, h_mm = mesh_dims(image.size, relief)
+    hm = stage("build_heightmap", lambda: build_heightmap(image, mesh_x=mx, mesh_y=my))
+    palette = stage("auto_palette", lambda: auto_palette(image, settings.colors, "kmeans"))
+    thickness = map_height_range(hm, relief.min_mm, relief.max_mm)
+    triangles = stage(
+        "build_relief_mesh",
+        lambda: build_relief_mesh(thickness, relief.width_mm, h_mm, relief.min_mm),
+    )
+    stage("write_binary_stl", lambda: write_binary_stl(workdir / "bench.stl", triangles))
+    plan = stage(
+        "build_swap_plan",
+        lambda: build_swap_plan(image, settings, palette=palette, heightmap=hm),
+    )
+    stage("preview_plan_image", lambda: preview_plan_image(image, plan))
+    lut = plan_layer_lut(plan, relief.max_mm)
+    stage("composite", lambda: composite(thickness, lut))
+    return stages
+
+
+def run_bench(
+    sizes: Iterable[tuple[int, int]] = BENCH_SIZES,
+    mesh_res: Iterable[int] = BENCH_MESH_RES,
+    repeat: int = 3,
+    seed: int = 0,
+    progress: Callable[[str], None] | None = None,
+) -> dict[str, Any]:
+    """Benchmark every stage on synthetic PNGs for each size × mesh resolution."""
+    cases = []
+    with tempfile.TemporaryDirectory(prefix="relief-bench-") as tmp:
+        workdir = Path(tmp)
+        for w, h in sizes:
+            path = workdir / f"synthetic_{w}x{h}.png"
+            synthetic_image(w, h, seed).save(path, compress_level=1)
+            for res in mesh_res:
+                name = f"{w}x{h}@{res}"
+                if progress:
+                    progress(name)
+                stages = bench_case(path, res, repeat, workdir)
+                cases.append({"name": name, "size": [w, h], "mesh_res": res, "stages": stages})
+    return {
+        "version": BENCH_VERSION,
+        "repeat": repeat,
+        "seed": seed,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "max_rss_bytes": _max_rss(),
+        "cases": cases,
+    }
+
+
+def _max_rss() -> int | None:
+    """Peak resident set size of this process so far, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@dataclass
+class Regression:
+    case: str
+    stage: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def compare_results(
+    current: dict[str, Any], baseline: dict[str, Any], threshold: float = REGRESSION_THRESHOLD
+) -> list[Regression]:
+    """Stages whose best time or peak memory grew by more than ``threshold`` (a fraction).
+
+    Only cases and stages present in both runs are compared.
+    """
+    base_cases = {c["name"]: c["stages"] for c in baseline.get("cases", [])}
+    out = []
+    for case in current["cases"]:
+        base = base_cases.get(case["name"], {})
+        for stage, metrics in case["stages"].items():
+            if stage not in base:
+                continue
+            for metric, floor in REGRESSION_FLOORS.items():
+                old, new = base[stage].get(metric), metrics.get(metric)
+                if old is None or new is None:
+                    continue
+                if new > old * (1 + threshold) and new - old > floor:
+                    out.append(Regression(case["name"], stage, metric, old, new))
+    return out
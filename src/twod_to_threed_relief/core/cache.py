@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+CACHE_VERSION = 5
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "2d-to-3d-relief"
+
+
+def file_digest(path: str | Path) -> str:
+    h = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """Content-addressed store for stage outputs with size-bounded LRU eviction.
+
+    Entries live under ``root/<kind>/<key><suffix>``; a hit refreshes the entry's mtime,
+    and eviction removes the least recently used entries first. A disabled cache misses
+    every lookup and stores nothing, so callers need no separate code path.
+    """
+
+    def __init__(
+        self,
+        root: str | Path | None = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        enabled: bool = True,
+    ) -> None:
+        self.root = Path(root) if root else default_cache_dir()
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    def digest(self, path: str | Path) -> str:
+        return file_digest(path) if self.enabled else ""
+
+    def key(self, kind: str, source: str, params: dict[str, Any]) -> str:
+        payload = {"v": CACHE_VERSION, "kind": kind, "source": source, "params": params}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, kind: str, key: str, suffix: str) -> Path:
+        return self.root / kind / f"{key}{suffix}"
+
+    def _hit(self, path: Path) -> bool:
+        if not self.enabled or not path.exists():
+            return False
+        os.utime(path)
+        return True
+
+    def _store(self, path: Path, write: Callable[[str], Any]) -> None:
+        if not self.enabled:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.prune()
+
+    def load_array(self, kind: str, key: str) -> np.ndarray | None:
+        path = self._path(kind, key, ".npy")
+        return np.load(path) if self._hit(path) else None
+
+    def save_array(self, kind: str, key: str, arr: np.ndarray) -> None:
+        def write(tmp: str) -> None:
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+
+        self._store(self._path(kind, key, ".npy"), write)
+
+    def load_json(self, kind: str, key: str) -> Any:
+        path = self._path(kind, key, ".json")
+        return json.loads(path.read_text()) if self._hit(path) else None
+
+    def save_json(self, kind: str, key: str, data: Any) -> None:
+        path = self._path(kind, key, ".json")
+        self._store(path, lambda tmp: Path(tmp).write_text(json.dumps(data)))
+
+    def cached_array(self, kind: str, key: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        arr = self.load_array(kind, key)
+        if arr is None:
+            arr = compute()
+            self.save_array(kind, key, arr)
+        return arr
+
+    def cached_memmap(
+        self, kind: str, key: str, build: Callable[[Path], Any], scratch: Path
+    ) -> np.ndarray:
+        """Like `cached_array`, but ``build`` writes a ``.npy`` file that is served memory-mapped.
+
+        On a miss the array is built at ``scratch`` and a copy is stored in the cache.
+        """
+        path = self._path(kind, key, ".npy")
+        if self._hit(path):
+            return np.load(path, mmap_mode="r")
+        build(scratch)
+        self.store_file(kind, key, scratch)
+        return np.load(scratch, mmap_mode="r")
+
+    def cached_json(self, kind: str, key: str, compute: Callable[[], Any]) -> Any:
+        data = self.load_json(kind, key)
+        if data is None:
+            data = compute()
+            self.save_json(kind, key, data)
+        return data
+
+    def fetch_file(self, kind: str, key: str, dest: str | Path) -> bool:
+        """Copy a cached file to ``dest``; return False on a miss."""
+        path = self._path(kind, key, Path(dest).suffix)
+        if not self._hit(path):
+            return False
+        shutil.copyfile(path, dest)
+        return True
+
+    def store_file(self, kind: str, key: str, src: str | Path) -> None:
+        self._store(self._path(kind, key, Path(src).suffix), lambda tmp: shutil.copyfile(src, tmp))
+
+    def _entries(self) -> list[tuple[Path, os.stat_result]]:
+        entries = []
+        for p in self.root.glob("*/*"):
+            if p.suffix == ".tmp":
+                continue
+            try:
+                entries.append((p, p.stat()))
+            except FileNotFoundError:  # evicted by a concurrent process
+                continue
+        return entries
+
+    def stats(self) -> dict[str, Any]:
+        kinds: dict[str, dict[str, int]] = {}
+        for path, st in self._entries():
+            k = kinds.setdefault(path.parent.name, {"entries": 0, "bytes": 0})
+            k["entries"] += 1
+            k["bytes"] += st.st_size
+        return {
+            "root": str(self.root),
+            "entries": sum(k["entries"] for k in kinds.values()),
+            "bytes": sum(k["bytes"] for k in kinds.values()),
+            "max_bytes": self.max_bytes,
+            "kinds": kinds,
+        }
+
+    def prune(self, max_bytes: int | None = None) -> int:
+        """Evict least recently used entries until the cache fits; return the number removed."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _, st in entries)
+        removed = 0
+        for path, st in entries:
+            if total <= limit:
+                break
+            path.unlink(missing_ok=True)
+            total -= st.st_size
+            removed += 1
+        return removed
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+
+DITHER_MODES = ("bayer", "blue-noise", "diffusion")
+BAYER_SIZE = 8
+BLUE_NOISE_SIZE = 64
+DITHER_STRIP_ROWS = 256
+DIFFUSION_STRIP_ROWS = 256
+DIFFUSION_BLOCK = 1 << 24
+# Floyd–Steinberg weights below-left, below and below-right, indexed by wavefront offset.
+FS_BELOW = np.array([3 / 16, 5 / 16, 1 / 16], dtype=np.float32)[:, None, None]
+
+
+def bayer_matrix(size: int = BAYER_SIZE) -> np.ndarray:
+    """Ordered-dither thresholds in (0, 1) for a power-of-two ``size``."""
+    m = np.zeros((1, 1), dtype=np.int64)
+    while len(m) < size:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return ((m + 0.5) / m.size).astype(np.float32)
+
+
+@lru_cache(maxsize=4)
+def blue_noise_mask(size: int = BLUE_NOISE_SIZE, seed: int = 0) -> np.ndarray:
+    """Tileable blue-noise thresholds in (0, 1), by void-and-cluster ranking.
+
+    Energies use a periodic Gaussian kernel, so the mask tiles without seams. The result
+    is cached; a 64×64 mask takes a fraction of a second to build once.
+    """
+    n = size * size
+    d = np.minimum(np.arange(size), size - np.arange(size)).astype(np.float64)
+    kernel = np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * 1.5**2)).reshape(-1)
+    rows, cols = np.divmod(np.arange(n), size)
+
+    def splat(i: int) -> np.ndarray:
+        # Kernel centred on cell i, with wrap-around.
+        return kernel[((rows - rows[i]) % size) * size + (cols - cols[i]) % size]
+
+    rng = np.random.default_rng(seed)
+    ones = np.zeros(n, dtype=bool)
+    ones[rng.choice(n, n // 10, replace=False)] = True
+    energy = np.zeros(n)
+    for i in np.flatnonzero(ones):
+        energy += splat(i)
+
+    # Spread the initial points: move the tightest cluster into the largest void.
+    while True:
+        cluster = int(np.argmax(np.where(ones, energy, -np.inf)))
+        ones[cluster] = False
+        energy -= splat(cluster)
+        void = int(np.argmin(np.where(ones, np.inf, energy)))
+        ones[void] = True
+        energy += splat(void)
+        if void == cluster:
+            break
+
+    rank = np.empty(n, dtype=np.int64)
+    start = ones.copy()
+    e = energy.copy()
+    for r in range(int(ones.sum()) - 1, -1, -1):
+        cluster = int(np.argmax(np.where(start, e, -np.inf)))
+        start[cluster] = False
+        e -= splat(cluster)
+        rank[cluster] = r
+    for r in range(int(ones.sum()), n):
+        void = int(np.argmin(np.where(ones, np.inf, energy)))
+        ones[void] = True
+        energy += splat(void)
+        rank[void] = r
+    return ((rank + 0.5) / n).astype(np.float32).reshape(size, size)
+
+
+def dither_heights(
+    heights: np.ndarray,
+    step: float,
+    mode: str = "bayer",
+    out: np.ndarray | None = None,
+    limits: tuple[float, float] | None = None,
+) -> np.ndarray:
+    """Snap heights (mm) to multiples of ``step`` (the layer height), dithering the rest.
+
+    "bayer" and "blue-noise" compare the fractional layer against a tiled threshold mask.
+    "diffusion" is Floyd–Steinberg error diffusion in independent strips of
+    ``DIFFUSION_STRIP_ROWS`` rows. Everything runs a block of rows at a time, so ``out``
+    may be ``heights`` itself or a memmap. ``limits`` (min, max) clips the result, since
+    a value near the top can round up one layer past it; it clips to the whole layers
+    inside the range, so clipped cells stay on layer boundaries.
+    """
+    if limits:
+        limits = _layer_limits(limits, step)
+    if out is None:
+        out = np.empty(heights.shape, dtype=np.float32)
+    if mode == "diffusion":
+        h, w = heights.shape
+        s = min(DIFFUSION_STRIP_ROWS, h)
+        # Bound the skewed work buffer to about DIFFUSION_BLOCK cells per call.
+        block = max(1, DIFFUSION_BLOCK // ((w + 2 * s) * s)) * s
+        for r0 in range(0, h, block):
+            levels = np.asarray(heights[r0 : r0 + block], dtype=np.float32) / step
+            rows = out[r0 : r0 + block]
+            rows[...] = _diffuse(levels, s) * step
+            if limits:
+                np.clip(rows, *limits, out=rows)
+        return out
+    if mode == "bayer":
+        mask = bayer_matrix()
+    elif mode == "blue-noise":
+        mask = blue_noise_mask()
+    else:
+        raise ValueError(f"unknown dither mode: {mode}")
+    my, mx = mask.shape
+    w = heights.shape[1]
+    tiled = np.tile(mask, (DITHER_STRIP_ROWS // my, -(-w // mx)))[:, :w]
+    for r0 in range(0, len(heights), DITHER_STRIP_ROWS):
+        rows = out[r0 : r0 + DITHER_STRIP_ROWS]
+        np.multiply(heights[r0 : r0 + DITHER_STRIP_ROWS], 1.0 / step, out=rows)
+        rows += tiled[: len(rows)]
+        np.floor(rows, out=rows)
+        rows *= step
+        if limits:
+            np.clip(rows, *limits, out=rows)
+    return out
+
+
+def _layer_limits(limits: tuple[float, float], step: float) -> tuple[np.float32, np.float32]:
+    """Lowest and highest multiples of ``step`` within ``limits``, in float32 like the layers.
+
+    When no multiple lies in range, both are the one nearest its middle.
+    """
+    lo, hi = np.ceil(limits[0] / step - 1e-6), np.floor(limits[1] / step + 1e-6)
+    if lo > hi:
+        lo = hi = np.rint((limits[0] + limits[1]) / (2 * step))
+    return np.float32(lo) * np.float32(step), np.float32(hi) * np.float32(step)
+
+
+def _diffuse(levels: np.ndarray, strip_rows: int) -> np.ndarray:
+    """Floyd–Steinberg rounding of ``levels`` to integers in strips of ``strip_rows``.
+
+    Cell (y, x) only depends on cells with a smaller ``x + 2y``, so every cell of one
+    wavefront, in every strip at once, is rounded in a single vectorized step: W + 2S
+    steps in total. The buffer is indexed (wavefront, row, strip) and holds input plus
+    diffused error until a cell is processed, then its rounded value.
+    """
+    h, w = levels.shape
+    n = -(-h // strip_rows)
+    strips = np.zeros((n, strip_rows, w), dtype=np.float32)
+    strips.reshape(-1, w)[:h] = levels
+    # One spare row per strip catches the error pushed below its last row.
+    buf = np.zeros((w + 2 * strip_rows + 3, strip_rows + 1, n), dtype=np.float32)
+    for y in range(strip_rows):
+        buf[2 * y : 2 * y + w, y] = strips[:, y].T
+    q = np.empty((strip_rows, n), dtype=np.float32)
+    below = np.empty((3, strip_rows, n), dtype=np.float32)
+    for t in range(w + 2 * strip_rows - 2):
+        # Rows whose cell on wavefront t lies inside the map.
+        y0, y1 = max(0, (t - w + 2) // 2), min(strip_rows, t // 2 + 1)
+        k = y1 - y0
+        v = buf[t, y0:y1]
+        np.rint(v, out=q[:k])
+        v -= q[:k]
+        np.multiply(FS_BELOW, v, out=below[:, :k])
+        buf[t + 1 : t + 4, y0 + 1 : y1 + 1] += below[:, :k]
+        v *= 7 / 16
+        buf[t + 1, y0:y1] += v
+        v[...] = q[:k]
+    for y in range(strip_rows):
+        strips[:, y] = buf[2 * y : 2 * y + w, y].T
+    return strips.reshape(-1, w)[:h]
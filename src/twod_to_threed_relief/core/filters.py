@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import numpy as np
+
+SMOOTH_MODES = ("box", "gaussian", "guided")
+GUIDED_EPS = 1e-3
+
+
+def box_filter(a: np.ndarray, radius: int) -> np.ndarray:
+    """Mean over a (2r+1)² window via running sums; windows are clipped at the borders."""
+    return _box_axis(_box_axis(a, radius, 0), radius, 1)
+
+
+def _box_axis(a: np.ndarray, r: int, axis: int) -> np.ndarray:
+    def along(x: np.ndarray, start: int | None, stop: int | None) -> np.ndarray:
+        return x[(slice(None),) * axis + (slice(start, stop),)]
+
+    n = a.shape[axis]
+    r = min(r, n - 1)
+    shape = list(a.shape)
+    shape[axis] = n + 1
+    csum = np.empty(shape)
+    along(csum, 0, 1)[...] = 0
+    if axis == 0:
+        # Row-by-row running sum: much faster than np.cumsum along the outer axis.
+        for i in range(n):
+            np.add(csum[i], a[i], out=csum[i + 1])
+    else:
+        np.cumsum(a, axis=axis, out=along(csum, 1, None))
+
+    # Window [i - r, i + r] clipped to [0, n). Head rows have lo = 0, tail rows hi = n.
+    out = np.empty(a.shape, dtype=np.float32)
+    i0 = min(r + 1, n)
+    i1 = max(n - r, i0)
+    head = np.minimum(np.arange(i0) + r + 1, n)
+    along(out, 0, i0)[...] = np.take(csum, head, axis=axis)
+    np.subtract(
+        along(csum, i0 + r + 1, i1 + r + 1),
+        along(csum, i0 - r, i1 - r),
+        out=along(out, i0, i1),
+        casting="same_kind",
+    )
+    np.subtract(
+        along(csum, n, n + 1),
+        along(csum, i1 - r, n - r),
+        out=along(out, i1, n),
+        casting="same_kind",
+    )
+    idx = np.arange(n)
+    inv = (1.0 / (np.minimum(idx + r + 1, n) - np.maximum(idx - r, 0))).astype(np.float32)
+    out *= inv.reshape((-1,) + (1,) * (a.ndim - 1 - axis))
+    return out
+
+
+def _gaussian_box_radius(radius: int) -> int:
+    # Three box passes of radius b have variance b(b+1); match sigma = radius / 2.
+    sigma = radius / 2
+    return max(1, round((np.sqrt(1 + 4 * sigma * sigma) - 1) / 2))
+
+
+def gaussian_filter(a: np.ndarray, radius: int) -> np.ndarray:
+    """Gaussian approximation (sigma = radius / 2) from three box passes."""
+    b = _gaussian_box_radius(radius)
+    out = a
+    for _ in range(3):
+        out = box_filter(out, b)
+    return out
+
+
+def guided_filter(a: np.ndarray, radius: int, eps: float = GUIDED_EPS) -> np.ndarray:
+    """Self-guided filter (He et al.): smooths flat noise, keeps edges with variance >> eps."""
+    a = a.astype(np.float32, copy=False)
+    mean = box_filter(a, radius)
+    var = box_filter(a * a, radius) - mean * mean
+    gain = var / (var + eps)
+    offset = mean - gain * mean
+    return box_filter(gain, radius) * a + box_filter(offset, radius)
+
+
+def smooth_heightmap(a: np.ndarray, radius: int, mode: str = "gaussian") -> np.ndarray:
+    """Smooth a heightmap with a radius-independent (O(1) per cell) filter."""
+    if radius <= 0:
+        return a
+    if mode == "box":
+        return box_filter(a, radius)
+    if mode == "gaussian":
+        return gaussian_filter(a, radius)
+    if mode == "guided":
+        return guided_filter(a, radius)
+    raise ValueError(f"unknown smooth mode: {mode}")
+
+
+def smooth_margin(radius: int, mode: str = "gaussian") -> int:
+    """Rows of context a strip needs so that strip-wise smoothing matches the whole map."""
+    if radius <= 0:
+        return 0
+    if mode == "gaussian":
+        return 3 * _gaussian_box_radius(radius)
+    return 2 * radius if mode == "guided" else radius
@@ -1,19 +1,167 @@
 from __future__ import annotations
 
+from pathlib import Path
+
 import numpy as np
 from PIL import Image, ImageFilter
 
+from twod_to_threed_relief.core.filters import smooth_heightmap, smooth_margin
+from twod_to_threed_relief.core.logging import get_logger
+from twod_to_threed_relief.core.profiling import span
 
-def load_image(path: str) -> Image.Image:
-    return Image.open(path).convert("RGB")
+REDUCE_MARGIN = 2
+HEIGHTMAP_STRIP_ROWS = 256
+LUMA_CHUNK = 1 << 16
+LUMA_WEIGHTS = np.array([0.2126, 0.7152, 0.0722])
+_LEVELS = np.arange(256) / 255.0
+SRGB_TO_LINEAR = np.where(_LEVELS <= 0.04045, _LEVELS / 12.92, ((_LEVELS + 0.055) / 1.055) ** 2.4)
+# Per-channel weighted tables indexed by 8-bit value: LUMA_LUTS[linear][channel][value].
+LUMA_LUTS = {
+    False: (LUMA_WEIGHTS[:, None] * _LEVELS).astype(np.float32),
+    True: (LUMA_WEIGHTS[:, None] * SRGB_TO_LINEAR).astype(np.float32),
+}
+GRAY_LUTS = {False: _LEVELS.astype(np.float32), True: SRGB_TO_LINEAR.astype(np.float32)}
 
 
-def luminance_array(image: Image.Image, linear: bool = False) -> np.ndarray:
-    arr = np.asarray(image, dtype=np.float32) / 255.0
-    if linear:
-        arr = np.where(arr <= 0.04045, arr / 12.92, ((arr + 0.055) / 1.055) ** 2.4)
-    lum = 0.2126 * arr[..., 0] + 0.7152 * arr[..., 1] + 0.0722 * arr[..., 2]
-    return lum
+def load_image(path: str, size_hint: tuple[int, int] | None = None) -> Image.Image:
+    """Decode ``path`` as RGB.
+
+    With ``size_hint`` (width, height) the image may come back smaller, but never below
+    ``REDUCE_MARGIN`` times the hint: JPEGs decode at a reduced DCT scale (draft mode) and
+    other formats are box-reduced right after decoding.
+    """
+    with span("decode", path=str(path)) as s:
+        im = Image.open(path)
+        if not size_hint:
+            im = im.convert("RGB")
+        else:
+            tw, th = (REDUCE_MARGIN * v for v in size_hint)
+            if im.format == "JPEG":
+                im.draft(None, (tw, th))
+            im = reduce_for_size(im.convert("RGB"), tw, th)
+        s.note(image=im)
+    return im
+
+
+def reduce_for_size(image: Image.Image, width: int, height: int) -> Image.Image:
+    """Box-reduce by the largest integer factor that keeps ``image`` at least width×height."""
+    factor = min(image.size[0] // max(width, 1), image.size[1] // max(height, 1))
+    return image.reduce(factor) if factor >= 2 else image
+
+
+# Uncompressed pixel layouts `SourceRows` reads straight from the file, by image mode.
+RAW_ROW_MODES = {
+    "L": {"L"},
+    "RGB": {"RGB", "BGR", "RGBX", "BGRX"},
+    "RGBA": {"RGBA", "BGRA"},
+}
+_RawTile = tuple[tuple[int, int, int, int], int, str, int, int]
+
+
+def _raw_tiles(im: Image.Image) -> list[_RawTile] | None:
+    """(extents, offset, rawmode, stride, orientation) of every tile, if all are raw rows."""
+    out = []
+    for tile in im.tile:
+        codec, extents, offset, args = tile
+        if codec != "raw":
+            return None
+        rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (*args, 0, 1)[:3]
+        if rawmode not in RAW_ROW_MODES.get(im.mode, ()):
+            return None
+        stride = stride or (extents[2] - extents[0]) * len(rawmode)
+        out.append((extents, offset, rawmode, stride, orientation))
+    return out or None
+
+
+class SourceRows:
+    """Row strips of an image file as RGB, box-reduced as `load_image` does for ``size_hint``.
+
+    Uncompressed layouts (raw TIFF, PPM/PGM, BMP) are read by row range straight from the
+    file, so memory follows the strip rather than the image (``streamed``). Pillow cannot
+    decode PNG, JPEG, WebP or compressed TIFF by row range: those are decoded whole,
+    JPEGs at a reduced DCT scale, with a warning for the others.
+    """
+
+    def __init__(self, path: str | Path, size_hint: tuple[int, int]) -> None:
+        self.path = str(path)
+        with Image.open(self.path) as im:
+            self.source_size = im.size
+            self._mode, fmt = im.mode, im.format
+            self._tiles = _raw_tiles(im)
+        self.streamed = self._tiles is not None
+        if self.streamed:
+            w, h = self.source_size
+            tw, th = (REDUCE_MARGIN * v for v in size_hint)
+            self.factor = max(1, min(w // max(tw, 1), h // max(th, 1)))
+            self.size = (-(-w // self.factor), -(-h // self.factor))
+            return
+        if fmt != "JPEG":
+            get_logger().warning(
+                "%s (%s) cannot be read in strips; decoding it whole. Convert it to "
+                "uncompressed TIFF to bound memory.",
+                self.path,
+                fmt,
+            )
+        self._image = load_image(self.path, size_hint=size_hint)
+        self.size = self._image.size
+
+    def rows(self, y0: int, y1: int) -> Image.Image:
+        """Rows ``y0:y1`` of the reduced image."""
+        if not self.streamed:
+            return self._image.crop((0, y0, self.size[0], y1))
+        f = self.factor
+        w, h = self.source_size
+        s0, s1 = y0 * f, min(h, y1 * f)
+        strip = Image.new(self._mode, (w, s1 - s0))
+        with open(self.path, "rb") as fh:
+            for (x0, t0, x1, t1), offset, rawmode, stride, orientation in self._tiles:
+                a, b = max(s0, t0), min(s1, t1)
+                if a >= b:
+                    continue
+                # Bottom-up tiles (BMP) store their last row first.
+                fh.seek(offset + (a - t0 if orientation > 0 else t1 - b) * stride)
+                data = fh.read((b - a) * stride)
+                part = Image.frombytes(
+                    self._mode, (x1 - x0, b - a), data, "raw", rawmode, stride, orientation
+                )
+                strip.paste(part, (x0, a - s0))
+        strip = strip.convert("RGB")
+        return strip.reduce(f) if f >= 2 else strip
+
+
+def image_size(path: str) -> tuple[int, int]:
+    """Pixel size from the file header, without decoding the image."""
+    with Image.open(path) as im:
+        return im.size
+
+
+def luminance_array(
+    image: Image.Image, linear: bool = False, out: np.ndarray | None = None
+) -> np.ndarray:
+    """Rec. 709 luminance in 0-1 as float32, via 256-entry per-channel tables.
+
+    ``out`` (H×W float32, C-contiguous) is filled in place; only a small chunk buffer is
+    allocated besides it. ``linear`` decodes sRGB first. "L" images are read directly.
+    """
+    arr = np.asarray(image)
+    if out is None:
+        out = np.empty(arr.shape[:2], dtype=np.float32)
+    flat = out.reshape(-1)
+    if arr.ndim == 2:
+        np.take(GRAY_LUTS[linear], arr.reshape(-1), out=flat)
+        return out
+    px = arr.reshape(-1, 3)
+    luts = LUMA_LUTS[linear]
+    tmp = np.empty(min(len(px), LUMA_CHUNK), dtype=np.float32)
+    for s in range(0, len(px), LUMA_CHUNK):
+        o = flat[s : s + LUMA_CHUNK]
+        t = tmp[: len(o)]
+        np.take(luts[0], px[s : s + LUMA_CHUNK, 0], out=o)
+        np.take(luts[1], px[s : s + LUMA_CHUNK, 1], out=t)
+        o += t
+        np.take(luts[2], px[s : s + LUMA_CHUNK, 2], out=t)
+        o += t
+    return out
 
 
 def build_heightmap(
@@ -23,24 +171,159 @@ def build_heightmap(
     blur: float = 0.0,
     mesh_x: int = 256,
     mesh_y: int = 256,
+    source_width: int | None = None,
+    smooth: int = 0,
+    smooth_mode: str = "gaussian",
+    out: np.ndarray | None = None,
 ) -> np.ndarray:
+    """Normalized 0-1 heightmap of ``mesh_y`` × ``mesh_x``, written into ``out`` if given.
+
+    ``blur`` is in source pixels; pass ``source_width`` when ``image`` was already reduced
+    at load time (``load_image(..., size_hint=...)``) so the radius is scaled to match.
+    ``smooth`` is a radius in heightmap cells (see `smooth_heightmap`), applied before
+    normalization.
+    """
+    # Blurring and resampling cost scale with the input, so shrink oversized inputs to
+    # about twice the grid first; the blur radius shrinks with them to keep the result.
+    src_w = source_width or image.size[0]
+    image = reduce_for_size(image, REDUCE_MARGIN * mesh_x, REDUCE_MARGIN * mesh_y)
     if blur > 0:
-        image = image.filter(ImageFilter.GaussianBlur(radius=blur))
-    image = image.resize((mesh_x, mesh_y), Image.Resampling.LANCZOS)
-    lum = luminance_array(image)
-    lum = np.clip(lum, 0, 1) ** gamma
-    if invert:
-        lum = 1.0 - lum
+        radius = blur * image.size[0] / src_w
+        with span("blur", radius=radius, image=image):
+            image = image.filter(ImageFilter.GaussianBlur(radius=radius))
+    with span("resample", image=image):
+        image = image.resize((mesh_x, mesh_y), Image.Resampling.LANCZOS)
+    lum = _shaped_luminance(image, gamma, invert, out)
+    if smooth > 0:
+        with span("smooth", radius=smooth, mode=smooth_mode, heightmap=lum):
+            lum[...] = smooth_heightmap(lum, smooth, smooth_mode)
     mn, mx = float(lum.min()), float(lum.max())
     if mx > mn:
-        lum = (lum - mn) / (mx - mn)
+        lum -= mn
+        lum /= mx - mn
+    return lum
+
+
+def _shaped_luminance(
+    image: Image.Image, gamma: float, invert: bool, out: np.ndarray | None = None
+) -> np.ndarray:
+    """Luminance with clip, gamma and invert applied in place."""
+    if image.mode == "L":
+        # Only 256 possible values: fold gamma and invert into the lookup table.
+        table = GRAY_LUTS[False] ** np.float32(gamma)
+        if invert:
+            table = 1.0 - table
+        arr = np.asarray(image)
+        if out is None:
+            out = np.empty(arr.shape, dtype=np.float32)
+        np.take(table, arr.reshape(-1), out=out.reshape(-1))
+        return out
+    lum = luminance_array(image, out=out)
+    np.clip(lum, 0, 1, out=lum)
+    if gamma != 1:
+        np.power(lum, np.float32(gamma), out=lum)
+    if invert:
+        np.subtract(1.0, lum, out=lum)
     return lum
 
 
+def stream_heightmap(
+    path: str | Path,
+    out: str | Path,
+    gamma: float = 1.0,
+    invert: bool = False,
+    blur: float = 0.0,
+    mesh_x: int = 256,
+    mesh_y: int = 256,
+    strip_rows: int = HEIGHTMAP_STRIP_ROWS,
+    smooth: int = 0,
+    smooth_mode: str = "gaussian",
+) -> np.ndarray:
+    """Build the same heightmap as `build_heightmap` into a memory-mapped ``.npy`` at ``out``.
+
+    The source is read through `SourceRows`, a strip at a time for uncompressed layouts
+    (raw TIFF, PPM/PGM, BMP); other formats are decoded whole, near the grid size. Blur,
+    resampling and luminance run one strip of output rows at a time, with enough source
+    margin that strips match the whole-image result (up to a rare one-level rounding
+    difference in the 8-bit resample). Pass one writes
+    unnormalized rows and tracks min/max, pass two rescales the file in place. With
+    ``smooth``, pass one goes to a scratch file next to ``out`` and an extra pass smooths
+    overlapping strips from it.
+    """
+    source = SourceRows(path, (mesh_x, mesh_y))
+    w, h = source.size
+    radius = blur * w / source.source_size[0]
+    sy = h / mesh_y
+    margin = int(np.ceil(3 * radius + 3 * max(sy, 1.0))) + 2
+    hm = np.lib.format.open_memmap(out, mode="w+", dtype=np.float32, shape=(mesh_y, mesh_x))
+    raw_path = Path(f"{out}.raw.npy")
+    raw = hm
+    if smooth > 0:
+        raw = np.lib.format.open_memmap(raw_path, "w+", np.float32, (mesh_y, mesh_x))
+    mn, mx = np.inf, -np.inf
+    buf = np.empty((min(strip_rows, mesh_y), mesh_x), dtype=np.float32)
+    for r0 in range(0, mesh_y, strip_rows):
+        r1 = min(mesh_y, r0 + strip_rows)
+        y0, y1 = r0 * sy, r1 * sy
+        c0 = max(0, int(y0) - margin)
+        c1 = min(h, int(np.ceil(y1)) + margin)
+        tile = source.rows(c0, c1)
+        if radius > 0:
+            tile = tile.filter(ImageFilter.GaussianBlur(radius=radius))
+        box = (0, y0 - c0, w, y1 - c0)
+        strip = tile.resize((mesh_x, r1 - r0), Image.Resampling.LANCZOS, box=box)
+        rows = raw[r0:r1]
+        _shaped_luminance(strip, gamma, invert, out=buf[: r1 - r0])
+        rows[:] = buf[: r1 - r0]
+        mn, mx = min(mn, float(rows.min())), max(mx, float(rows.max()))
+    if smooth > 0:
+        mn, mx = np.inf, -np.inf
+        pad = smooth_margin(smooth, smooth_mode)
+        for r0 in range(0, mesh_y, strip_rows):
+            r1 = min(mesh_y, r0 + strip_rows)
+            c0, c1 = max(0, r0 - pad), min(mesh_y, r1 + pad)
+            block = smooth_heightmap(np.asarray(raw[c0:c1]), smooth, smooth_mode)
+            rows = hm[r0:r1]
+            rows[:] = block[r0 - c0 : r1 - c0]
+            mn, mx = min(mn, float(rows.min())), max(mx, float(rows.max()))
+        del raw
+        raw_path.unlink()
+    if mx > mn:
+        for r0 in range(0, mesh_y, strip_rows):
+            rows = hm[r0 : r0 + strip_rows]
+            rows -= mn
+            rows /= mx - mn
+    hm.flush()
+    return hm
+
+
 def heightmap_to_image(heightmap: np.ndarray) -> Image.Image:
     arr = np.clip(heightmap * 255.0, 0, 255).astype(np.uint8)
     return Image.fromarray(arr, mode="L")
 
 
-def map_height_range(heightmap: np.ndarray, min_mm: float, max_mm: float) -> np.ndarray:
-    return min_mm + heightmap * (max_mm - min_mm)
+def map_height_range(
+    heightmap: np.ndarray, min_mm: float, max_mm: float, out: np.ndarray | None = None
+) -> np.ndarray:
+    """Heights in mm, kept inside [min_mm, max_mm] after float32 rounding.
+
+    With ``out`` (e.g. a memmap, or ``heightmap`` itself) the mapping runs strip by strip
+    in place.
+    """
+    lo, hi = _f32_inside(min_mm, 1), _f32_inside(max_mm, -1)
+    if out is None:
+        out = np.empty(heightmap.shape, dtype=np.float32)
+    for r0 in range(0, len(heightmap), HEIGHTMAP_STRIP_ROWS):
+        rows = out[r0 : r0 + HEIGHTMAP_STRIP_ROWS]
+        np.multiply(heightmap[r0 : r0 + HEIGHTMAP_STRIP_ROWS], max_mm - min_mm, out=rows)
+        rows += min_mm
+        np.clip(rows, lo, hi, out=rows)
+    return out
+
+
+def _f32_inside(value: float, direction: int) -> np.float32:
+    """Nearest float32 to ``value`` that does not step outside it in ``direction``."""
+    v = np.float32(value)
+    if (direction > 0 and float(v) < value) or (direction < 0 and float(v) > value):
+        v = np.nextafter(v, np.float32(direction * np.inf))
+    return v
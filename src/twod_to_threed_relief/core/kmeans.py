@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+ASSIGN_CHUNK = 1 << 16
+
+
+@dataclass
+class KMeansResult:
+    centers: np.ndarray
+    labels: np.ndarray
+    inertia: float
+    n_iter: int
+
+
+def _sq_dist(x: np.ndarray, xx: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Squared distances ``‖x‖² − 2x·c + ‖c‖²`` as an (n, k) float32 array."""
+    cc = np.einsum("ij,ij->i", centers, centers)
+    d = x @ centers.T
+    d *= -2.0
+    d += xx[:, None]
+    d += cc[None, :]
+    return np.maximum(d, 0.0, out=d)
+
+
+def _assign(x: np.ndarray, xx: np.ndarray, centers: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Nearest centre and its squared distance per point, in bounded-memory chunks."""
+    labels = np.empty(len(x), dtype=np.intp)
+    dist = np.empty(len(x), dtype=np.float32)
+    for s in range(0, len(x), ASSIGN_CHUNK):
+        d = _sq_dist(x[s : s + ASSIGN_CHUNK], xx[s : s + ASSIGN_CHUNK], centers)
+        lab = d.argmin(axis=1)
+        labels[s : s + ASSIGN_CHUNK] = lab
+        dist[s : s + ASSIGN_CHUNK] = np.take_along_axis(d, lab[:, None], axis=1)[:, 0]
+    return labels, dist
+
+
+def _kmeans_pp(
+    x: np.ndarray, xx: np.ndarray, w: np.ndarray, k: int, rng: np.random.Generator
+) -> np.ndarray:
+    centers = np.empty((k, x.shape[1]), dtype=np.float32)
+    centers[0] = x[rng.choice(len(x), p=w / w.sum())]
+    closest = _sq_dist(x, xx, centers[:1])[:, 0]
+    for i in range(1, k):
+        p = w * closest
+        total = p.sum()
+        # Fewer distinct points than clusters: any point is as good as another.
+        idx = rng.choice(len(x), p=p / total) if total > 0 else rng.integers(len(x))
+        centers[i] = x[idx]
+        np.minimum(closest, _sq_dist(x, xx, centers[i : i + 1])[:, 0], out=closest)
+    return centers
+
+
+def _update(
+    x: np.ndarray, w: np.ndarray, labels: np.ndarray, dist: np.ndarray, centers: np.ndarray
+) -> np.ndarray:
+    k = len(centers)
+    mass = np.bincount(labels, weights=w, minlength=k)
+    sums = np.stack(
+        [np.bincount(labels, weights=w * x[:, c], minlength=k) for c in range(x.shape[1])], 1
+    )
+    new = centers.copy()
+    filled = mass > 0
+    new[filled] = sums[filled] / mass[filled, None]
+    empty = np.flatnonzero(~filled)
+    if len(empty):
+        # Re-seed empty clusters on the points that currently cost the most.
+        far = np.argsort(-(w * dist), kind="stable")[: len(empty)]
+        new[empty[: len(far)]] = x[far]
+    return new
+
+
+def _lloyd(
+    x: np.ndarray,
+    xx: np.ndarray,
+    w: np.ndarray,
+    k: int,
+    rng: np.random.Generator,
+    max_iter: int,
+    tol: float,
+) -> KMeansResult:
+    centers = _kmeans_pp(x, xx, w, k, rng)
+    n_iter = 0
+    while n_iter < max_iter:
+        n_iter += 1
+        labels, dist = _assign(x, xx, centers)
+        new = _update(x, w, labels, dist, centers)
+        shift = float(((new - centers) ** 2).sum())
+        centers = new
+        if shift <= tol:
+            break
+    labels, dist = _assign(x, xx, centers)
+    return KMeansResult(centers, labels, float((w * dist).sum()), n_iter)
+
+
+def _minibatch(
+    x: np.ndarray,
+    xx: np.ndarray,
+    w: np.ndarray,
+    k: int,
+    rng: np.random.Generator,
+    max_iter: int,
+    tol: float,
+    batch_size: int,
+) -> KMeansResult:
+    p = w / w.sum()
+    init = rng.choice(len(x), size=min(len(x), max(batch_size, 3 * k)), replace=False, p=p)
+    centers = _kmeans_pp(x[init], xx[init], w[init], k, rng)
+    mass = np.zeros(k, dtype=np.float64)
+    n_iter = 0
+    while n_iter < max_iter:
+        n_iter += 1
+        idx = rng.choice(len(x), size=batch_size, p=p)
+        xb = x[idx]
+        labels, dist = _assign(xb, xx[idx], centers)
+        batch_mass = np.bincount(labels, minlength=k).astype(np.float64)
+        sums = np.stack(
+            [np.bincount(labels, weights=xb[:, c], minlength=k) for c in range(x.shape[1])], 1
+        )
+        mass += batch_mass
+        new = centers.copy()
+        hit = batch_mass > 0
+        # Per-centre learning rate 1/count (Sculley 2010) in closed form for the batch.
+        new[hit] += (sums[hit] - batch_mass[hit, None] * centers[hit]) / mass[hit, None]
+        dead = np.flatnonzero(mass == 0)
+        if len(dead):
+            far = np.argsort(-dist, kind="stable")[: len(dead)]
+            new[dead[: len(far)]] = xb[far]
+        shift = float(((new - centers) ** 2).sum())
+        centers = new.astype(np.float32)
+        if shift <= tol:
+            break
+    labels, dist = _assign(x, xx, centers)
+    return KMeansResult(centers, labels, float((w * dist).sum()), n_iter)
+
+
+def kmeans(
+    points: np.ndarray,
+    k: int,
+    weights: np.ndarray | None = None,
+    seed: int = 42,
+    n_init: int = 4,
+    max_iter: int = 100,
+    tol: float = 1e-4,
+    batch_size: int | None = None,
+    workers: int | None = None,
+) -> KMeansResult:
+    """Weighted k-means with k-means++ seeding, keeping the best of ``n_init`` restarts.
+
+    ``tol`` is relative to the weighted data variance and bounds the total squared centre
+    movement per iteration. ``batch_size`` switches to mini-batch updates when the sample
+    is larger than the batch. Restarts run in a thread pool (the distance products release
+    the GIL); each restart draws from its own child of ``seed``, so the result does not
+    depend on ``workers`` or scheduling.
+    """
+    x = np.ascontiguousarray(points, dtype=np.float32).reshape(len(points), -1)
+    w = np.ones(len(x)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if len(x) == 0 or k < 1:
+        raise ValueError("kmeans needs at least one point and one cluster")
+    xx = np.einsum("ij,ij->i", x, x)
+    mean = (w[:, None] * x).sum(axis=0) / w.sum()
+    var = float((w[:, None] * (x - mean) ** 2).sum() / w.sum())
+    abs_tol = tol * max(var, 1e-12)
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n_init)]
+
+    def run(rng: np.random.Generator) -> KMeansResult:
+        if batch_size and len(x) > batch_size:
+            return _minibatch(x, xx, w, k, rng, max_iter, abs_tol, batch_size)
+        return _lloyd(x, xx, w, k, rng, max_iter, abs_tol)
+
+    if n_init > 1 and (workers is None or workers > 1):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run, rngs))
+    else:
+        results = [run(rng) for rng in rngs]
+    return min(results, key=lambda r: r.inertia)
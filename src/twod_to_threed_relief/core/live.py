@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+
+from twod_to_threed_relief.core.imageproc import (
+    REDUCE_MARGIN,
+    heightmap_to_image,
+    image_size,
+    load_image,
+)
+from twod_to_threed_relief.core.models import (
+    FilamentProfile,
+    PlanSettings,
+    ReliefSettings,
+    SwapPlan,
+)
+from twod_to_threed_relief.core.palette import ColorHistogram, color_histogram
+from twod_to_threed_relief.core.pipeline import PipelineContext
+from twod_to_threed_relief.core.preview import ImagePyramid
+
+LIVE_PREVIEW_WIDTH = 1024
+LIVE_TIME_BUDGET = 0.05
+LIVE_MEMO_ENTRIES = 8
+HEIGHTMAP_FIELDS = {"gamma", "invert", "blur", "smooth", "smooth_mode"}
+
+
+@dataclass
+class LiveUpdate:
+    """One result of a live render: ``stage`` is heightmap, quantized, plan or preview."""
+
+    stage: str
+    image: Image.Image | None = None
+    plan: SwapPlan | None = None
+    final: bool = True
+
+
+class LivePreview:
+    """Reduced-resolution pipeline for interactively tuning one image.
+
+    The source is decoded once, near ``LIVE_PREVIEW_WIDTH``, on first use. Heightmaps,
+    preview thickness, palettes and quantized images are memoized by the settings they
+    depend on, so a change only recomputes the stages it affects. Renders may run on
+    several threads at once.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._image: Image.Image | None = None
+        self._memo: OrderedDict[tuple[str, str], Any] = OrderedDict()
+        self._palettes: dict[tuple[str, int], dict[int, list[str]]] = {}
+
+    @property
+    def image(self) -> Image.Image:
+        with self._lock:
+            if self._image is None:
+                w, h = image_size(str(self.path))
+                live = (min(w, LIVE_PREVIEW_WIDTH), max(1, h * min(w, LIVE_PREVIEW_WIDTH) // w))
+                hint = (max(1, live[0] // REDUCE_MARGIN), max(1, live[1] // REDUCE_MARGIN))
+                image = load_image(str(self.path), size_hint=hint)
+                if image.size != live:
+                    image = image.resize(live, Image.Resampling.BOX)
+                self._image = image
+                self.source_width = w
+                self.pyramid = ImagePyramid(self._image)
+                self.histogram: ColorHistogram = color_histogram(self._image)
+            return self._image
+
+    def context(self, relief: ReliefSettings, plan: PlanSettings) -> PipelineContext:
+        """A `PipelineContext` over the reduced image, with settings scaled to match."""
+        image = self.image
+        relief = relief.model_copy(
+            update={
+                "blur": relief.blur * image.size[0] / self.source_width,
+                "stream": False,
+                "workers": 1,
+            }
+        )
+        plan = plan.model_copy(
+            update={
+                "preview_scale": 1.0,
+                "time_budget": min(plan.time_budget, LIVE_TIME_BUDGET),
+                "workers": 1,
+            }
+        )
+        ctx = PipelineContext(self.path, relief=relief, plan=plan, image=image)
+        ctx.__dict__.update(pyramid=self.pyramid, histogram=self.histogram)
+        with self._lock:
+            ctx._palettes = self._palettes.setdefault((plan.palette_method, plan.seed), {})
+        return ctx
+
+    def _memoized(self, name: str, params: dict[str, Any], compute: Callable[[], Any]) -> Any:
+        key = (name, json.dumps(params, sort_keys=True))
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        value = compute()
+        with self._lock:
+            self._memo[key] = value
+            while len(self._memo) > LIVE_MEMO_ENTRIES:
+                self._memo.popitem(last=False)
+        return value
+
+    def _cached(self, name: str, params: dict[str, Any]) -> Any:
+        with self._lock:
+            return self._memo.get((name, json.dumps(params, sort_keys=True)))
+
+    def render(
+        self,
+        relief: ReliefSettings,
+        plan: PlanSettings,
+        palette: list[str] | None = None,
+        filaments: list[FilamentProfile] | None = None,
+    ) -> Iterator[LiveUpdate]:
+        """Yield the heightmap, quantized image, swap plan and preview frames in turn.
+
+        Each stage runs when the next update is requested, so a consumer cancels
+        cooperatively by no longer iterating.
+        """
+        ctx = self.context(relief, plan)
+        mx, my, _ = ctx.mesh_dims
+        shape = ctx.relief.model_dump(include=HEIGHTMAP_FIELDS)
+        hm = self._memoized("heightmap", {**shape, "mesh": [mx, my]}, lambda: ctx.heightmap)
+        ctx.__dict__["heightmap"] = hm
+        yield LiveUpdate("heightmap", heightmap_to_image(hm))
+
+        pal = palette or ctx.auto_palette()
+        quantized = self._memoized("quantized", {"palette": pal}, lambda: ctx.quantized(pal))
+        yield LiveUpdate("quantized", quantized)
+
+        swap = ctx.swap_plan(palette=pal, filaments=filaments)
+        yield LiveUpdate("plan", plan=swap)
+
+        r = ctx.relief
+        params = {**shape, "range": [r.min_mm, r.max_mm], "mesh_x": mx}
+        thickness = self._cached("preview", params)
+        if thickness is not None:
+            ctx.__dict__["preview_thickness"] = thickness
+            yield LiveUpdate("preview", ctx.preview(swap))
+            return
+        for frame in ctx.preview_frames(swap):
+            yield LiveUpdate("preview", frame.image, final=frame.final)
+        self._memoized("preview", params, lambda: ctx.preview_thickness)
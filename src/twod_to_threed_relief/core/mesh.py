@@ -1,30 +1,94 @@
 from __future__ import annotations
 
 import struct
+import zipfile
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
 from pathlib import Path
+from typing import BinaryIO
 
 import numpy as np
 
+from twod_to_threed_relief.core.profiling import span
 
-def _normal(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
-    n = np.cross(b - a, c - a)
-    norm = np.linalg.norm(n)
-    return n / norm if norm else np.array([0.0, 0.0, 1.0], dtype=np.float32)
+TriangleInput = np.ndarray | Sequence[tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+STL_HEADER = b"2d-to-3d-relief".ljust(80, b" ")
+STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+STL_CHUNK = 1 << 18
+STRIP_ROWS = 64
+TEXT_CHUNK = 1 << 16
+BLOCK_CHUNK = 1 << 22
+MESH_FORMATS = ("stl", "ply", "obj", "3mf")
+
+
+def triangle_count(h: int, w: int) -> int:
+    """Number of triangles `build_relief_mesh` emits for an ``h x w`` grid."""
+    return 4 * (h - 1) * (w - 1) + 4 * (w - 1) + 4 * (h - 1)
+
+
+def _grid_points(z: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    h, w = z.shape
+    pts = np.empty((h, w, 3), dtype=np.float32)
+    pts[..., 0] = xs[None, :]
+    pts[..., 1] = ys[:, None]
+    pts[..., 2] = z
+    return pts
+
+
+def _fill_grid(out: np.ndarray, pts: np.ndarray, flip: bool = False) -> None:
+    """Write the two triangles of every grid cell into ``out`` in row-major cell order.
+
+    ``pts`` holds either vertex coordinates ``(h, w, 3)`` or vertex indices ``(h, w)``.
+    """
+    h, w = pts.shape[:2]
+    cells = out.reshape(h - 1, w - 1, 2, 3, *pts.shape[2:])
+    p00, p10 = pts[:-1, :-1], pts[:-1, 1:]
+    p01, p11 = pts[1:, :-1], pts[1:, 1:]
+    if flip:
+        first, second = (p11, p10, p00), (p01, p11, p00)
+    else:
+        first, second = (p00, p10, p11), (p00, p11, p01)
+    for k in range(3):
+        cells[:, :, 0, k] = first[k]
+        cells[:, :, 1, k] = second[k]
 
 
-def _triangles_from_grid(z: np.ndarray, width_mm: float, height_mm: float) -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+def _edge(
+    xs: np.ndarray | float, ys: np.ndarray | float, top: np.ndarray, min_mm: float
+) -> tuple[np.ndarray, ...]:
+    t = np.empty((top.shape[0], 3), dtype=np.float32)
+    t[:, 0] = xs
+    t[:, 1] = ys
+    t[:, 2] = top
+    b = t.copy()
+    b[:, 2] = min_mm
+    return t[:-1], t[1:], b[:-1], b[1:]
+
+
+def _fill_walls(
+    out: np.ndarray,
+    pairs: tuple[tuple[np.ndarray, ...], tuple[np.ndarray, ...]],
+    outward: tuple[bool, bool],
+) -> None:
+    """Interleave the wall quads of two opposite edges as ``[a0, a1, b0, b1]`` per segment."""
+    quads = out.reshape(-1, 4, 3, *pairs[0][0].shape[1:])
+    for slot, ((t0, t1, b0, b1), ccw) in enumerate(zip(pairs, outward, strict=True)):
+        tris = ((b0, t1, t0), (b0, b1, t1)) if ccw else ((b0, t0, t1), (b0, t1, b1))
+        for j, tri in enumerate(tris):
+            for k in range(3):
+                quads[:, 2 * slot + j, k] = tri[k]
+
+
+def _triangles_from_grid(z: np.ndarray, width_mm: float, height_mm: float) -> np.ndarray:
     h, w = z.shape
     xs = np.linspace(0, width_mm, w, dtype=np.float32)
     ys = np.linspace(0, height_mm, h, dtype=np.float32)
-    tris: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
-    for y in range(h - 1):
-        for x in range(w - 1):
-            p00 = np.array([xs[x], ys[y], z[y, x]], dtype=np.float32)
-            p10 = np.array([xs[x + 1], ys[y], z[y, x + 1]], dtype=np.float32)
-            p01 = np.array([xs[x], ys[y + 1], z[y + 1, x]], dtype=np.float32)
-            p11 = np.array([xs[x + 1], ys[y + 1], z[y + 1, x + 1]], dtype=np.float32)
-            tris.extend([(p00, p10, p11), (p00, p11, p01)])
-    return tris
+    out = np.empty((2 * (h - 1) * (w - 1), 3, 3), dtype=np.float32)
+    _fill_grid(out, _grid_points(z, xs, ys))
+    return out
 
 
 def build_relief_mesh(
@@ -32,53 +96,707 @@ def build_relief_mesh(
     width_mm: float,
     height_mm: float,
     min_mm: float,
-) -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+) -> np.ndarray:
+    """Closed relief solid as one contiguous ``(N, 3, 3)`` float32 triangle array.
+
+    Triangles are ordered top surface, bottom surface, then side walls.
+    """
     h, w = thickness.shape
-    top = _triangles_from_grid(thickness, width_mm, height_mm)
-    bottom = _triangles_from_grid(np.full((h, w), min_mm, dtype=np.float32), width_mm, height_mm)
-    bottom = [(c, b, a) for (a, b, c) in bottom]
+    xs = np.linspace(0, width_mm, w, dtype=np.float32)
+    ys = np.linspace(0, height_mm, h, dtype=np.float32)
+    out = np.empty((triangle_count(h, w), 3, 3), dtype=np.float32)
+
+    n_grid = 2 * (h - 1) * (w - 1)
+    pts = _grid_points(thickness, xs, ys)
+    _fill_grid(out[:n_grid], pts)
+    pts[..., 2] = min_mm
+    _fill_grid(out[n_grid : 2 * n_grid], pts, flip=True)
+
+    _fill_relief_walls(out[2 * n_grid :], thickness, xs, ys, min_mm)
+    return out
+
 
+def _fill_relief_walls(
+    out: np.ndarray, thickness: np.ndarray, xs: np.ndarray, ys: np.ndarray, min_mm: float
+) -> None:
+    n_x = 4 * (len(xs) - 1)
+    front = _edge(xs, ys[0], thickness[0], min_mm)
+    back = _edge(xs, ys[-1], thickness[-1], min_mm)
+    _fill_walls(out[:n_x], (front, back), (True, False))
+    left = _edge(xs[0], ys, thickness[:, 0], min_mm)
+    right = _edge(xs[-1], ys, thickness[:, -1], min_mm)
+    _fill_walls(out[n_x:], (left, right), (False, True))
+
+
+def _strips(h: int, strip_rows: int) -> list[tuple[bool, int, int]]:
+    """``(flip, y0, y1)`` row ranges of the top then bottom surface, in mesh order."""
+    rows = [(y0, min(y0 + strip_rows, h - 1)) for y0 in range(0, h - 1, strip_rows)]
+    return [(flip, y0, y1) for flip in (False, True) for y0, y1 in rows]
+
+
+def _relief_strip(
+    thickness: np.ndarray,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    min_mm: float,
+    y0: int,
+    y1: int,
+    flip: bool,
+) -> np.ndarray:
+    pts = _grid_points(np.asarray(thickness[y0 : y1 + 1]), xs, ys[y0 : y1 + 1])
+    if flip:
+        pts[..., 2] = min_mm
+    out = np.empty((2 * (y1 - y0) * (len(xs) - 1), 3, 3), dtype=np.float32)
+    _fill_grid(out, pts, flip=flip)
+    return out
+
+
+def iter_relief_triangles(
+    thickness: np.ndarray,
+    width_mm: float,
+    height_mm: float,
+    min_mm: float,
+    strip_rows: int = STRIP_ROWS,
+) -> Iterator[np.ndarray]:
+    """Yield the triangles of `build_relief_mesh` in the same order, ``strip_rows`` grid rows
+    at a time.
+
+    Only one strip is materialized at once, and ``thickness`` is sliced per strip, so a
+    memory-mapped heightmap is read lazily.
+    """
+    h, w = thickness.shape
     xs = np.linspace(0, width_mm, w, dtype=np.float32)
     ys = np.linspace(0, height_mm, h, dtype=np.float32)
-    sides: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
-
-    for x in range(w - 1):
-        t0 = np.array([xs[x], ys[0], thickness[0, x]], dtype=np.float32)
-        t1 = np.array([xs[x + 1], ys[0], thickness[0, x + 1]], dtype=np.float32)
-        b0 = np.array([xs[x], ys[0], min_mm], dtype=np.float32)
-        b1 = np.array([xs[x + 1], ys[0], min_mm], dtype=np.float32)
-        sides.extend([(b0, t1, t0), (b0, b1, t1)])
-
-        t0 = np.array([xs[x], ys[-1], thickness[-1, x]], dtype=np.float32)
-        t1 = np.array([xs[x + 1], ys[-1], thickness[-1, x + 1]], dtype=np.float32)
-        b0 = np.array([xs[x], ys[-1], min_mm], dtype=np.float32)
-        b1 = np.array([xs[x + 1], ys[-1], min_mm], dtype=np.float32)
-        sides.extend([(b0, t0, t1), (b0, t1, b1)])
-
-    for y in range(h - 1):
-        t0 = np.array([xs[0], ys[y], thickness[y, 0]], dtype=np.float32)
-        t1 = np.array([xs[0], ys[y + 1], thickness[y + 1, 0]], dtype=np.float32)
-        b0 = np.array([xs[0], ys[y], min_mm], dtype=np.float32)
-        b1 = np.array([xs[0], ys[y + 1], min_mm], dtype=np.float32)
-        sides.extend([(b0, t0, t1), (b0, t1, b1)])
-
-        t0 = np.array([xs[-1], ys[y], thickness[y, -1]], dtype=np.float32)
-        t1 = np.array([xs[-1], ys[y + 1], thickness[y + 1, -1]], dtype=np.float32)
-        b0 = np.array([xs[-1], ys[y], min_mm], dtype=np.float32)
-        b1 = np.array([xs[-1], ys[y + 1], min_mm], dtype=np.float32)
-        sides.extend([(b0, t1, t0), (b0, b1, t1)])
-
-    return top + bottom + sides
-
-
-def write_binary_stl(path: str | Path, triangles: list[tuple[np.ndarray, np.ndarray, np.ndarray]]) -> None:
+    for flip, y0, y1 in _strips(h, strip_rows):
+        yield _relief_strip(thickness, xs, ys, min_mm, y0, y1, flip)
+    walls = np.empty((4 * (w - 1) + 4 * (h - 1), 3, 3), dtype=np.float32)
+    _fill_relief_walls(walls, thickness, xs, ys, min_mm)
+    yield walls
+
+
+def as_triangle_array(triangles: TriangleInput) -> np.ndarray:
+    """Return ``triangles`` as an ``(N, 3, 3)`` float array, keeping float64 input as-is."""
+    if isinstance(triangles, np.ndarray):
+        arr = triangles
+    elif len(triangles) == 0:
+        return np.empty((0, 3, 3), dtype=np.float32)
+    else:
+        arr = np.asarray(triangles)
+    if arr.dtype != np.float64:
+        arr = arr.astype(np.float32, copy=False)
+    return arr.reshape(-1, 3, 3)
+
+
+def face_normals(triangles: np.ndarray) -> np.ndarray:
+    """Unit normals for every triangle; degenerate faces get ``(0, 0, 1)``."""
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    n = np.cross(b - a, c - a)
+    # Same reduction as np.linalg.norm on a single vector, so STL bytes stay stable.
+    norm = np.sqrt(np.matmul(n[:, None, :], n[:, :, None])[:, 0, 0])
+    degenerate = norm == 0
+    norm[degenerate] = 1
+    n /= norm[:, None]
+    n[degenerate] = (0.0, 0.0, 1.0)
+    return n
+
+
+def stl_records(triangles: np.ndarray) -> np.ndarray:
+    records = np.zeros(len(triangles), dtype=STL_RECORD)
+    records["normal"] = face_normals(triangles)
+    records["vertices"] = triangles
+    return records
+
+
+def write_stl_header(f: BinaryIO, count: int) -> None:
+    f.write(STL_HEADER)
+    f.write(struct.pack("<I", count))
+
+
+def write_stl_triangles(f: BinaryIO, triangles: np.ndarray, chunk: int = STL_CHUNK) -> None:
+    for start in range(0, len(triangles), chunk):
+        f.write(stl_records(triangles[start : start + chunk]).data)
+
+
+def write_binary_stl_stream(path: str | Path, strips: Iterable[np.ndarray], count: int) -> None:
+    """Write a binary STL whose ``count`` triangles arrive as ``(n, 3, 3)`` strips."""
+    written = 0
+    with Path(path).open("wb") as f:
+        write_stl_header(f, count)
+        for strip in strips:
+            write_stl_triangles(f, strip)
+            written += len(strip)
+    if written != count:
+        raise ValueError(f"STL header promised {count} triangles but {written} were written")
+
+
+def write_relief_stl(
+    path: str | Path,
+    thickness: np.ndarray,
+    width_mm: float,
+    height_mm: float,
+    min_mm: float,
+    strip_rows: int = STRIP_ROWS,
+) -> None:
+    """Stream the relief solid to STL; peak memory scales with ``strip_rows``, not grid size."""
+    h, w = thickness.shape
+    strips = iter_relief_triangles(thickness, width_mm, height_mm, min_mm, strip_rows)
+    write_binary_stl_stream(path, strips, triangle_count(h, w))
+
+
+_band_state: dict = {}
+
+
+def _init_band_worker(
+    shm_name: str, shape: tuple[int, int], path: str, dims: tuple[float, float, float]
+) -> None:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    h, w = shape
+    width_mm, height_mm, min_mm = dims
+    _band_state.update(
+        shm=shm,
+        thickness=np.ndarray(shape, dtype=np.float32, buffer=shm.buf),
+        xs=np.linspace(0, width_mm, w, dtype=np.float32),
+        ys=np.linspace(0, height_mm, h, dtype=np.float32),
+        min_mm=min_mm,
+        path=path,
+    )
+
+
+def _write_band(task: tuple[bool, int, int, int]) -> int:
+    """Build one strip in a worker and write its records at their final file offset."""
+    flip, y0, y1, offset = task
+    st = _band_state
+    tris = _relief_strip(st["thickness"], st["xs"], st["ys"], st["min_mm"], y0, y1, flip)
+    with open(st["path"], "r+b") as f:
+        f.seek(offset)
+        write_stl_triangles(f, tris)
+    return len(tris)
+
+
+def write_relief_stl_parallel(
+    path: str | Path,
+    thickness: np.ndarray,
+    width_mm: float,
+    height_mm: float,
+    min_mm: float,
+    workers: int,
+    strip_rows: int = STRIP_ROWS,
+) -> None:
+    """Write the relief STL with ``workers`` processes, one row strip per task.
+
+    The heightmap is shared with the workers through shared memory and every strip is
+    written at its precomputed offset, so the file is identical to `write_relief_stl`.
+    """
+    h, w = thickness.shape
+    path = str(path)
+    count = triangle_count(h, w)
+    with open(path, "wb") as f:
+        write_stl_header(f, count)
+        f.truncate(len(STL_HEADER) + 4 + count * STL_RECORD.itemsize)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, h * w * 4))
+    try:
+        shared = np.ndarray((h, w), dtype=np.float32, buffer=shm.buf)
+        shared[:] = thickness
+        tasks, start = [], 0
+        for flip, y0, y1 in _strips(h, strip_rows):
+            tasks.append((flip, y0, y1, len(STL_HEADER) + 4 + start * STL_RECORD.itemsize))
+            start += 2 * (y1 - y0) * (w - 1)
+        init = (shm.name, (h, w), path, (width_mm, height_mm, min_mm))
+        with ProcessPoolExecutor(workers, initializer=_init_band_worker, initargs=init) as pool:
+            written = sum(pool.map(_write_band, tasks))
+        xs = np.linspace(0, width_mm, w, dtype=np.float32)
+        ys = np.linspace(0, height_mm, h, dtype=np.float32)
+        walls = np.empty((count - start, 3, 3), dtype=np.float32)
+        _fill_relief_walls(walls, shared, xs, ys, min_mm)
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    with open(path, "r+b") as f:
+        f.seek(len(STL_HEADER) + 4 + start * STL_RECORD.itemsize)
+        write_stl_triangles(f, walls)
+    if written != start:
+        raise ValueError(f"Workers wrote {written} of {start} surface triangles")
+
+
+def write_binary_stl(path: str | Path, triangles: TriangleInput, chunk: int = STL_CHUNK) -> None:
+    """Write a binary STL from a triangle list or an ``(N, 3, 3)`` array.
+
+    The body is serialized through `STL_RECORD` in chunks of ``chunk`` triangles.
+    """
+    tris = as_triangle_array(triangles)
     with Path(path).open("wb") as f:
-        f.write(b"2d-to-3d-relief".ljust(80, b" "))
-        f.write(struct.pack("<I", len(triangles)))
-        for a, b, c in triangles:
-            n = _normal(a, b, c).astype(np.float32)
-            f.write(struct.pack("<3f", *n))
-            f.write(struct.pack("<3f", *a))
-            f.write(struct.pack("<3f", *b))
-            f.write(struct.pack("<3f", *c))
-            f.write(struct.pack("<H", 0))
+        write_stl_header(f, len(tris))
+        write_stl_triangles(f, tris, chunk)
+
+
+@dataclass
+class IndexedMesh:
+    """Shared float32 ``vertices`` ``(V, 3)`` and int32 ``faces`` ``(F, 3)``."""
+
+    vertices: np.ndarray
+    faces: np.ndarray
+
+    def triangles(self) -> np.ndarray:
+        return self.vertices[self.faces]
+
+
+def _edge_indices(idx: np.ndarray, offset: int) -> tuple[np.ndarray, ...]:
+    return idx[:-1], idx[1:], idx[:-1] + offset, idx[1:] + offset
+
+
+def build_indexed_relief_mesh(
+    thickness: np.ndarray,
+    width_mm: float,
+    height_mm: float,
+    min_mm: float,
+) -> IndexedMesh:
+    """Indexed counterpart of `build_relief_mesh` with the same faces in the same order.
+
+    Vertices are the top grid followed by the bottom grid, both row-major.
+    """
+    h, w = thickness.shape
+    xs = np.linspace(0, width_mm, w, dtype=np.float32)
+    ys = np.linspace(0, height_mm, h, dtype=np.float32)
+    top = _grid_points(thickness, xs, ys)
+    bottom = top.copy()
+    bottom[..., 2] = min_mm
+    vertices = np.concatenate([top.reshape(-1, 3), bottom.reshape(-1, 3)])
+
+    off = h * w
+    idx = np.arange(off, dtype=np.int32).reshape(h, w)
+    faces = np.empty((triangle_count(h, w), 3), dtype=np.int32)
+    n_grid = 2 * (h - 1) * (w - 1)
+    _fill_grid(faces[:n_grid], idx)
+    _fill_grid(faces[n_grid : 2 * n_grid], idx + off, flip=True)
+
+    walls = faces[2 * n_grid :]
+    n_x = 4 * (w - 1)
+    front, back = _edge_indices(idx[0], off), _edge_indices(idx[-1], off)
+    _fill_walls(walls[:n_x], (front, back), (True, False))
+    left, right = _edge_indices(idx[:, 0], off), _edge_indices(idx[:, -1], off)
+    _fill_walls(walls[n_x:], (left, right), (False, True))
+    return IndexedMesh(vertices=vertices, faces=faces)
+
+
+def _ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def _block_errors(z: np.ndarray, s: int, nby: int, nbx: int) -> np.ndarray:
+    """Max deviation of every ``s``-cell block from the two triangles spanning its corners."""
+    err = np.zeros((nby, nbx), dtype=np.float32)
+    if not nby or not nbx:
+        return err
+    t = np.arange(s + 1, dtype=np.float32) / s
+    u = t.reshape(1, 1, 1, s + 1)
+    v = t.reshape(1, s + 1, 1, 1)
+    upper = u >= v
+    rows = max(1, BLOCK_CHUNK // ((s + 1) * (s + 1) * nbx))
+    for r0 in range(0, nby, rows):
+        r1 = min(r0 + rows, nby)
+        sub = np.asarray(z[r0 * s : r1 * s + 1, : nbx * s + 1], dtype=np.float32)
+        rs, cs = sub.strides
+        shape = (r1 - r0, s + 1, nbx, s + 1)
+        strides = (s * rs, rs, s * cs, cs)
+        blocks = np.lib.stride_tricks.as_strided(sub, shape, strides, writeable=False)
+        z00 = blocks[:, :1, :, :1]
+        z10 = blocks[:, :1, :, s:]
+        z01 = blocks[:, s:, :, :1]
+        z11 = blocks[:, s:, :, s:]
+        above = z00 + u * (z10 - z00) + v * (z11 - z10)
+        below = z00 + v * (z01 - z00) + u * (z11 - z01)
+        interp = np.where(upper, above, below)
+        err[r0:r1] = np.abs(blocks - interp).max(axis=(1, 3))
+    return err
+
+
+def _quadtree_leaves(
+    flat: list[np.ndarray], split: list[np.ndarray], ch: int, cw: int
+) -> list[np.ndarray]:
+    """Top-down leaf masks per level: a block is a leaf if it lies inside the grid, is flat
+    enough and has not been forced to split."""
+    levels = len(flat) - 1
+    leaves: list[np.ndarray] = [np.zeros((0, 0), dtype=bool)] * (levels + 1)
+    active = np.ones((_ceil_div(ch, 1 << levels), _ceil_div(cw, 1 << levels)), dtype=bool)
+    for lv in range(levels, 0, -1):
+        ok = np.zeros_like(active)
+        nby, nbx = flat[lv].shape
+        ok[:nby, :nbx] = flat[lv] & ~split[lv]
+        leaves[lv] = active & ok
+        half = 1 << (lv - 1)
+        children = (active & ~ok).repeat(2, axis=0).repeat(2, axis=1)
+        active = children[: _ceil_div(ch, half), : _ceil_div(cw, half)]
+    leaves[0] = active
+    return leaves
+
+
+def _perimeter(s: int) -> tuple[np.ndarray, np.ndarray]:
+    """Grid offsets ``(dy, dx)`` of an ``s``-cell block boundary, counter-clockwise from (0, 0)."""
+    p = np.arange(s)
+    dy = np.concatenate([np.zeros(s, dtype=int), p, np.full(s, s), s - p])
+    dx = np.concatenate([p, np.full(s, s), s - p, np.zeros(s, dtype=int)])
+    return dy, dx
+
+
+def _fan_params(s: int) -> tuple[np.ndarray, np.ndarray]:
+    """For every sample of an ``s``-cell block, the perimeter parameter of its ray from the
+    block centre and its Chebyshev distance to the centre as a fraction of the half size."""
+    half = s / 2
+    d = np.arange(s + 1) - half
+    dy, dx = np.meshgrid(d, d, indexing="ij")
+    cheb = np.maximum(np.abs(dx), np.abs(dy))
+    t = cheb / half
+    safe = np.where(cheb == 0, 1, cheb)
+    qx, qy = dx * half / safe, dy * half / safe
+    param = np.where(
+        np.abs(dx) >= np.abs(dy),
+        np.where(dx > 0, s + qy + half, 3 * s + half - qy),
+        np.where(dy > 0, 2 * s + half - qx, qx + half),
+    )
+    param = np.where(cheb == 0, 0, param)
+    return param.ravel(), t.ravel()
+
+
+def _fan_errors(
+    z: np.ndarray, used: np.ndarray, y0: np.ndarray, x0: np.ndarray, s: int
+) -> np.ndarray:
+    """Max deviation of each block from the fan around its centre through its used
+    perimeter vertices."""
+    py, px = _perimeter(s)
+    param, t = _fan_params(s)
+    pos = np.arange(4 * s + 1)
+    lo = np.minimum(np.floor(param).astype(int), 4 * s - 1)
+    li, lj = np.divmod(np.arange((s + 1) ** 2), s + 1)
+    errs = np.empty(len(y0), dtype=np.float32)
+    step = max(1, BLOCK_CHUNK // ((s + 1) ** 2 + 4 * s))
+    for f0 in range(0, len(y0), step):
+        ys, xs = y0[f0 : f0 + step, None], x0[f0 : f0 + step, None]
+        on = np.concatenate([used[ys + py, xs + px], np.ones((len(ys), 1), dtype=bool)], axis=1)
+        zp = z[ys + np.append(py, 0), xs + np.append(px, 0)]
+        prev = np.maximum.accumulate(np.where(on, pos, 0), axis=1)
+        nxt = np.minimum.accumulate(np.where(on, pos, 4 * s)[:, ::-1], axis=1)[:, ::-1]
+        a, b = np.take(prev, lo, axis=1), np.take(nxt, lo + 1, axis=1)
+        za, zb = np.take_along_axis(zp, a, axis=1), np.take_along_axis(zp, b, axis=1)
+        wgt = (param - a) / np.where(b > a, b - a, 1)
+        zq = za + wgt * (zb - za)
+        zc = z[ys + s // 2, xs + s // 2]
+        fan = zc + t * (zq - zc)
+        errs[f0 : f0 + step] = np.abs(z[ys + li, xs + lj] - fan).max(axis=1)
+    return errs
+
+
+def _edge_counts(used: np.ndarray, y0: np.ndarray, x0: np.ndarray, s: np.ndarray) -> np.ndarray:
+    """Number of used vertices strictly inside the four edges of each block."""
+    h, w = used.shape
+    rc = np.zeros((h, w + 1), dtype=np.int64)
+    np.cumsum(used, axis=1, out=rc[:, 1:])
+    cc = np.zeros((h + 1, w), dtype=np.int64)
+    np.cumsum(used, axis=0, out=cc[1:])
+    y1, x1 = y0 + s, x0 + s
+    return (
+        rc[y0, x1] - rc[y0, x0 + 1]
+        + rc[y1, x1] - rc[y1, x0 + 1]
+        + cc[y1, x0] - cc[y0 + 1, x0]
+        + cc[y1, x1] - cc[y0 + 1, x1]
+    )
+
+
+def _leaf_blocks(leaves: list[np.ndarray]) -> tuple[np.ndarray, ...]:
+    by, bx, lv = [], [], []
+    for level, mask in enumerate(leaves):
+        yy, xx = np.nonzero(mask)
+        by.append(yy)
+        bx.append(xx)
+        lv.append(np.full(len(yy), level))
+    by, bx, lv = np.concatenate(by), np.concatenate(bx), np.concatenate(lv)
+    s = 1 << lv
+    return by * s, bx * s, s, lv, by, bx
+
+
+def _mark_corners(used: np.ndarray, y0: np.ndarray, x0: np.ndarray, s: np.ndarray) -> None:
+    for dy in (0, 1):
+        for dx in (0, 1):
+            used[y0 + dy * s, x0 + dx * s] = True
+
+
+def _wall_faces(
+    u: np.ndarray, z: np.ndarray, ids: np.ndarray, b0: int, b1: int, min_mm: float
+) -> list[tuple[int, int, int]]:
+    """Triangulate a vertical wall between its top chain and its two bottom corners.
+
+    The wall is an x-monotone polygon whose lower chain is a single edge, so the classic
+    stack-based monotone triangulation covers it without extra bottom vertices.
+    """
+    pts = [(float(u[0]), float(min_mm), b0)] + [
+        (float(a), float(b), int(i)) for a, b, i in zip(u, z, ids, strict=True)
+    ]
+    faces = []
+    stack = pts[:2]
+    for cur in pts[2:]:
+        last = stack.pop()
+        while stack:
+            a = stack[-1]
+            above = (cur[0] - a[0]) * (last[1] - a[1]) - (cur[1] - a[1]) * (last[0] - a[0])
+            if above <= 0:
+                break
+            faces.append((a[2], last[2], cur[2]))
+            last = stack.pop()
+        stack.extend([last, cur])
+    faces.extend((b1, p[2], q[2]) for p, q in zip(stack, stack[1:], strict=False))
+    return faces
+
+
+def _orient(vertices: np.ndarray, faces: np.ndarray, direction: tuple[float, ...]) -> np.ndarray:
+    """Flip faces whose normal points away from ``direction``."""
+    tri = vertices[faces]
+    n = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    flip = n @ np.asarray(direction, dtype=np.float32) < 0
+    faces[flip] = faces[flip][:, ::-1]
+    return faces
+
+
+def build_adaptive_relief_mesh(
+    thickness: np.ndarray,
+    width_mm: float,
+    height_mm: float,
+    min_mm: float,
+    tolerance_mm: float,
+) -> IndexedMesh:
+    """Quadtree-decimated relief solid whose top stays within ``tolerance_mm`` of the grid.
+
+    Blocks that fit the two triangles spanning their corners become single quads; blocks
+    bordering finer neighbours are fanned from their centre through every neighbour vertex
+    so the surface has no cracks, and are split further if the fan misses the tolerance.
+    The bottom is two triangles and the walls are stitched to the decimated top edge.
+    """
+    h, w = thickness.shape
+    ch, cw = h - 1, w - 1
+    z = np.asarray(thickness, dtype=np.float32)
+    levels = max(0, int(np.ceil(np.log2(max(ch, cw)))))
+    flat = [np.ones((ch, cw), dtype=bool)]
+    for lv in range(1, levels + 1):
+        s = 1 << lv
+        flat.append(_block_errors(z, s, ch // s, cw // s) <= tolerance_mm)
+    split = [np.zeros_like(f) for f in flat]
+
+    while True:
+        y0, x0, s, lv, by, bx = _leaf_blocks(_quadtree_leaves(flat, split, ch, cw))
+        used = np.zeros((h, w), dtype=bool)
+        _mark_corners(used, y0, x0, s)
+        fan = (s > 1) & (_edge_counts(used, y0, x0, s) > 0)
+        bad = False
+        for size in np.unique(s[fan]):
+            sel = np.flatnonzero(fan & (s == size))
+            over = sel[_fan_errors(z, used, y0[sel], x0[sel], int(size)) > tolerance_mm]
+            if len(over):
+                split[int(np.log2(size))][by[over], bx[over]] = True
+                bad = True
+        if not bad:
+            break
+
+    used[y0[fan] + s[fan] // 2, x0[fan] + s[fan] // 2] = True
+    vid = np.cumsum(used).reshape(h, w) - 1
+    gy, gx = np.nonzero(used)
+    xs = np.linspace(0, width_mm, w, dtype=np.float32)
+    ys = np.linspace(0, height_mm, h, dtype=np.float32)
+    n_top = len(gy)
+    vertices = np.empty((n_top + 4, 3), dtype=np.float32)
+    vertices[:n_top, 0] = xs[gx]
+    vertices[:n_top, 1] = ys[gy]
+    vertices[:n_top, 2] = z[gy, gx]
+    vertices[n_top:] = [
+        (0, 0, min_mm), (width_mm, 0, min_mm), (width_mm, height_mm, min_mm), (0, height_mm, min_mm)
+    ]
+    c00, c10, c11, c01 = range(n_top, n_top + 4)
+
+    quad = ~fan
+    q00, q10 = vid[y0[quad], x0[quad]], vid[y0[quad], x0[quad] + s[quad]]
+    q01, q11 = vid[y0[quad] + s[quad], x0[quad]], vid[y0[quad] + s[quad], x0[quad] + s[quad]]
+    top = [np.stack([q00, q10, q11], axis=1), np.stack([q00, q11, q01], axis=1)]
+    for size in np.unique(s[fan]):
+        size = int(size)
+        sel = np.flatnonzero(fan & (s == size))
+        py, px = _perimeter(size)
+        ry, rx = y0[sel, None] + py, x0[sel, None] + px
+        fi, pi = np.nonzero(used[ry, rx])
+        ring = vid[ry[fi, pi], rx[fi, pi]]
+        first = np.flatnonzero(np.r_[True, fi[1:] != fi[:-1]])
+        nxt = np.roll(ring, -1)
+        ends = np.r_[first[1:], len(ring)] - 1
+        nxt[ends] = ring[first]
+        centre = vid[y0[sel] + size // 2, x0[sel] + size // 2][fi]
+        top.append(np.stack([centre, ring, nxt], axis=1))
+
+    walls = []
+    for edge, coords, b0, b1, direction in (
+        (np.s_[0, :], xs, c00, c10, (0, -1, 0)),
+        (np.s_[-1, :], xs, c01, c11, (0, 1, 0)),
+        (np.s_[:, 0], ys, c00, c01, (-1, 0, 0)),
+        (np.s_[:, -1], ys, c10, c11, (1, 0, 0)),
+    ):
+        along = np.flatnonzero(used[edge])
+        tris = _wall_faces(coords[along], z[edge][along], vid[edge][along], b0, b1, min_mm)
+        walls.append(_orient(vertices, np.array(tris, dtype=np.int64), direction))
+
+    bottom = _orient(vertices, np.array([(c00, c11, c10), (c00, c01, c11)]), (0, 0, -1))
+    faces = np.concatenate(top + [bottom] + walls).astype(np.int32)
+    return IndexedMesh(vertices=vertices, faces=faces)
+
+
+def _write_formatted(f: BinaryIO, template: str, rows: np.ndarray) -> None:
+    """Format ``rows`` with ``template`` (one ``%`` field per column) in bulk."""
+    for start in range(0, len(rows), TEXT_CHUNK):
+        block = rows[start : start + TEXT_CHUNK]
+        f.write(((template * len(block)) % tuple(block.ravel().tolist())).encode("ascii"))
+
+
+def write_ply(path: str | Path, mesh: IndexedMesh) -> None:
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        "comment 2d-to-3d-relief\n"
+        f"element vertex {len(mesh.vertices)}\n"
+        "property float x\nproperty float y\nproperty float z\n"
+        f"element face {len(mesh.faces)}\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    )
+    records = np.empty(len(mesh.faces), dtype=[("count", "u1"), ("indices", "<i4", (3,))])
+    records["count"] = 3
+    records["indices"] = mesh.faces
+    with Path(path).open("wb") as f:
+        f.write(header.encode("ascii"))
+        f.write(np.ascontiguousarray(mesh.vertices, dtype="<f4").data)
+        f.write(records.data)
+
+
+def write_obj(path: str | Path, mesh: IndexedMesh) -> None:
+    with Path(path).open("wb") as f:
+        f.write(b"# 2d-to-3d-relief\n")
+        _write_formatted(f, "v %.6g %.6g %.6g\n", mesh.vertices)
+        _write_formatted(f, "f %d %d %d\n", mesh.faces + 1)
+
+
+_3MF_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" '
+    'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="model" '
+    'ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+    "</Types>\n"
+)
+_3MF_RELS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+    'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+    "</Relationships>\n"
+)
+
+
+def write_3mf(path: str | Path, mesh: IndexedMesh) -> None:
+    # Deflate level 1: most of the size win at a fraction of the default level's cost.
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        zf.writestr("[Content_Types].xml", _3MF_CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _3MF_RELS)
+        with zf.open("3D/3dmodel.model", "w", force_zip64=True) as f:
+            f.write(
+                b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                b'<model unit="millimeter" xml:lang="en-US" '
+                b'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+                b'<resources><object id="1" type="model"><mesh><vertices>\n'
+            )
+            _write_formatted(f, '<vertex x="%.6g" y="%.6g" z="%.6g"/>\n', mesh.vertices)
+            f.write(b"</vertices><triangles>\n")
+            _write_formatted(f, '<triangle v1="%d" v2="%d" v3="%d"/>\n', mesh.faces)
+            f.write(
+                b"</triangles></mesh></object></resources>\n"
+                b'<build><item objectid="1"/></build>\n'
+                b"</model>\n"
+            )
+
+
+def write_mesh(path: str | Path, mesh: IndexedMesh, fmt: str = "stl") -> None:
+    """Write ``mesh`` as one of `MESH_FORMATS`."""
+    if fmt == "stl":
+        write_binary_stl(path, mesh.triangles())
+    elif fmt == "ply":
+        write_ply(path, mesh)
+    elif fmt == "obj":
+        write_obj(path, mesh)
+    elif fmt == "3mf":
+        write_3mf(path, mesh)
+    else:
+        raise ValueError(f"Unknown mesh format: {fmt}")
+
+
+def build_relief(
+    thickness: np.ndarray,
+    width_mm: float,
+    height_mm: float,
+    min_mm: float,
+    fmt: str = "stl",
+    tolerance_mm: float | None = None,
+) -> np.ndarray | IndexedMesh:
+    """The in-memory relief solid: adaptive with ``tolerance_mm``, else uniform.
+
+    Uniform STL gets a bare triangle array, the cheapest layout to write; other formats
+    get an `IndexedMesh`.
+    """
+    with span("build_mesh", format=fmt, tolerance_mm=tolerance_mm, thickness=thickness) as s:
+        if tolerance_mm is not None:
+            mesh = build_adaptive_relief_mesh(thickness, width_mm, height_mm, min_mm, tolerance_mm)
+        elif fmt == "stl":
+            mesh = build_relief_mesh(thickness, width_mm, height_mm, min_mm)
+        else:
+            mesh = build_indexed_relief_mesh(thickness, width_mm, height_mm, min_mm)
+        if isinstance(mesh, IndexedMesh):
+            s.note(vertices=mesh.vertices, faces=mesh.faces)
+        else:
+            s.note(triangles=mesh)
+    return mesh
+
+
+def write_relief_mesh(path: str | Path, mesh: np.ndarray | IndexedMesh, fmt: str = "stl") -> None:
+    """Write a `build_relief` result as ``fmt``."""
+    with span("write_mesh", format=fmt, path=str(path)):
+        if isinstance(mesh, IndexedMesh):
+            write_mesh(path, mesh, fmt)
+        else:
+            write_binary_stl(path, mesh)
+
+
+def export_relief(
+    path: str | Path,
+    thickness: np.ndarray,
+    width_mm: float,
+    height_mm: float,
+    min_mm: float,
+    fmt: str = "stl",
+    stream: bool = False,
+    strip_rows: int = STRIP_ROWS,
+    tolerance_mm: float | None = None,
+    workers: int = 1,
+) -> None:
+    """Build and write the relief solid, picking the cheapest path for ``fmt``.
+
+    A ``tolerance_mm`` switches to the adaptive quadtree mesh; ``stream`` and ``workers > 1``
+    write a uniform STL in row strips.
+    """
+    if stream or workers > 1:
+        if fmt != "stl" or tolerance_mm is not None:
+            raise ValueError("Streaming and parallel export only support uniform STL output")
+        # Strips are built and written together, so one span covers both.
+        with span("write_stl_strips", workers=workers, thickness=thickness):
+            if workers > 1:
+                write_relief_stl_parallel(
+                    path, thickness, width_mm, height_mm, min_mm, workers, strip_rows
+                )
+            else:
+                write_relief_stl(path, thickness, width_mm, height_mm, min_mm, strip_rows)
+    else:
+        mesh = build_relief(thickness, width_mm, height_mm, min_mm, fmt, tolerance_mm)
+        write_relief_mesh(path, mesh, fmt)
@@ -15,10 +15,18 @@ class ReliefSettings(BaseModel):
     invert: bool = False
     blur: float = 0.0
     dither: bool = False
+    dither_mode: Literal["bayer", "blue-noise", "diffusion"] = "bayer"
+    layer_height: float = Field(0.2, gt=0)
     mesh_res: int = 256
     mesh_x: int | None = None
     mesh_y: int | None = None
-    smooth: int = 0
+    smooth: int = Field(0, ge=0)
+    smooth_mode: Literal["box", "gaussian", "guided"] = "gaussian"
+    mesh_format: Literal["stl", "ply", "obj", "3mf"] = "stl"
+    stream: bool = False
+    strip_rows: int = Field(64, gt=0)
+    tolerance_mm: float | None = Field(None, ge=0)
+    workers: int = Field(1, ge=1)
 
 
 class FilamentProfile(BaseModel):
@@ -29,7 +37,7 @@ class FilamentProfile(BaseModel):
 
 
 class PlanSettings(BaseModel):
-    strategy: Literal["bands", "quantize", "tdblend"] = "bands"
+    strategy: Literal["bands", "quantize", "tdblend", "optimize"] = "bands"
     layer_height: float = 0.2
     swap_count: int = 6
     min_mm: float = 0.8
@@ -40,6 +48,8 @@ class PlanSettings(BaseModel):
     gcode_style: Literal["m600", "m0", "m25", "none"] = "none"
     seed: int = 42
     preview_scale: float = 0.5
+    time_budget: float = Field(5.0, gt=0)
+    workers: int = Field(1, ge=1)
 
 
 class SwapStep(BaseModel):
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from twod_to_threed_relief.core.models import FilamentProfile
+from twod_to_threed_relief.core.palette import _palette_array, srgb_to_lab
+from twod_to_threed_relief.core.tdblend import filament_optics, layer_count, to_linear, to_srgb
+
+OPTIMIZE_PIXELS = 1 << 18
+BEAM_WIDTH = 64
+
+
+@dataclass
+class LayerStats:
+    """Source colours (CIELAB) grouped by printed layer count ``k``.
+
+    The squared error of showing one colour ``c`` to every pixel with ``k`` layers is
+    ``counts[k]·|c|² - 2·c·sums[k] + sumsq[k]``, so scoring a plan costs one term per
+    layer, independent of the number of pixels.
+    """
+
+    counts: np.ndarray
+    sums: np.ndarray
+    sumsq: np.ndarray
+
+    def error(self, k: int, lab: np.ndarray) -> np.ndarray:
+        return (
+            self.counts[k] * np.einsum("...i,...i->...", lab, lab)
+            - 2 * lab @ self.sums[k]
+            + self.sumsq[k]
+        )
+
+
+def layer_stats(
+    thickness: np.ndarray, source: np.ndarray, layer_height: float, n_layers: int
+) -> LayerStats:
+    """Bin the (H, W, 3) sRGB ``source`` by the layer count of each thickness pixel."""
+    k = np.clip(np.rint(thickness.reshape(-1) / layer_height), 0, n_layers).astype(np.intp)
+    lab = srgb_to_lab(source.reshape(-1, 3)).astype(np.float64)
+    n = n_layers + 1
+    counts = np.bincount(k, minlength=n).astype(np.float64)
+    sums = np.stack([np.bincount(k, weights=lab[:, c], minlength=n) for c in range(3)], axis=1)
+    sumsq = np.bincount(k, weights=np.einsum("ij,ij->i", lab, lab), minlength=n)
+    return LayerStats(counts, sums, sumsq)
+
+
+@dataclass
+class SwapSearch:
+    """Scores per-layer filament sequences, memoizing every evaluated prefix.
+
+    A sequence assigns a filament index to each printed layer, bottom first. The colour
+    after ``k`` layers, and the error of all pixels with at most ``k`` layers, depend only
+    on the first ``k`` entries, so sequences sharing a prefix share its work.
+    """
+
+    stats: LayerStats
+    rgb: np.ndarray
+    trans: np.ndarray
+    backing: np.ndarray
+    first_layer: int
+    max_swaps: int
+
+    def __post_init__(self) -> None:
+        err = float(self.stats.error(0, _lab(self.backing)))
+        self.memo: dict[tuple[int, ...], tuple[np.ndarray, float]] = {(): (self.backing, err)}
+
+    def evaluate(self, seq: tuple[int, ...]) -> float:
+        i = len(seq)
+        while seq[:i] not in self.memo:
+            i -= 1
+        color, err = self.memo[seq[:i]]
+        for j in range(i, len(seq)):
+            f = seq[j]
+            color = color * self.trans[f] + self.rgb[f] * (1 - self.trans[f])
+            err += float(self.stats.error(j + 1, _lab(color)))
+            self.memo[seq[: j + 1]] = (color, err)
+        return err
+
+    def beam(self, base: int, n_layers: int) -> tuple[float, tuple[int, ...]]:
+        """Best sequence starting with ``base``, by beam search over one layer at a time."""
+        f_count = len(self.rgb)
+        start = (base,) * max(self.first_layer, 1)
+        err0 = self.evaluate(start)
+        seqs, swaps = [start], np.zeros(1, dtype=np.intp)
+        colors, errs = self.memo[start][0][None], np.array([err0])
+        for j in range(len(start), n_layers):
+            new = colors[:, None] * self.trans[:, None] + self.rgb * (1 - self.trans[:, None])
+            cand = errs[:, None] + self.stats.error(j + 1, _lab(new))
+            last = np.array([s[-1] for s in seqs])
+            is_swap = np.arange(f_count)[None, :] != last[:, None]
+            cand[is_swap & (swaps[:, None] >= self.max_swaps)] = np.inf
+            flat = np.argsort(cand, axis=None, kind="stable")[:BEAM_WIDTH]
+            flat = flat[np.isfinite(cand.reshape(-1)[flat])]
+            b, f = np.divmod(flat, f_count)
+            seqs = [seqs[i] + (int(fi),) for i, fi in zip(b, f, strict=True)]
+            swaps = swaps[b] + is_swap[b, f]
+            colors, errs = new[b, f], cand[b, f]
+        return float(errs[0]), seqs[0]
+
+    def refine(self, seq: tuple[int, ...], deadline: float) -> tuple[float, tuple[int, ...]]:
+        """Hill-climb over single-swap moves until no move helps or ``deadline`` passes."""
+        best = self.evaluate(seq)
+        improved = True
+        while improved and time.monotonic() < deadline:
+            improved = False
+            for cand in self._moves(seq):
+                err = self.evaluate(cand)
+                if err < best - 1e-9:
+                    best, seq, improved = err, cand, True
+                    break
+                if time.monotonic() >= deadline:
+                    break
+        return best, seq
+
+    def _moves(self, seq: tuple[int, ...]) -> Iterator[tuple[int, ...]]:
+        """Shift one swap by a layer, recolour one run, or split a run with a new swap."""
+        runs = _runs(seq)
+        for i, (j0, j1, f) in enumerate(runs):
+            if i > 0:
+                if j0 - 1 >= self.first_layer and j0 - 1 > runs[i - 1][0]:
+                    yield seq[: j0 - 1] + (f,) + seq[j0:]
+                if j0 + 1 < j1:
+                    yield seq[:j0] + (runs[i - 1][2],) + seq[j0 + 1 :]
+            for g in range(len(self.rgb)):
+                if g == f:
+                    continue
+                yield seq[:j0] + (g,) * (j1 - j0) + seq[j1:]
+                if len(runs) <= self.max_swaps:
+                    # Swaps may start at first_layer, as in `beam`; j0 itself is a recolour.
+                    for j in range(max(j0 + 1, self.first_layer), j1):
+                        yield seq[:j] + (g,) * (j1 - j) + seq[j1:]
+
+
+def _runs(seq: tuple[int, ...]) -> list[tuple[int, int, int]]:
+    """(start, stop, filament) for each run of equal filaments."""
+    runs = []
+    start = 0
+    for j in range(1, len(seq) + 1):
+        if j == len(seq) or seq[j] != seq[start]:
+            runs.append((start, j, seq[start]))
+            start = j
+    return runs
+
+
+def _lab(linear: np.ndarray) -> np.ndarray:
+    return srgb_to_lab(to_srgb(linear)).astype(np.float64)
+
+
+def _search_from(
+    search: SwapSearch, base: int, n_layers: int, deadline: float
+) -> tuple[float, tuple[int, ...]]:
+    return search.refine(search.beam(base, n_layers)[1], deadline)
+
+
+@dataclass
+class SwapSolution:
+    """Filament per printed layer and the RMS CIELAB error of its predicted colours."""
+
+    layers: tuple[int, ...]
+    rms_error: float
+
+    @property
+    def swaps(self) -> list[tuple[int, int]]:
+        """(layer, filament index) for every filament change."""
+        return [(j0, f) for j0, _, f in _runs(self.layers)[1:]]
+
+
+def optimize_swaps(
+    thickness: np.ndarray,
+    source: np.ndarray,
+    filaments: list[FilamentProfile],
+    layer_height: float,
+    min_mm: float,
+    max_mm: float,
+    max_swaps: int,
+    time_budget: float = 5.0,
+    workers: int = 1,
+    backing: str = "#ffffff",
+) -> SwapSolution:
+    """Choose swap layers and filaments minimizing predicted-vs-source colour error.
+
+    Swaps fall on layer boundaries at or above ``min_mm``. Each possible first filament
+    is searched separately (in a process pool when ``workers > 1``): a beam search over
+    layers followed by local refinement until ``time_budget`` seconds have passed.
+    """
+    deadline = time.monotonic() + time_budget
+    n_layers = layer_count(max_mm, layer_height)
+    rgb, trans = filament_optics(filaments, layer_height)
+    search = SwapSearch(
+        layer_stats(thickness, source, layer_height, n_layers),
+        rgb,
+        trans,
+        to_linear(_palette_array([backing]))[0],
+        min(layer_count(min_mm, layer_height), n_layers),
+        max_swaps,
+    )
+    bases = range(len(filaments))
+    if workers > 1 and len(filaments) > 1:
+        with ProcessPoolExecutor(min(workers, len(filaments))) as pool:
+            futures = [pool.submit(_search_from, search, b, n_layers, deadline) for b in bases]
+            results = [f.result() for f in futures]
+    else:
+        results = [_search_from(search, b, n_layers, deadline) for b in bases]
+    err, layers = min(results)
+    pixels = max(float(search.stats.counts.sum()), 1.0)
+    return SwapSolution(layers, float(np.sqrt(max(err, 0.0) / pixels)))
+
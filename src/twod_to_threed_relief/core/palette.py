@@ -1,11 +1,24 @@
 from __future__ import annotations
 
 import json
+from dataclasses import dataclass
 from pathlib import Path
 
 import numpy as np
 from PIL import Image
 
+from twod_to_threed_relief.core.kmeans import kmeans
+from twod_to_threed_relief.core.profiling import span
+
+HIST_BITS = 5
+HIST_CHUNK = 1 << 20
+LUT_BITS = 6
+LUT_CHUNK = 1 << 15
+SRGB_TO_XYZ = np.array(
+    [[0.4124, 0.3576, 0.1805], [0.2126, 0.7152, 0.0722], [0.0193, 0.1192, 0.9505]], np.float32
+)
+D65_WHITE = np.array([0.95047, 1.0, 1.08883], np.float32)
+
 
 def parse_palette_string(value: str) -> list[str]:
     parts = [p.strip() for p in value.split(",") if p.strip()]
@@ -21,22 +34,165 @@ def load_palette(path_or_csv: str) -> list[str]:
     return parse_palette_string(path_or_csv)
 
 
-def auto_palette(image: Image.Image, colors: int, method: str, seed: int = 42) -> list[str]:
-    if method == "median-cut":
-        q = image.convert("RGB").quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
-        p = q.getpalette()[: colors * 3]
-        return [f"#{p[i]:02x}{p[i+1]:02x}{p[i+2]:02x}" for i in range(0, len(p), 3)]
-
-    rng = np.random.default_rng(seed)
-    arr = np.asarray(image.convert("RGB").resize((256, 256)), dtype=np.float32).reshape(-1, 3)
-    idx = rng.choice(arr.shape[0], size=colors, replace=False)
-    centers = arr[idx]
-    for _ in range(10):
-        dist = ((arr[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
-        labels = dist.argmin(axis=1)
-        for k in range(colors):
-            pts = arr[labels == k]
-            if len(pts):
-                centers[k] = pts.mean(axis=0)
-    centers = np.clip(centers, 0, 255).astype(np.uint8)
-    return [f"#{c[0]:02x}{c[1]:02x}{c[2]:02x}" for c in centers]
+@dataclass
+class ColorHistogram:
+    """Occupied RGB bins of an image: mean colour and pixel count per bin."""
+
+    colors: np.ndarray
+    counts: np.ndarray
+    bits: int = HIST_BITS
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def top(self, n: int) -> list[tuple[str, float]]:
+        order = np.argsort(-self.counts, kind="stable")[:n]
+        return [(to_hex(self.colors[i]), float(self.counts[i] / self.total)) for i in order]
+
+
+def to_hex(color: np.ndarray) -> str:
+    c = np.clip(np.rint(color), 0, 255).astype(np.uint8)
+    return f"#{c[0]:02x}{c[1]:02x}{c[2]:02x}"
+
+
+def color_histogram(image: Image.Image, bits: int = HIST_BITS) -> ColorHistogram:
+    """Bin every pixel into ``2**bits`` levels per channel in one pass over the image."""
+    with span("color_histogram", image=image):
+        arr = np.asarray(image.convert("RGB"), dtype=np.uint8).reshape(-1, 3)
+        shift = 8 - bits
+        n_bins = 1 << (3 * bits)
+        counts = np.zeros(n_bins, dtype=np.int64)
+        sums = np.zeros((3, n_bins), dtype=np.float64)
+        for s in range(0, len(arr), HIST_CHUNK):
+            px = arr[s : s + HIST_CHUNK]
+            q = (px >> shift).astype(np.int32)
+            code = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+            counts += np.bincount(code, minlength=n_bins)
+            for c in range(3):
+                sums[c] += np.bincount(code, weights=px[:, c], minlength=n_bins)
+        occupied = np.flatnonzero(counts)
+    colors = (sums[:, occupied] / counts[occupied]).T.astype(np.float32)
+    return ColorHistogram(colors, counts[occupied], bits)
+
+
+def median_cut(hist: ColorHistogram, colors: int) -> np.ndarray:
+    """Weighted median cut over histogram bins; returns up to ``colors`` mean colours."""
+    boxes = [np.arange(len(hist.colors))]
+    while len(boxes) < colors:
+        spans = [np.ptp(hist.colors[b], axis=0) if len(b) > 1 else np.zeros(3) for b in boxes]
+        i = int(np.argmax([sp.max() for sp in spans]))
+        if spans[i].max() <= 0:
+            break
+        box = boxes.pop(i)
+        channel = hist.colors[box, int(np.argmax(spans[i]))]
+        order = box[np.argsort(channel, kind="stable")]
+        cum = np.cumsum(hist.counts[order])
+        cut = int(np.searchsorted(cum, cum[-1] / 2))
+        cut = min(max(cut, 1), len(order) - 1)
+        boxes += [order[:cut], order[cut:]]
+    return np.array(
+        [np.average(hist.colors[b], axis=0, weights=hist.counts[b]) for b in boxes],
+        dtype=np.float32,
+    )
+
+
+def auto_palette(
+    image: Image.Image,
+    colors: int,
+    method: str,
+    seed: int = 42,
+    hist: ColorHistogram | None = None,
+) -> list[str]:
+    hist = hist or color_histogram(image)
+    with span("cluster_palette", method=method, colors=colors, bins=len(hist.colors)):
+        if method == "median-cut":
+            centers = median_cut(hist, colors)
+        else:
+            centers = kmeans(hist.colors, colors, weights=hist.counts, seed=seed).centers
+    return [to_hex(c) for c in centers]
+
+
+def srgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """CIELAB (D65) for 0-255 sRGB values, any leading shape."""
+    c = np.asarray(rgb, dtype=np.float32) / 255.0
+    c = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = c @ SRGB_TO_XYZ.T / D65_WHITE
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    fx, fy, fz = f[..., 0], f[..., 1], f[..., 2]
+    return np.stack([116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)], axis=-1)
+
+
+def _palette_array(palette: list[str] | np.ndarray) -> np.ndarray:
+    if isinstance(palette, np.ndarray):
+        return np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+    rows = [[int(h.lstrip("#")[i : i + 2], 16) for i in (0, 2, 4)] for h in palette]
+    return np.array(rows, dtype=np.uint8).reshape(-1, 3)
+
+
+@dataclass
+class PaletteLUT:
+    """Nearest-palette index for every ``2**bits``-per-channel RGB cell."""
+
+    palette: np.ndarray
+    table: np.ndarray
+    bits: int
+
+
+def build_palette_lut(
+    palette: list[str] | np.ndarray, bits: int = LUT_BITS, metric: str = "rgb"
+) -> PaletteLUT:
+    """Precompute nearest-palette indices at cell centres, by RGB or CIELAB ("lab") distance."""
+    pal = _palette_array(palette)
+    if not len(pal):
+        raise ValueError("palette is empty")
+    n = 1 << bits
+    levels = (np.arange(n, dtype=np.float32) + 0.5) * (256 / n)
+    cells = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 3)
+    if metric == "lab":
+        cells, ref = srgb_to_lab(cells), srgb_to_lab(pal)
+    elif metric == "rgb":
+        ref = pal.astype(np.float32)
+    else:
+        raise ValueError(f"unknown metric: {metric}")
+    dtype = np.uint8 if len(pal) <= 256 else np.uint16
+    table = np.empty(len(cells), dtype=dtype)
+    rr = np.einsum("ij,ij->i", ref, ref)
+    for s in range(0, len(cells), LUT_CHUNK):
+        x = cells[s : s + LUT_CHUNK]
+        # ‖x‖² is constant per row, so it does not change the argmin.
+        table[s : s + LUT_CHUNK] = (rr[None, :] - 2.0 * (x @ ref.T)).argmin(axis=1)
+    return PaletteLUT(pal, table.reshape(n, n, n), bits)
+
+
+def quantize_image(
+    image: Image.Image | np.ndarray, lut: PaletteLUT
+) -> tuple[np.ndarray, np.ndarray]:
+    """Map every pixel through ``lut``; returns an (H, W) index map and (H, W, 3) RGB image.
+
+    The RGB result is gathered as packed 32-bit pixels and returned as a strided view of
+    their first three bytes, which is about twice as fast as a fancy-indexed copy.
+    """
+    arr = np.asarray(image.convert("RGB") if isinstance(image, Image.Image) else image, np.uint8)
+    h, w = arr.shape[:2]
+    flat = arr.reshape(-1, 3)
+    table = lut.table.reshape(-1)
+    packed = np.zeros((len(lut.palette), 4), dtype=np.uint8)
+    packed[:, :3] = lut.palette
+    packed = packed.view(np.uint32)[:, 0]
+    shift = 8 - lut.bits
+    idx = np.empty(len(flat), dtype=lut.table.dtype)
+    rgbx = np.empty(len(flat), dtype=np.uint32)
+    code = np.empty(min(len(flat), HIST_CHUNK), dtype=np.int32)
+    for s in range(0, len(flat), HIST_CHUNK):
+        px = flat[s : s + HIST_CHUNK]
+        c = code[: len(px)]
+        np.right_shift(px[:, 0], shift, out=c, casting="unsafe")
+        c <<= lut.bits
+        c |= px[:, 1] >> shift
+        c <<= lut.bits
+        c |= px[:, 2] >> shift
+        i = idx[s : s + len(px)]
+        np.take(table, c, out=i)
+        np.take(packed, i, out=rgbx[s : s + len(px)])
+    return idx.reshape(h, w), rgbx.view(np.uint8).reshape(h, w, 4)[..., :3]
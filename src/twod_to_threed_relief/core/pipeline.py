@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import tempfile
+from collections.abc import Iterator
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.cache import ArtifactCache
+from twod_to_threed_relief.core.dither import dither_heights
+from twod_to_threed_relief.core.imageproc import (
+    build_heightmap,
+    image_size,
+    load_image,
+    map_height_range,
+    stream_heightmap,
+)
+from twod_to_threed_relief.core.io import write_swap_plan, write_text
+from twod_to_threed_relief.core.mesh import (
+    IndexedMesh,
+    build_relief,
+    export_relief,
+    write_relief_mesh,
+)
+from twod_to_threed_relief.core.models import (
+    FilamentProfile,
+    PlanSettings,
+    ReliefSettings,
+    SwapPlan,
+)
+from twod_to_threed_relief.core.palette import (
+    ColorHistogram,
+    auto_palette,
+    build_palette_lut,
+    color_histogram,
+    quantize_image,
+)
+from twod_to_threed_relief.core.plan import (
+    build_swap_plan,
+    export_snippet,
+    plan_to_text,
+)
+from twod_to_threed_relief.core.preview import (
+    ImagePyramid,
+    PreviewFrame,
+    preview_frames,
+    preview_size,
+    preview_thickness,
+    render_preview,
+)
+from twod_to_threed_relief.core.profiling import span
+from twod_to_threed_relief.core.tdblend import composite, plan_layer_lut
+
+
+def mesh_dims(img_size: tuple[int, int], settings: ReliefSettings) -> tuple[int, int, float]:
+    mx = settings.mesh_x or settings.mesh_res
+    my = settings.mesh_y or settings.mesh_res
+    ratio = img_size[1] / img_size[0]
+    h_mm = settings.height_mm or settings.width_mm * ratio
+    return mx, my, h_mm
+
+
+class PipelineContext:
+    """Shared state for one input image across the relief and plan stages.
+
+    The image is decoded at most once and every derived artifact (heightmap, thickness,
+    palettes) is computed at most once, then handed to the stages that need it. An
+    `ArtifactCache` lets results survive across runs as well.
+    """
+
+    def __init__(
+        self,
+        input_path: str | Path,
+        relief: ReliefSettings | None = None,
+        plan: PlanSettings | None = None,
+        cache: ArtifactCache | None = None,
+        image: Image.Image | None = None,
+    ) -> None:
+        self.input_path = Path(input_path)
+        self.relief = relief or ReliefSettings()
+        self.plan = plan or PlanSettings()
+        self.cache = cache or ArtifactCache(enabled=False)
+        self._palettes: dict[int, list[str]] = {}
+        if image is not None:
+            # Already decoded (possibly reduced) by the caller; used in place of the file.
+            self.__dict__["image"] = image
+
+    @cached_property
+    def source(self) -> str:
+        return self.cache.digest(self.input_path)
+
+    @cached_property
+    def image(self) -> Image.Image:
+        return load_image(str(self.input_path))
+
+    @cached_property
+    def size(self) -> tuple[int, int]:
+        if "image" in self.__dict__:
+            return self.image.size
+        return image_size(str(self.input_path))
+
+    @cached_property
+    def mesh_dims(self) -> tuple[int, int, float]:
+        return mesh_dims(self.size, self.relief)
+
+    @cached_property
+    def heightmap_decode(self) -> str:
+        """Decode path of the heightmap: "stream", "full" or "hinted"; fixed on first use.
+
+        "stream" is `stream_heightmap`, "full" an image already decoded here (by the plan
+        stage, batch or the GUI) and "hinted" a decode near the grid size. Their results
+        can differ slightly (JPEG draft decoding, strip rounding), so cached heightmaps
+        and meshes are keyed by it.
+        """
+        if self.relief.stream:
+            return "stream"
+        return "full" if "image" in self.__dict__ else "hinted"
+
+    @cached_property
+    def heightmap_key(self) -> str:
+        mx, my, _ = self.mesh_dims
+        r = self.relief
+        params = r.model_dump(include={"gamma", "invert", "blur", "smooth", "smooth_mode"})
+        params.update(mesh_x=mx, mesh_y=my, decode=self.heightmap_decode)
+        return self.cache.key("heightmap", self.source, params)
+
+    @property
+    def _heightmap_image(self) -> Image.Image:
+        # A relief-only run never needs full resolution, so decode near the grid size.
+        if self.heightmap_decode == "full":
+            return self.image
+        mx, my, _ = self.mesh_dims
+        return load_image(str(self.input_path), size_hint=(mx, my))
+
+    @cached_property
+    def _scratch(self) -> Path:
+        self._scratch_dir = tempfile.TemporaryDirectory(prefix="relief-")
+        return Path(self._scratch_dir.name)
+
+    @cached_property
+    def heightmap(self) -> np.ndarray:
+        with span("heightmap", stream=self.relief.stream) as s:
+            hm = self._load_heightmap()
+            s.note(heightmap=hm)
+        return hm
+
+    def _load_heightmap(self) -> np.ndarray:
+        mx, my, _ = self.mesh_dims
+        r = self.relief
+        if r.stream:
+            # Large reliefs: keep the heightmap and thickness on disk as memmaps.
+            return self.cache.cached_memmap(
+                "heightmap",
+                self.heightmap_key,
+                lambda out: stream_heightmap(
+                    self.input_path,
+                    out,
+                    r.gamma,
+                    r.invert,
+                    r.blur,
+                    mx,
+                    my,
+                    smooth=r.smooth,
+                    smooth_mode=r.smooth_mode,
+                ),
+                self._scratch / "heightmap.npy",
+            )
+        return self.cache.cached_array(
+            "heightmap",
+            self.heightmap_key,
+            lambda: build_heightmap(
+                self._heightmap_image,
+                r.gamma,
+                r.invert,
+                r.blur,
+                mx,
+                my,
+                self.size[0],
+                smooth=r.smooth,
+                smooth_mode=r.smooth_mode,
+            ),
+        )
+
+    @cached_property
+    def thickness(self) -> np.ndarray:
+        with span("thickness", dither=self.relief.dither) as s:
+            thickness = self._map_thickness()
+            s.note(thickness=thickness)
+        return thickness
+
+    def _map_thickness(self) -> np.ndarray:
+        r = self.relief
+        out = None
+        if r.stream:
+            out = np.lib.format.open_memmap(
+                self._scratch / "thickness.npy", "w+", np.float32, self.heightmap.shape
+            )
+        thickness = map_height_range(self.heightmap, r.min_mm, r.max_mm, out=out)
+        if r.dither:
+            limits = (r.min_mm, r.max_mm)
+            dither_heights(thickness, r.layer_height, r.dither_mode, thickness, limits)
+        return thickness
+
+    @cached_property
+    def histogram(self) -> ColorHistogram:
+        return color_histogram(self.image)
+
+    def auto_palette(self, colors: int | None = None) -> list[str]:
+        colors = colors or self.plan.colors
+        if colors not in self._palettes:
+            method, seed = self.plan.palette_method, self.plan.seed
+            params = {"colors": colors, "method": method, "seed": seed}
+            key = self.cache.key("palette", self.source, params)
+            self._palettes[colors] = self.cache.cached_json(
+                "palette",
+                key,
+                lambda: auto_palette(self.image, colors, method, seed, hist=self.histogram),
+            )
+        return self._palettes[colors]
+
+    @cached_property
+    def mesh_key(self) -> str:
+        r = self.relief
+        _, _, h_mm = self.mesh_dims
+        fields = {"width_mm", "min_mm", "max_mm", "mesh_format", "tolerance_mm", "dither"}
+        if r.dither:
+            fields |= {"dither_mode", "layer_height"}
+        params = r.model_dump(include=fields)
+        return self.cache.key("mesh", self.heightmap_key, {**params, "height_mm": h_mm})
+
+    def relief_mesh(self) -> np.ndarray | IndexedMesh | None:
+        """The relief solid in memory, or None when `write_relief` builds it in strips."""
+        r = self.relief
+        if r.stream or r.workers > 1:
+            return None
+        _, _, h_mm = self.mesh_dims
+        return build_relief(
+            self.thickness, r.width_mm, h_mm, r.min_mm, r.mesh_format, r.tolerance_mm
+        )
+
+    def write_relief(
+        self, output: str | Path, mesh: np.ndarray | IndexedMesh | None = None
+    ) -> None:
+        """Export the relief mesh to ``output``, reusing a cached file when possible.
+
+        ``mesh`` is an already built `relief_mesh`; without one it is built here.
+        """
+        r = self.relief
+        if self.cache.fetch_file("mesh", self.mesh_key, output):
+            return
+        if mesh is not None:
+            write_relief_mesh(output, mesh, r.mesh_format)
+        else:
+            _, _, h_mm = self.mesh_dims
+            export_relief(
+                output,
+                self.thickness,
+                r.width_mm,
+                h_mm,
+                r.min_mm,
+                fmt=r.mesh_format,
+                stream=r.stream,
+                strip_rows=r.strip_rows,
+                tolerance_mm=r.tolerance_mm,
+                workers=r.workers,
+            )
+        self.cache.store_file("mesh", self.mesh_key, output)
+
+    def swap_plan(
+        self,
+        palette: list[str] | None = None,
+        filaments: list[FilamentProfile] | None = None,
+    ) -> SwapPlan:
+        palette = palette or self.auto_palette()
+        with span("swap_plan", strategy=self.plan.strategy, colors=len(palette)):
+            return build_swap_plan(
+                self.image,
+                self.plan,
+                palette=palette,
+                filaments=filaments,
+                heightmap=self.heightmap,
+            )
+
+    def quantized_rgb(self, palette: list[str], metric: str = "rgb") -> np.ndarray:
+        """(H, W, 3) uint8 palette colours, as a strided view that is not copied to pack."""
+        image = self.image
+        with span("quantize", colors=len(palette), image=image):
+            return quantize_image(image, build_palette_lut(palette, metric=metric))[1]
+
+    def quantized(self, palette: list[str], metric: str = "rgb") -> Image.Image:
+        return Image.fromarray(np.ascontiguousarray(self.quantized_rgb(palette, metric)))
+
+    @cached_property
+    def pyramid(self) -> ImagePyramid:
+        return ImagePyramid(self.image)
+
+    @cached_property
+    def preview_thickness(self) -> np.ndarray:
+        size = preview_size(self.size, self.plan.preview_scale)
+        pyramid = self.pyramid
+        with span("preview_thickness", width=size[0], height=size[1]):
+            return preview_thickness(pyramid, size, self.relief, self.mesh_dims[0])
+
+    def preview(self, plan: SwapPlan) -> Image.Image:
+        """Predicted print colours (`composite`) at ``preview_scale`` of the input size."""
+        thickness = self.preview_thickness
+        with span("composite", thickness=thickness):
+            return render_preview(thickness, plan_layer_lut(plan, self.relief.max_mm))
+
+    def preview_rgb(self, plan: SwapPlan) -> np.ndarray:
+        """`preview` as the (H, W, 3) strided view `composite` returns."""
+        thickness = self.preview_thickness
+        with span("composite", thickness=thickness):
+            return composite(thickness, plan_layer_lut(plan, self.relief.max_mm))
+
+    def preview_frames(self, plan: SwapPlan) -> Iterator[PreviewFrame]:
+        """Progressive `preview`: coarse frames first, then the final image tile by tile."""
+        return preview_frames(
+            self.pyramid,
+            plan_layer_lut(plan, self.relief.max_mm),
+            self.relief,
+            preview_size(self.size, self.plan.preview_scale),
+            self.mesh_dims[0],
+            final_thickness=lambda: self.preview_thickness,
+        )
+
+    def write_plan(
+        self,
+        out_dir: str | Path,
+        palette: list[str] | None = None,
+        filaments: list[FilamentProfile] | None = None,
+    ) -> SwapPlan:
+        """Write swap_plan.json/.txt, preview.png and the optional G-code snippet."""
+        out = Path(out_dir)
+        plan = self.swap_plan(palette=palette, filaments=filaments)
+        self.write_plan_files(out, plan)
+        self.preview(plan).save(out / "preview.png")
+        return plan
+
+    def write_plan_files(self, out_dir: str | Path, plan: SwapPlan) -> list[Path]:
+        """Write swap_plan.json/.txt and the optional G-code snippet; return their paths."""
+        out = Path(out_dir)
+        paths = [out / "swap_plan.json", out / "swap_plan.txt"]
+        write_swap_plan(paths[0], plan)
+        write_text(paths[1], plan_to_text(plan))
+        if self.plan.gcode_style != "none":
+            paths.append(out / "swap_snippets.gcode")
+            export_snippet(paths[-1], plan)
+        return paths
@@ -7,6 +7,7 @@ from PIL import Image
 
 from twod_to_threed_relief.core.imageproc import build_heightmap
 from twod_to_threed_relief.core.models import FilamentProfile, PlanSettings, SwapPlan, SwapStep
+from twod_to_threed_relief.core.optimize import OPTIMIZE_PIXELS, optimize_swaps
 from twod_to_threed_relief.core.palette import auto_palette
 from twod_to_threed_relief.core.tdblend import estimate_blend_layers
 
@@ -20,6 +21,7 @@ def build_swap_plan(
     settings: PlanSettings,
     palette: list[str] | None = None,
     filaments: list[FilamentProfile] | None = None,
+    heightmap: np.ndarray | None = None,
 ) -> SwapPlan:
     if not palette:
         palette = auto_palette(image, settings.colors, settings.palette_method, settings.seed)
@@ -29,7 +31,7 @@ def build_swap_plan(
             for i, hex_c in enumerate(palette)
         ]
 
-    hm = build_heightmap(image, mesh_x=256, mesh_y=256)
+    hm = heightmap if heightmap is not None else build_heightmap(image, mesh_x=256, mesh_y=256)
     steps: list[SwapStep] = []
     if settings.strategy == "bands":
         levels = np.quantile(hm, np.linspace(0, 1, settings.swap_count + 2)[1:-1])
@@ -58,6 +60,8 @@ def build_swap_plan(
                     command=_cmd(settings.gcode_style),
                 )
             )
+    elif settings.strategy == "optimize":
+        filaments, steps, rms = _optimized_steps(image, hm, filaments, settings)
     else:
         td = [f.td_mm for f in filaments]
         blend = estimate_blend_layers(hm, td, settings.swap_count)
@@ -80,6 +84,8 @@ def build_swap_plan(
         "Use planned swap heights in slicer layer-change UI.",
         "TD blend is approximate and intended for planning only.",
     ]
+    if settings.strategy == "optimize":
+        notes.append(f"Predicted color error (RMS CIELAB dE): {rms:.1f}")
 
     return SwapPlan(
         strategy=settings.strategy,
@@ -92,6 +98,44 @@ def build_swap_plan(
     )
 
 
+def _optimized_steps(
+    image: Image.Image,
+    heightmap: np.ndarray,
+    filaments: list[FilamentProfile],
+    settings: PlanSettings,
+) -> tuple[list[FilamentProfile], list[SwapStep], float]:
+    """Run `optimize_swaps` on a sampled heightmap; filaments come back in print order."""
+    stride = max(1, int(np.ceil(np.sqrt(heightmap.size / OPTIMIZE_PIXELS))))
+    hm = np.asarray(heightmap[::stride, ::stride], dtype=np.float32)
+    size = (hm.shape[1], hm.shape[0])
+    source = np.asarray(image.convert("RGB").resize(size, Image.Resampling.BOX))
+    thickness = settings.min_mm + hm * (settings.max_mm - settings.min_mm)
+    solution = optimize_swaps(
+        thickness,
+        source,
+        filaments,
+        settings.layer_height,
+        settings.min_mm,
+        settings.max_mm,
+        settings.swap_count,
+        time_budget=settings.time_budget,
+        workers=settings.workers,
+    )
+    used = list(dict.fromkeys(solution.layers))
+    ordered = [filaments[i] for i in used + [i for i in range(len(filaments)) if i not in used]]
+    steps = [
+        SwapStep(
+            index=i,
+            height_mm=float(layer * settings.layer_height),
+            layer=layer,
+            filament=filaments[f].name,
+            command=_cmd(settings.gcode_style),
+        )
+        for i, (layer, f) in enumerate(solution.swaps, 1)
+    ]
+    return ordered, steps, solution.rms_error
+
+
 def preview_plan_image(image: Image.Image, plan: SwapPlan, scale: float = 0.5) -> Image.Image:
     img = image.convert("RGB")
     w, h = img.size
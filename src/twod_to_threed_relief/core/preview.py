@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.imageproc import build_heightmap, map_height_range
+from twod_to_threed_relief.core.models import ReliefSettings
+from twod_to_threed_relief.core.tdblend import LayerLUT, composite
+
+PREVIEW_COARSE_WIDTH = 256
+PREVIEW_TILES = 8
+TILE_SIZE = 256
+
+
+class ImagePyramid:
+    """Successive 2× box reductions of an image, each built once on first use.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, image: Image.Image) -> None:
+        self.levels = [image]
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.levels[0].size
+
+    def for_size(self, width: int, height: int) -> Image.Image:
+        """Smallest level that is still at least ``width`` × ``height``."""
+        with self._lock:
+            while True:
+                w, h = self.levels[-1].size
+                if w < 2 * width or h < 2 * height:
+                    break
+                self.levels.append(self.levels[-1].reduce(2))
+        for level in reversed(self.levels):
+            if level.size[0] >= width and level.size[1] >= height:
+                return level
+        return self.levels[0]
+
+
+@dataclass
+class PreviewFrame:
+    """One step of a progressive preview; ``progress`` is the share of final pixels done."""
+
+    image: Image.Image
+    progress: float
+    final: bool
+
+
+def preview_size(image_size: tuple[int, int], scale: float) -> tuple[int, int]:
+    return max(1, int(image_size[0] * scale)), max(1, int(image_size[1] * scale))
+
+
+def preview_thickness(
+    pyramid: ImagePyramid, size: tuple[int, int], relief: ReliefSettings, mesh_x: int
+) -> np.ndarray:
+    """Relief thickness in mm at ``size``, from the closest pyramid level.
+
+    ``blur`` stays in source pixels and ``smooth`` in mesh cells, so both are rescaled
+    to the preview size.
+    """
+    r = relief
+    hm = build_heightmap(
+        pyramid.for_size(*size),
+        r.gamma,
+        r.invert,
+        r.blur,
+        *size,
+        source_width=pyramid.size[0],
+        smooth=round(r.smooth * size[0] / mesh_x),
+        smooth_mode=r.smooth_mode,
+    )
+    return map_height_range(hm, r.min_mm, r.max_mm, out=hm)
+
+
+def render_preview(thickness: np.ndarray, lut: LayerLUT) -> Image.Image:
+    return Image.fromarray(np.ascontiguousarray(composite(thickness, lut)))
+
+
+def preview_frames(
+    pyramid: ImagePyramid,
+    lut: LayerLUT,
+    relief: ReliefSettings,
+    size: tuple[int, int],
+    mesh_x: int,
+    final_thickness: Callable[[], np.ndarray] | None = None,
+    tiles: int = PREVIEW_TILES,
+) -> Iterator[PreviewFrame]:
+    """Yield coarse previews at doubling widths, then the final one in ``tiles`` strips.
+
+    The first frame is rendered ``PREVIEW_COARSE_WIDTH`` wide from a small pyramid level,
+    so it is ready long before the full-size thickness map. Coarse frames stop at a
+    quarter of the final width, where they would cost about as much as the final image.
+    Final strips are composited over an upscaled copy of the last coarse frame; the last
+    frame equals `render_preview` at ``size``. ``final_thickness`` supplies (e.g. cached)
+    thickness at ``size``.
+    """
+    w, h = size
+    coarse = None
+    cw = PREVIEW_COARSE_WIDTH
+    while cw <= w // 4:
+        ch = max(1, round(cw * h / w))
+        coarse = render_preview(preview_thickness(pyramid, (cw, ch), relief, mesh_x), lut)
+        yield PreviewFrame(coarse, 0.0, False)
+        cw *= 2
+    if final_thickness is None:
+        thickness = preview_thickness(pyramid, size, relief, mesh_x)
+    else:
+        thickness = final_thickness()
+    if coarse is None:
+        canvas = np.zeros((h, w, 3), dtype=np.uint8)
+    else:
+        canvas = np.array(coarse.resize(size, Image.Resampling.BILINEAR))
+    tile_rows = -(-h // tiles)
+    for r0 in range(0, h, tile_rows):
+        r1 = min(h, r0 + tile_rows)
+        canvas[r0:r1] = composite(thickness[r0:r1], lut)
+        yield PreviewFrame(Image.fromarray(canvas), r1 / h, r1 == h)
+
+
+class TilePyramid:
+    """Viewport tiles of a large uint8 image at power-of-two reductions, built on demand.
+
+    Level 0 is the array itself; a tile of level ``L`` is the matching level-0 region
+    box-reduced by ``2**L``, so only the tiles a viewport touches are ever computed.
+    Reduced tiles are C-contiguous and kept in an LRU of ``max_tiles``.
+    """
+
+    def __init__(self, array: np.ndarray, tile: int = TILE_SIZE, max_tiles: int = 512) -> None:
+        self.array = array
+        self.tile = tile
+        self.max_tiles = max_tiles
+        self.shapes = [array.shape[:2]]
+        while max(self.shapes[-1]) > tile:
+            h, w = self.shapes[-1]
+            self.shapes.append(((h + 1) // 2, (w + 1) // 2))
+        self._tiles: OrderedDict[tuple[int, int, int], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def level_for_scale(self, scale: float) -> int:
+        """Finest level with at most one source pixel per screen pixel at ``scale``."""
+        level = int(np.floor(np.log2(1.0 / scale))) if scale < 1 else 0
+        return min(max(level, 0), len(self.shapes) - 1)
+
+    def get(self, level: int, ty: int, tx: int) -> np.ndarray:
+        """Tile ``(ty, tx)`` of ``level``; level 0 tiles are views into the array."""
+        t = self.tile
+        if level == 0:
+            return self.array[ty * t : (ty + 1) * t, tx * t : (tx + 1) * t]
+        key = (level, ty, tx)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+        span = t << level
+        region = self.array[ty * span : (ty + 1) * span, tx * span : (tx + 1) * span]
+        out = np.asarray(Image.fromarray(np.ascontiguousarray(region)).reduce(1 << level))
+        with self._lock:
+            self._tiles[key] = out
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return out
+
+    def visible(
+        self, view: tuple[float, float, float, float], scale: float
+    ) -> list[tuple[int, int, int, tuple[int, int, int, int]]]:
+        """Tiles covering ``view`` (x0, y0, x1, y1 in level-0 pixels) at ``scale``.
+
+        Returns ``(level, ty, tx, rect)`` where ``rect`` is the tile's extent in level-0
+        pixels, for drawing it in place.
+        """
+        level = self.level_for_scale(scale)
+        f = 1 << level
+        h, w = self.shapes[level]
+        t = self.tile
+        x0, y0, x1, y1 = (v / f for v in view)
+        tx0, ty0 = max(0, int(x0 // t)), max(0, int(y0 // t))
+        tx1, ty1 = min(-(-w // t), int(np.ceil(x1 / t))), min(-(-h // t), int(np.ceil(y1 / t)))
+        out = []
+        full_h, full_w = self.shapes[0]
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                rect = (
+                    tx * t * f,
+                    ty * t * f,
+                    min(full_w, (tx + 1) * t * f),
+                    min(full_h, (ty + 1) * t * f),
+                )
+                out.append((level, ty, tx, rect))
+        return out
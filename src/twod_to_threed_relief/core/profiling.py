@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+PROFILE_ENV = "RELIEF_PROFILE"
+
+# Per context, so a profile only sees its own thread: other threads (e.g. live previews
+# running alongside a profiled pipeline run) start in a context where it is unset.
+_active: ContextVar[Profiler | None] = ContextVar("relief_profiler", default=None)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+
+
+def _describe(value: Any) -> Any:
+    """JSON-able trace argument: arrays and images by size, other objects by type."""
+    if isinstance(value, np.ndarray):
+        return {"shape": list(value.shape), "dtype": str(value.dtype), "bytes": value.nbytes}
+    if isinstance(value, Image.Image):
+        return {"size": list(value.size), "mode": value.mode}
+    if isinstance(value, int | float | str | bool) or value is None:
+        return value
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, list | tuple):
+        return [_describe(v) for v in value]
+    return type(value).__name__
+
+
+class Span:
+    """One timed region of an active `Profiler`; see `span`."""
+
+    __slots__ = ("profiler", "name", "args", "peak", "_wall", "_cpu", "_mem")
+
+    def __init__(self, profiler: Profiler, name: str, args: dict[str, Any]) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.args = {k: _describe(v) for k, v in args.items()}
+        self.peak = 0
+
+    def note(self, **values: Any) -> None:
+        """Attach arguments, e.g. the arrays the region produced."""
+        for k, v in values.items():
+            self.args[k] = _describe(v)
+
+    def __enter__(self) -> Span:
+        self.profiler._enter(self)
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.profiler._exit(self)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def note(self, **values: Any) -> None:
+        pass
+
+    def __enter__(self) -> _NullSpan:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **args: Any) -> Span | _NullSpan:
+    """Context manager timing ``name`` under the active profiler.
+
+    Without one (the default) this returns a shared no-op, so instrumented code pays a
+    single context variable lookup. ``args`` and `Span.note` values go into the trace; arrays and
+    images are recorded by shape, dtype and size.
+    """
+    prof = _active.get()
+    if prof is None:
+        return _NULL_SPAN
+    return Span(prof, name, args)
+
+
+class Profiler:
+    """Records spans as Chrome trace events ("X" complete events, times in µs).
+
+    Each event carries wall time (its duration), process CPU time in ``cpu_ms`` and, with
+    ``trace_memory``, the peak tracemalloc growth over the span in ``peak_bytes``. Spans
+    nest per thread. tracemalloc is process-wide, so profiles overlapping on other threads
+    share their peaks, and Pillow's own image buffers are not traced.
+    """
+
+    def __init__(self, trace_memory: bool = True) -> None:
+        self.trace_memory = trace_memory
+        self.events: list[dict[str, Any]] = []
+        self._local = threading.local()
+        self._start = time.perf_counter_ns()
+        self._pid = os.getpid()
+
+    def _stack(self) -> list[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, s: Span) -> None:
+        stack = self._stack()
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # Resetting the peak for this span must not lose the enclosing span's.
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            s._mem = s.peak = current
+        stack.append(s)
+        s._cpu = time.process_time_ns()
+        s._wall = time.perf_counter_ns()
+
+    def _exit(self, s: Span) -> None:
+        wall = time.perf_counter_ns()
+        cpu = time.process_time_ns()
+        stack = self._stack()
+        stack.pop()
+        args = dict(s.args, cpu_ms=(cpu - s._cpu) / 1e6)
+        if self.trace_memory and tracemalloc.is_tracing():
+            peak = max(s.peak, tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            args["peak_bytes"] = peak - s._mem
+        self.events.append(
+            {
+                "name": s.name,
+                "cat": "relief",
+                "ph": "X",
+                "ts": (s._wall - self._start) / 1e3,
+                "dur": (wall - s._wall) / 1e3,
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+    def summary(self) -> list[dict[str, Any]]:
+        """Per-name totals, slowest first; times include nested spans."""
+        rows: dict[str, dict[str, Any]] = {}
+        for e in self.events:
+            row = rows.setdefault(
+                e["name"],
+                {"name": e["name"], "calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "peak_bytes": None},
+            )
+            row["calls"] += 1
+            row["wall_ms"] += e["dur"] / 1e3
+            row["cpu_ms"] += e["args"]["cpu_ms"]
+            if "peak_bytes" in e["args"]:
+                row["peak_bytes"] = max(row["peak_bytes"] or 0, e["args"]["peak_bytes"])
+        return sorted(rows.values(), key=lambda r: -r["wall_ms"])
+
+    def write_chrome_trace(self, path: str | Path) -> None:
+        """Trace-event JSON for chrome://tracing or Perfetto, with the summary alongside."""
+        trace = {
+            "traceEvents": sorted(self.events, key=lambda e: e["ts"]),
+            "displayTimeUnit": "ms",
+            "otherData": {"summary": self.summary()},
+        }
+        Path(path).write_text(json.dumps(trace), encoding="utf-8")
+
+
+def _start_tracing() -> None:
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_users += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        # Only the last overlapping profile stops tracing, and only if profiling started it.
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+@contextmanager
+def profile(path: str | Path | None, trace_memory: bool = True) -> Iterator[Profiler | None]:
+    """Profile the block and write its Chrome trace to ``path``; a no-op for None.
+
+    Only spans entered in the calling context are recorded, so profiles on different
+    threads may overlap. tracemalloc runs while any profile needs it; it slows
+    allocation-heavy Python code, so pass ``trace_memory=False`` for timings alone.
+    """
+    if path is None:
+        yield None
+        return
+    prof = Profiler(trace_memory)
+    if trace_memory:
+        _start_tracing()
+    token = _active.set(prof)
+    try:
+        yield prof
+    finally:
+        _active.reset(token)
+        if trace_memory:
+            _stop_tracing()
+        prof.write_chrome_trace(path)
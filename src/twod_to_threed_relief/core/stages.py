@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import tempfile
+import threading
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.cache import ArtifactCache
+from twod_to_threed_relief.core.models import FilamentProfile, PlanSettings, ReliefSettings
+from twod_to_threed_relief.core.pipeline import PipelineContext
+from twod_to_threed_relief.core.profiling import span
+
+HEIGHTMAP_FIELDS = frozenset(
+    {"gamma", "invert", "blur", "smooth", "smooth_mode", "mesh_res", "mesh_x", "mesh_y"}
+)
+PIPELINE_TARGETS = ("stl", "plan_files", "preview")
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One memoized pipeline step.
+
+    ``after`` names the stages whose results it uses and ``relief``/``plan`` the settings
+    fields it reads; ``extra`` returns any other input (paths, palettes). ``attrs`` are the
+    `PipelineContext` attributes the stage fills, handed to later contexts while it stays
+    valid. ``after`` stages are brought up to date before ``run``, except ``lazy`` ones,
+    which ``run`` pulls through `StageGraph.get` only if it needs them.
+    """
+
+    name: str
+    run: Callable[[StageGraph], Any]
+    after: tuple[str, ...] = ()
+    relief: frozenset[str] = frozenset()
+    plan: frozenset[str] = frozenset()
+    extra: Callable[[StageGraph], Any] | None = None
+    attrs: tuple[str, ...] = ()
+    lazy: tuple[str, ...] = ()
+
+
+@dataclass
+class _Entry:
+    key: str
+    value: Any
+    files: list[tuple[Path, int]] = field(default_factory=list)
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+    def valid(self, key: str) -> bool:
+        # Written files must still be the ones this stage wrote.
+        return key == self.key and all(
+            p.exists() and p.stat().st_mtime_ns == mtime for p, mtime in self.files
+        )
+
+
+def _decode(g: StageGraph) -> Image.Image:
+    return g.ctx.image
+
+
+def _heightmap(g: StageGraph) -> np.ndarray:
+    return g.ctx.heightmap
+
+
+def _thickness(g: StageGraph) -> np.ndarray:
+    return g.ctx.thickness
+
+
+def _mesh(g: StageGraph) -> Any:
+    return g.ctx.relief_mesh()
+
+
+def _stl(g: StageGraph) -> Path:
+    ctx = g.ctx
+    path = g.out_dir / f"relief.{ctx.relief.mesh_format}"
+    # A mesh file from the artifact cache needs no mesh built.
+    if not ctx.cache.fetch_file("mesh", ctx.mesh_key, path):
+        ctx.write_relief(path, mesh=g.get("mesh"))
+    g.wrote(path)
+    return path
+
+
+def _palette(g: StageGraph) -> list[str]:
+    return list(g.palette) if g.palette else g.ctx.auto_palette()
+
+
+def _plan(g: StageGraph) -> Any:
+    return g.ctx.swap_plan(palette=g.get("palette"), filaments=g.filaments)
+
+
+def _plan_files(g: StageGraph) -> Any:
+    # The plan ignores preview_scale and workers, but the written settings should not.
+    plan = g.get("plan").model_copy(update={"settings": g.ctx.plan.model_dump()})
+    for path in g.ctx.write_plan_files(g.out_dir, plan):
+        g.wrote(path)
+    return plan
+
+
+def _preview_thickness(g: StageGraph) -> np.ndarray:
+    return g.ctx.preview_thickness
+
+
+def _save_rgb(g: StageGraph, rgb: np.ndarray, name: str) -> np.ndarray:
+    path = g.out_dir / name
+    Image.fromarray(np.ascontiguousarray(rgb)).save(path)
+    g.wrote(path)
+    return rgb
+
+
+def _preview(g: StageGraph) -> np.ndarray:
+    return _save_rgb(g, g.ctx.preview_rgb(g.get("plan")), "preview.png")
+
+
+def _quantized(g: StageGraph) -> np.ndarray:
+    return _save_rgb(g, g.ctx.quantized_rgb(g.get("palette")), "quantized.png")
+
+
+def _source(g: StageGraph) -> list[Any]:
+    st = g.input_path.stat()
+    return [str(g.input_path), st.st_size, st.st_mtime_ns]
+
+
+def _dither(g: StageGraph) -> dict[str, Any] | None:
+    r = g.ctx.relief
+    return r.model_dump(include={"dither_mode", "layer_height"}) if r.dither else None
+
+
+def _out_dir(g: StageGraph) -> str:
+    return str(g.out_dir)
+
+
+STAGES = {
+    s.name: s
+    for s in [
+        Stage(
+            "decode",
+            _decode,
+            extra=_source,
+            attrs=("image", "size", "source", "histogram", "pyramid"),
+        ),
+        Stage("heightmap", _heightmap, ("decode",), HEIGHTMAP_FIELDS, attrs=("heightmap",)),
+        Stage(
+            "thickness",
+            _thickness,
+            ("heightmap",),
+            frozenset({"min_mm", "max_mm", "dither"}),
+            extra=_dither,
+            attrs=("thickness",),
+        ),
+        Stage(
+            "mesh",
+            _mesh,
+            ("thickness",),
+            frozenset(
+                {"width_mm", "height_mm", "mesh_format", "tolerance_mm", "stream", "workers"}
+            ),
+        ),
+        Stage("stl", _stl, ("thickness", "mesh"), extra=_out_dir, lazy=("mesh",)),
+        Stage(
+            "palette",
+            _palette,
+            ("decode",),
+            plan=frozenset({"colors", "palette_method", "seed"}),
+            extra=lambda g: g.palette,
+        ),
+        Stage(
+            "plan",
+            _plan,
+            ("decode", "heightmap", "palette"),
+            plan=frozenset(PlanSettings.model_fields) - {"preview_scale", "workers"},
+            extra=lambda g: [f.model_dump() for f in g.filaments or []],
+        ),
+        Stage(
+            "plan_files",
+            _plan_files,
+            ("plan",),
+            plan=frozenset(PlanSettings.model_fields),
+            extra=_out_dir,
+        ),
+        Stage(
+            "preview_thickness",
+            _preview_thickness,
+            ("decode",),
+            HEIGHTMAP_FIELDS | {"min_mm", "max_mm"},
+            frozenset({"preview_scale"}),
+            attrs=("preview_thickness",),
+        ),
+        Stage("preview", _preview, ("plan", "preview_thickness"), extra=_out_dir),
+        Stage("quantized", _quantized, ("decode", "palette"), extra=_out_dir),
+    ]
+}
+
+
+class StageGraph:
+    """Incremental pipeline for one input image: reruns only the stages that changed.
+
+    Each `run` builds a fresh `PipelineContext` for the given settings and pulls the
+    target stages through `STAGES`. A stage whose settings fields, extra inputs and
+    upstream stages are unchanged since its last run, and whose written files are
+    untouched, hands back its memoized result instead of running. ``report`` records
+    which stages the last run executed ("ran") and which it reused ("reused"); stages it
+    did not need are absent. Runs are serialized, so one graph may serve several threads.
+    """
+
+    def __init__(self, input_path: str | Path, cache: ArtifactCache | None = None) -> None:
+        self.input_path = Path(input_path)
+        self.cache = cache or ArtifactCache(enabled=False)
+        self.report: dict[str, str] = {}
+        self._memo: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._scratch = tempfile.TemporaryDirectory(prefix="relief-stages-")
+
+    def run(
+        self,
+        relief: ReliefSettings,
+        plan: PlanSettings,
+        out_dir: str | Path,
+        palette: list[str] | None = None,
+        filaments: list[FilamentProfile] | None = None,
+        targets: Iterable[str] = PIPELINE_TARGETS,
+        progress: Callable[[str], None] | None = None,
+    ) -> dict[str, Any]:
+        """Bring ``targets`` up to date for these settings and return their results.
+
+        ``progress`` is called with a stage's name before it runs; an exception raised
+        there abandons the run, keeping every stage that had finished.
+        """
+        with self._lock:
+            self.ctx = PipelineContext(self.input_path, relief=relief, plan=plan, cache=self.cache)
+            # Streamed heightmaps of older runs may still be mapped, so never reuse a path.
+            self.ctx.__dict__["_scratch"] = Path(tempfile.mkdtemp(dir=self._scratch.name))
+            self.out_dir = Path(out_dir)
+            self.palette = palette
+            self.filaments = filaments
+            self.progress = progress
+            self.report = {}
+            self._keys: dict[str, str] = {}
+            self._values: dict[str, Any] = {}
+            self._running: list[str] = []
+            self._written: dict[str, list[Path]] = {}
+            try:
+                return {name: self.get(name) for name in targets}
+            finally:
+                for name in self.report:
+                    if name in self._memo:
+                        entry = self._memo[name]
+                        entry.attrs = {
+                            a: self.ctx.__dict__[a]
+                            for a in STAGES[name].attrs
+                            if a in self.ctx.__dict__
+                        }
+
+    def key(self, name: str) -> str:
+        """Fingerprint of everything stage ``name`` depends on under the current run."""
+        if name not in self._keys:
+            stage = STAGES[name]
+            payload = {
+                "relief": self.ctx.relief.model_dump(mode="json", include=stage.relief),
+                "plan": self.ctx.plan.model_dump(mode="json", include=stage.plan),
+                "extra": stage.extra(self) if stage.extra else None,
+                "after": [self.key(a) for a in stage.after],
+            }
+            blob = json.dumps(payload, sort_keys=True, default=str).encode()
+            self._keys[name] = hashlib.sha256(blob).hexdigest()
+        return self._keys[name]
+
+    def get(self, name: str) -> Any:
+        """Result of stage ``name``, memoized or computed (with its inputs) as needed."""
+        if name in self._values:
+            return self._values[name]
+        key = self.key(name)
+        entry = self._memo.get(name)
+        if entry is not None and entry.valid(key):
+            with span(f"stage:{name}", status="reused"):
+                self.ctx.__dict__.update(entry.attrs)
+            self.report[name] = "reused"
+        else:
+            for dep in STAGES[name].after:
+                if dep not in STAGES[name].lazy:
+                    self.get(dep)
+            if self.progress:
+                self.progress(name)
+            self._running.append(name)
+            self._written[name] = []
+            try:
+                with span(f"stage:{name}", status="ran") as s:
+                    value = STAGES[name].run(self)
+                    s.note(result=value)
+            finally:
+                self._running.pop()
+            files = [(p, p.stat().st_mtime_ns) for p in self._written.pop(name)]
+            entry = self._memo[name] = _Entry(key, value, files)
+            self.report[name] = "ran"
+        self._values[name] = entry.value
+        return entry.value
+
+    def wrote(self, path: Path) -> None:
+        """Record an output file of the running stage; the stage reruns if it changes."""
+        self._written[self._running[-1]].append(Path(path))
@@ -1,7 +1,15 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+
 import numpy as np
 
+from twod_to_threed_relief.core.imageproc import SRGB_TO_LINEAR
+from twod_to_threed_relief.core.models import FilamentProfile, SwapPlan
+from twod_to_threed_relief.core.palette import _palette_array
+
+COMPOSITE_CHUNK = 1 << 18
+
 
 def transmittance(thickness: np.ndarray, td_mm: float) -> np.ndarray:
     return np.exp(-thickness / max(td_mm, 1e-6))
@@ -12,3 +20,105 @@ def estimate_blend_layers(heightmap: np.ndarray, td_values: list[float], max_lay
     td = np.mean(td_values) if td_values else 0.8
     layers = np.clip(np.round((1 - np.exp(-flat / td)) * max_layers), 0, max_layers)
     return layers.reshape(heightmap.shape).astype(int)
+
+
+@dataclass
+class LayerLUT:
+    """Predicted colour of a column of ``k`` printed layers, for every ``k``.
+
+    ``colors[k]`` is the sRGB colour seen from the top after ``k`` layers; ``filament[j]``
+    indexes the filament printed as layer ``j`` and ``transmittance[k]`` is the share of
+    backing light that still passes through ``k`` layers.
+    """
+
+    colors: np.ndarray
+    filament: np.ndarray
+    transmittance: np.ndarray
+    layer_height: float
+
+
+def to_linear(colors: np.ndarray) -> np.ndarray:
+    """8-bit sRGB to linear-light RGB in 0-1."""
+    return SRGB_TO_LINEAR[colors]
+
+
+def to_srgb(linear: np.ndarray) -> np.ndarray:
+    """Linear-light RGB in 0-1 to unrounded 0-255 sRGB."""
+    c = np.clip(linear, 0.0, 1.0)
+    return 255 * np.where(c <= 0.0031308, c * 12.92, 1.055 * c ** (1 / 2.4) - 0.055)
+
+
+def filament_optics(
+    filaments: list[FilamentProfile], layer_height: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Linear-light colour (F, 3) and one-layer transmittance (F,) of each filament."""
+    rgb = to_linear(_palette_array([f.color_hex for f in filaments]))
+    trans = np.array([transmittance(np.float64(layer_height), f.td_mm) for f in filaments])
+    return rgb, trans
+
+
+def layer_count(max_mm: float, layer_height: float) -> int:
+    return int(np.ceil(max_mm / layer_height - 1e-6))
+
+
+def build_layer_lut(
+    filaments: list[FilamentProfile],
+    swaps: list[tuple[float, int]],
+    layer_height: float,
+    max_mm: float,
+    backing: str = "#ffffff",
+) -> LayerLUT:
+    """Composite the layer stack once, bottom to top, with Beer–Lambert attenuation.
+
+    Printing starts with ``filaments[0]``; each ``(height_mm, index)`` in ``swaps``
+    switches to ``filaments[index]`` for layers starting at or above that height. A layer
+    of filament ``f`` passes ``exp(-layer_height / f.td_mm)`` of the light below it and
+    adds its own colour for the rest, mixed in linear light over ``backing``.
+    """
+    n = layer_count(max_mm, layer_height)
+    bottoms = np.arange(n) * layer_height
+    filament = np.zeros(n, dtype=np.intp)
+    for height, index in sorted(swaps):
+        filament[bottoms >= height - 1e-6] = index
+    rgb, trans = filament_optics(filaments, layer_height)
+
+    colors = np.empty((n + 1, 3))
+    through = np.empty(n + 1)
+    colors[0] = to_linear(_palette_array([backing]))[0]
+    through[0] = 1.0
+    for j, f in enumerate(filament):
+        colors[j + 1] = colors[j] * trans[f] + rgb[f] * (1 - trans[f])
+        through[j + 1] = through[j] * trans[f]
+    srgb = np.rint(to_srgb(colors)).astype(np.uint8)
+    return LayerLUT(srgb, filament, through.astype(np.float32), layer_height)
+
+
+def plan_layer_lut(plan: SwapPlan, max_mm: float, backing: str = "#ffffff") -> LayerLUT:
+    """`build_layer_lut` for a swap plan: each step switches to the filament it names."""
+    names = {f.name: i for i, f in enumerate(plan.filaments)}
+    swaps = [(s.height_mm, names[s.filament]) for s in plan.steps if s.filament in names]
+    return build_layer_lut(plan.filaments, swaps, plan.layer_height, max_mm, backing)
+
+
+def composite(thickness: np.ndarray, lut: LayerLUT) -> np.ndarray:
+    """Predicted (H, W, 3) sRGB image for a thickness map in mm.
+
+    Each pixel's layer count indexes the precomputed ``lut`` in a single gather of packed
+    32-bit colours, ``COMPOSITE_CHUNK`` pixels at a time, so full-resolution maps (or
+    memmaps) never need a float temporary of their full size.
+    """
+    h, w = thickness.shape
+    packed = np.zeros((len(lut.colors), 4), dtype=np.uint8)
+    packed[:, :3] = lut.colors
+    packed = packed.view(np.uint32)[:, 0]
+    flat = thickness.reshape(-1)
+    rgbx = np.empty(len(flat), dtype=np.uint32)
+    k = np.empty(min(len(flat), COMPOSITE_CHUNK), dtype=np.float32)
+    for s in range(0, len(flat), COMPOSITE_CHUNK):
+        t = flat[s : s + COMPOSITE_CHUNK]
+        kk = k[: len(t)]
+        np.multiply(t, 1.0 / lut.layer_height, out=kk)
+        np.rint(kk, out=kk)
+        np.clip(kk, 0, len(packed) - 1, out=kk)
+        np.take(packed, kk.astype(np.intp), out=rgbx[s : s + len(t)])
+    return rgbx.view(np.uint8).reshape(h, w, 4)[..., :3]
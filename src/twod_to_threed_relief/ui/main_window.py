@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
 
-from PySide6.QtCore import QSettings, Qt, QThreadPool
+from PySide6.QtCore import QSettings, Qt, QThreadPool, QTimer
 from PySide6.QtGui import QAction
 from PySide6.QtWidgets import (
+    QCheckBox,
     QFileDialog,
     QFormLayout,
     QHBoxLayout,
@@ -22,14 +24,19 @@ from PySide6.QtWidgets import (
     QWidget,
 )
 
+from twod_to_threed_relief.core.live import LivePreview, LiveUpdate
 from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings
+from twod_to_threed_relief.core.profiling import PROFILE_ENV
+from twod_to_threed_relief.core.stages import StageGraph
 from twod_to_threed_relief.ui.widgets.calibration_wizard import CalibrationWizard
 from twod_to_threed_relief.ui.widgets.filament_editor import FilamentEditor
 from twod_to_threed_relief.ui.widgets.image_viewer import ImageViewer
 from twod_to_threed_relief.ui.widgets.palette_editor import PaletteEditor
 from twod_to_threed_relief.ui.widgets.slicer_guide import SlicerGuideWidget
 from twod_to_threed_relief.ui.widgets.swap_table import SwapTable
-from twod_to_threed_relief.ui.workers import PipelineWorker
+from twod_to_threed_relief.ui.workers import LivePreviewWorker, PipelineWorker
+
+LIVE_DEBOUNCE_MS = 40
 
 
 class MainWindow(QMainWindow):
@@ -40,6 +47,15 @@ class MainWindow(QMainWindow):
         self.settings = QSettings("2d-to-3d-relief", "studio")
         self.thread_pool = QThreadPool.globalInstance()
         self.image_path = ""
+        self._pipeline_worker: PipelineWorker | None = None
+        self._graph: StageGraph | None = None
+        self._live: LivePreview | None = None
+        self._live_worker: LivePreviewWorker | None = None
+        self._live_generation = 0
+        self._live_timer = QTimer(self)
+        self._live_timer.setSingleShot(True)
+        self._live_timer.setInterval(LIVE_DEBOUNCE_MS)
+        self._live_timer.timeout.connect(self._run_live_preview)
 
         central = QWidget()
         root = QHBoxLayout(central)
@@ -77,11 +93,21 @@ class MainWindow(QMainWindow):
         self.blur = QDoubleSpinBox(); self.blur.setValue(0.0); self.blur.setSingleStep(0.2)
         self.mesh_res = QSpinBox(); self.mesh_res.setRange(32, 2048); self.mesh_res.setValue(256)
 
-        self.strategy = QComboBox(); self.strategy.addItems(["bands", "quantize", "tdblend"])
+        self.strategy = QComboBox()
+        self.strategy.addItems(["bands", "quantize", "tdblend", "optimize"])
         self.slicer = QComboBox(); self.slicer.addItems(["generic", "prusaslicer", "cura", "bambu", "orcaslicer"])
         self.gcode = QComboBox(); self.gcode.addItems(["none", "m600", "m0", "m25"])
         self.layer_height = QDoubleSpinBox(); self.layer_height.setValue(0.2)
         self.swap_count = QSpinBox(); self.swap_count.setValue(6)
+        self.live_preview = QCheckBox(); self.live_preview.setChecked(True)
+        self.live_preview.toggled.connect(self._schedule_live_preview)
+        live_inputs = (
+            self.width_mm, self.min_mm, self.max_mm, self.gamma, self.blur,
+            self.mesh_res, self.layer_height, self.swap_count,
+        )
+        for spin in live_inputs:
+            spin.valueChanged.connect(self._schedule_live_preview)
+        self.strategy.currentTextChanged.connect(self._schedule_live_preview)
 
         form.addRow("Input", self.input_edit)
         form.addRow("Output dir", self.output_edit)
@@ -96,9 +122,11 @@ class MainWindow(QMainWindow):
         form.addRow("Swap count", self.swap_count)
         form.addRow("Slicer", self.slicer)
         form.addRow("Gcode style", self.gcode)
+        form.addRow("Live preview", self.live_preview)
 
         layout.addLayout(form)
         self.palette_editor = PaletteEditor()
+        self.palette_editor.input.editingFinished.connect(self._schedule_live_preview)
         self.filament_editor = FilamentEditor()
         layout.addWidget(self.palette_editor)
         layout.addWidget(self.filament_editor)
@@ -148,6 +176,7 @@ class MainWindow(QMainWindow):
             self.image_path = urls[0].toLocalFile()
             self.input_edit.setText(self.image_path)
             self.original_view.set_image(self.image_path)
+            self._schedule_live_preview()
 
     def open_image(self) -> None:
         path, _ = QFileDialog.getOpenFileName(self, "Open image", "", "Images (*.png *.jpg *.jpeg *.bmp)")
@@ -156,6 +185,7 @@ class MainWindow(QMainWindow):
             self.input_edit.setText(path)
             self.original_view.set_image(path)
             self._log(f"Loaded {path}")
+            self._schedule_live_preview()
 
     def _relief_settings(self) -> ReliefSettings:
         return ReliefSettings(
@@ -184,28 +214,93 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Missing input", "Please open an image first.")
             return
         out = self.output_edit.text().strip() or str(Path.cwd() / "output")
-        worker = PipelineWorker(image, out, self._relief_settings(), self._plan_settings(), self.palette_editor.palette_value())
+        if self._pipeline_worker is not None:
+            # The cancelled run holds the graph until its current stage ends; drop its results.
+            old = self._pipeline_worker
+            old.cancel()
+            for signal in (old.signals.progress, old.signals.finished, old.signals.error):
+                signal.disconnect()
+        if self._graph is None or self._graph.input_path != Path(image):
+            self._graph = StageGraph(image)
+        worker = PipelineWorker(
+            self._graph,
+            out,
+            self._relief_settings(),
+            self._plan_settings(),
+            self.palette_editor.palette_value(),
+            profile_path=os.environ.get(PROFILE_ENV),
+        )
+        self._pipeline_worker = worker
         worker.signals.progress.connect(self._on_progress)
         worker.signals.finished.connect(self._on_finished)
         worker.signals.error.connect(self._on_error)
         self.thread_pool.start(worker)
         self._log("Pipeline started")
 
+    def _schedule_live_preview(self, *_args) -> None:
+        """Restart the debounce timer; the preview runs once the settings stop changing."""
+        if self.live_preview.isChecked() and self.input_edit.text().strip():
+            self._live_timer.start()
+
+    def _run_live_preview(self) -> None:
+        image = self.input_edit.text().strip()
+        if self._live is None or str(self._live.path) != str(Path(image)):
+            self._live = LivePreview(image)
+        if self._live_worker is not None:
+            self._live_worker.cancel()
+        self._live_generation += 1
+        worker = LivePreviewWorker(
+            self._live,
+            self._relief_settings(),
+            self._plan_settings(),
+            self.palette_editor.palette_value(),
+            self._live_generation,
+        )
+        worker.signals.update.connect(self._on_live_update)
+        worker.signals.error.connect(lambda message: self._log(f"Live preview: {message}"))
+        self._live_worker = worker
+        self.thread_pool.start(worker)
+
+    def _on_live_update(self, generation: int, update: LiveUpdate) -> None:
+        if generation != self._live_generation:
+            return
+        if update.stage == "heightmap":
+            self.heightmap_view.show_image(update.image)
+        elif update.stage == "quantized":
+            self.palette_view.show_image(update.image)
+        elif update.stage == "plan":
+            self.swap_table.set_steps([s.model_dump() for s in update.plan.steps])
+        elif update.stage == "preview":
+            self.pred_view.show_image(update.image)
+
+    def _is_current_pipeline(self) -> bool:
+        # Signals queued before a worker was replaced may still arrive after the disconnect.
+        worker = self._pipeline_worker
+        return worker is not None and self.sender() is worker.signals
+
     def _on_progress(self, step: str, value: int) -> None:
+        if not self._is_current_pipeline():
+            return
         self.progress.setValue(value)
         self.statusBar().showMessage(step)
 
     def _on_finished(self, result: dict) -> None:
-        self._log("Pipeline completed")
+        if not self._is_current_pipeline():
+            return
+        reused = [name for name, status in result["stages"].items() if status == "reused"]
+        self._log(f"Pipeline completed (reused: {', '.join(reused) or 'nothing'})")
+        if result["profile"]:
+            self._log(f"Profile trace written: {result['profile']}")
         self.swap_table.set_steps(result["plan"]["steps"])
-        out = Path(self.output_edit.text())
-        preview = out / "preview.png"
-        if preview.exists():
-            self.pred_view.set_image(str(preview))
+        self.heightmap_view.set_array(result["heightmap"])
+        self.palette_view.set_array(result["quantized"])
+        self.pred_view.set_array(result["preview"])
         self.guide.update_guide(self.slicer.currentText(), self.gcode.currentText())
         self._save_settings()
 
     def _on_error(self, message: str) -> None:
+        if not self._is_current_pipeline():
+            return
         QMessageBox.critical(self, "Pipeline error", message)
         self._log(f"Error: {message}")
 
@@ -1,19 +1,165 @@
 from __future__ import annotations
 
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QPixmap
-from PySide6.QtWidgets import QLabel, QVBoxLayout, QWidget
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+from PySide6.QtCore import QPointF, QRect, QRectF, Qt
+from PySide6.QtGui import QImage, QPainter
+from PySide6.QtWidgets import QWidget
+
+from twod_to_threed_relief.core.preview import TilePyramid
+
+ZOOM_STEP = 1.25
+MAX_ZOOM = 32.0
+_FORMATS = {
+    1: QImage.Format.Format_Grayscale8,
+    3: QImage.Format.Format_RGB888,
+    4: QImage.Format.Format_RGBA8888,
+}
+
+
+def display_array(array: np.ndarray) -> np.ndarray:
+    """uint8 gray, RGB or RGBA pixels for ``array``; floats in [0, 1] (heightmaps) are scaled."""
+    if array.dtype != np.uint8:
+        array = (np.clip(array, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+    if array.ndim == 3 and array.shape[2] == 1:
+        array = array[..., 0]
+    return array
+
+
+def wrap_array(array: np.ndarray) -> tuple[QImage, np.ndarray]:
+    """A `QImage` over ``array``'s memory and the array it wraps, which must outlive it.
+
+    An RGB view of packed RGBX pixels (what `composite` and `quantize_image` return) is
+    wrapped through its 4-byte pixels, so neither is copied; other layouts are packed first.
+    """
+    h, w = array.shape[:2]
+    fmt = _FORMATS[1 if array.ndim == 2 else array.shape[2]]
+    packed_rgbx = array.ndim == 3 and array.shape[2] == 3 and array.strides[1:] == (4, 1)
+    if packed_rgbx and array.base is not None:
+        array = np.lib.stride_tricks.as_strided(array, (h, w, 4), (array.strides[0], 4, 1))
+        fmt = QImage.Format.Format_RGBX8888
+    if not array.flags.c_contiguous:
+        array = np.ascontiguousarray(array)
+    return QImage(array.data, w, h, array.strides[0], fmt), array
 
 
 class ImageViewer(QWidget):
+    """Zoomable, pannable view of an image held as a NumPy array.
+
+    Nothing is copied for display: from 1:1 inwards the array itself is wrapped in a
+    `QImage` and only its visible part is drawn; zoomed out, the visible tiles of a
+    `TilePyramid` level are drawn, each built once. The wheel zooms about the cursor,
+    dragging pans and a double click fits the image again.
+    """
+
     def __init__(self) -> None:
         super().__init__()
-        layout = QVBoxLayout(self)
-        self.label = QLabel("No image")
-        self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.label.setMinimumSize(300, 300)
-        layout.addWidget(self.label)
+        self.setMinimumSize(300, 300)
+        self._array: np.ndarray | None = None
+        self._image: QImage | None = None
+        self._pyramid: TilePyramid | None = None
+        self._tiles: OrderedDict[tuple[int, int, int], tuple[QImage, np.ndarray]] = OrderedDict()
+        self._scale = 1.0
+        self._origin = QPointF()  # image point at the widget's top-left corner
+        self._fit = True
+        self._drag: QPointF | None = None
 
     def set_image(self, path: str) -> None:
-        pix = QPixmap(path)
-        self.label.setPixmap(pix.scaled(self.label.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
+        with Image.open(path) as image:
+            self.show_image(image)
+
+    def show_image(self, image: Image.Image) -> None:
+        """Display an in-memory image, e.g. a live preview frame."""
+        if image.mode not in ("L", "RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        self.set_array(np.asarray(image))
+
+    def set_array(self, array: np.ndarray) -> None:
+        """Display ``array`` (H, W[, C]) without copying uint8 gray, RGB or RGBA pixels.
+
+        The viewer keeps a reference, so the array must not be modified while shown. A
+        new array keeps the current zoom and pan, rescaled if its size differs.
+        """
+        array = display_array(array)
+        if self._array is not None and not self._fit:
+            ratio = array.shape[1] / self._array.shape[1]
+            self._scale /= ratio
+            self._origin *= ratio
+        self._image, self._array = wrap_array(array)
+        self._pyramid = TilePyramid(array)
+        self._tiles.clear()
+        self.update()
+
+    def _fit_scale(self) -> float:
+        h, w = self._array.shape[:2]
+        return min(self.width() / w, self.height() / h)
+
+    def _target(self, x0: float, y0: float, x1: float, y1: float) -> QRect:
+        # Whole-pixel edges, so neighbouring tiles meet without seams.
+        s, o = self._scale, self._origin
+        left, top = round((x0 - o.x()) * s), round((y0 - o.y()) * s)
+        return QRect(left, top, round((x1 - o.x()) * s) - left, round((y1 - o.y()) * s) - top)
+
+    def _tile(self, level: int, ty: int, tx: int) -> QImage:
+        key = (level, ty, tx)
+        if key not in self._tiles:
+            self._tiles[key] = wrap_array(self._pyramid.get(level, ty, tx))
+            while len(self._tiles) > self._pyramid.max_tiles:
+                self._tiles.popitem(last=False)
+        self._tiles.move_to_end(key)
+        return self._tiles[key][0]
+
+    def paintEvent(self, event) -> None:  # type: ignore[override]
+        painter = QPainter(self)
+        if self._array is None:
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, "No image")
+            return
+        h, w = self._array.shape[:2]
+        if self._fit:
+            s = self._scale = self._fit_scale()
+            self._origin = QPointF((w - self.width() / s) / 2, (h - self.height() / s) / 2)
+        s, o = self._scale, self._origin
+        view = (o.x(), o.y(), o.x() + self.width() / s, o.y() + self.height() / s)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, s < 4)
+        if self._pyramid.level_for_scale(s) > 0:
+            for level, ty, tx, rect in self._pyramid.visible(view, s):
+                painter.drawImage(self._target(*rect), self._tile(level, ty, tx))
+            return
+        x0, y0 = max(0, int(view[0])), max(0, int(view[1]))
+        x1, y1 = min(w, int(np.ceil(view[2]))), min(h, int(np.ceil(view[3])))
+        if x1 > x0 and y1 > y0:
+            source = QRectF(x0, y0, x1 - x0, y1 - y0)
+            painter.drawImage(self._target(x0, y0, x1, y1), self._image, source)
+
+    def wheelEvent(self, event) -> None:  # type: ignore[override]
+        if self._array is None:
+            return
+        pos = event.position()
+        anchor = self._origin + pos / self._scale
+        scale = self._scale * ZOOM_STEP ** (event.angleDelta().y() / 120)
+        self._scale = min(MAX_ZOOM, max(self._fit_scale() / 4, scale))
+        self._origin = anchor - pos / self._scale
+        self._fit = False
+        self.update()
+
+    def mousePressEvent(self, event) -> None:  # type: ignore[override]
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._drag = event.position()
+
+    def mouseMoveEvent(self, event) -> None:  # type: ignore[override]
+        if self._drag is None or self._array is None:
+            return
+        pos = event.position()
+        self._origin -= (pos - self._drag) / self._scale
+        self._drag = pos
+        self._fit = False
+        self.update()
+
+    def mouseReleaseEvent(self, event) -> None:  # type: ignore[override]
+        self._drag = None
+
+    def mouseDoubleClickEvent(self, event) -> None:  # type: ignore[override]
+        self._fit = True
+        self.update()
@@ -4,12 +4,31 @@ from pathlib import Path
 
 from PySide6.QtCore import QObject, QRunnable, Signal
 
-from twod_to_threed_relief.core.imageproc import build_heightmap, load_image, map_height_range
-from twod_to_threed_relief.core.io import ensure_dir, load_filaments, write_swap_plan, write_text
-from twod_to_threed_relief.core.mesh import build_relief_mesh, write_binary_stl
+from twod_to_threed_relief.core.io import ensure_dir, load_filaments
+from twod_to_threed_relief.core.live import LivePreview
 from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings
-from twod_to_threed_relief.core.palette import auto_palette, load_palette
-from twod_to_threed_relief.core.plan import build_swap_plan, export_snippet, plan_to_text, preview_plan_image
+from twod_to_threed_relief.core.palette import load_palette
+from twod_to_threed_relief.core.profiling import profile
+from twod_to_threed_relief.core.stages import StageGraph
+
+GUI_TARGETS = ("heightmap", "stl", "plan_files", "preview", "quantized")
+STAGE_PROGRESS = {
+    "decode": ("Loading image", 5),
+    "heightmap": ("Building heightmap", 20),
+    "thickness": ("Mapping thickness", 30),
+    "stl": ("Exporting mesh", 40),
+    "mesh": ("Building mesh", 45),
+    "palette": ("Extracting palette", 60),
+    "plan": ("Planning swaps", 70),
+    "plan_files": ("Writing plan", 80),
+    "preview_thickness": ("Rendering preview", 85),
+    "preview": ("Rendering preview", 90),
+    "quantized": ("Quantizing image", 95),
+}
+
+
+class CancelledError(Exception):
+    pass
 
 
 class WorkerSignals(QObject):
@@ -18,45 +37,115 @@ class WorkerSignals(QObject):
     error = Signal(str)
 
 
+class LiveSignals(QObject):
+    update = Signal(int, object)
+    error = Signal(str)
+
+
 class PipelineWorker(QRunnable):
-    def __init__(self, image_path: str, output_dir: str, relief: ReliefSettings, plan: PlanSettings, palette_value: str | None = None, filaments_path: str | None = None) -> None:
+    """Runs the full pipeline through a `StageGraph`, so reruns only redo what changed.
+
+    With ``profile_path`` each run writes a Chrome trace of its stages there.
+    """
+
+    def __init__(
+        self,
+        graph: StageGraph,
+        output_dir: str,
+        relief: ReliefSettings,
+        plan: PlanSettings,
+        palette_value: str | None = None,
+        filaments_path: str | None = None,
+        profile_path: str | None = None,
+    ) -> None:
         super().__init__()
         self.signals = WorkerSignals()
-        self.image_path = image_path
+        self.graph = graph
         self.output_dir = output_dir
         self.relief = relief
         self.plan = plan
         self.palette_value = palette_value
         self.filaments_path = filaments_path
+        self.profile_path = profile_path
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """Ask the worker to stop at the next stage boundary."""
+        self.cancelled = True
+
+    def _progress(self, step: str, value: int) -> None:
+        if self.cancelled:
+            raise CancelledError
+        self.signals.progress.emit(step, value)
 
     def run(self) -> None:
         try:
             out = ensure_dir(self.output_dir)
-            self.signals.progress.emit("Loading image", 5)
-            image = load_image(self.image_path)
-            mx = self.relief.mesh_x or self.relief.mesh_res
-            my = self.relief.mesh_y or self.relief.mesh_res
-            ratio = image.size[1] / image.size[0]
-            h_mm = self.relief.height_mm or self.relief.width_mm * ratio
-
-            self.signals.progress.emit("Building heightmap", 20)
-            hmap = build_heightmap(image, self.relief.gamma, self.relief.invert, self.relief.blur, mx, my)
-            thickness = map_height_range(hmap, self.relief.min_mm, self.relief.max_mm)
-            self.signals.progress.emit("Building mesh", 40)
-            tris = build_relief_mesh(thickness, self.relief.width_mm, h_mm, self.relief.min_mm)
-            stl_path = out / "relief.stl"
-            write_binary_stl(stl_path, tris)
-
-            self.signals.progress.emit("Planning swaps", 70)
-            pal = load_palette(self.palette_value) if self.palette_value else auto_palette(image, self.plan.colors, self.plan.palette_method, self.plan.seed)
+            pal = load_palette(self.palette_value) if self.palette_value else None
             fils = load_filaments(self.filaments_path) if self.filaments_path else None
-            swap = build_swap_plan(image, self.plan, palette=pal, filaments=fils)
-            write_swap_plan(out / "swap_plan.json", swap)
-            write_text(out / "swap_plan.txt", plan_to_text(swap))
-            preview_plan_image(image, swap, self.plan.preview_scale).save(out / "preview.png")
-            if self.plan.gcode_style != "none":
-                export_snippet(out / "swap_snippets.gcode", swap)
-            self.signals.progress.emit("Done", 100)
-            self.signals.finished.emit({"stl": str(stl_path), "plan": swap.model_dump()})
+            with profile(self.profile_path):
+                result = self.graph.run(
+                    self.relief,
+                    self.plan,
+                    out,
+                    palette=pal,
+                    filaments=fils,
+                    targets=GUI_TARGETS,
+                    progress=lambda name: self._progress(*STAGE_PROGRESS[name]),
+                )
+            self._progress("Done", 100)
+            # Arrays go to the viewers as they are, rather than back through the PNGs.
+            self.signals.finished.emit(
+                {
+                    "stl": str(result["stl"]),
+                    "plan": result["plan_files"].model_dump(),
+                    "heightmap": result["heightmap"],
+                    "quantized": result["quantized"],
+                    "preview": result["preview"],
+                    "stages": dict(self.graph.report),
+                    "profile": self.profile_path,
+                }
+            )
+        except CancelledError:
+            pass
         except Exception as exc:  # noqa: BLE001
             self.signals.error.emit(str(exc))
+
+
+class LivePreviewWorker(QRunnable):
+    """Renders one reduced-resolution live preview, emitting each stage as it finishes.
+
+    ``generation`` is sent with every update so the window can drop stale results;
+    `cancel` stops the render before its next stage.
+    """
+
+    def __init__(
+        self,
+        session: LivePreview,
+        relief: ReliefSettings,
+        plan: PlanSettings,
+        palette_value: str | None,
+        generation: int,
+    ) -> None:
+        super().__init__()
+        self.signals = LiveSignals()
+        self.session = session
+        self.relief = relief
+        self.plan = plan
+        self.palette_value = palette_value
+        self.generation = generation
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def run(self) -> None:
+        try:
+            pal = load_palette(self.palette_value) if self.palette_value else None
+            for update in self.session.render(self.relief, self.plan, palette=pal):
+                if self.cancelled:
+                    return
+                self.signals.update.emit(self.generation, update)
+        except Exception as exc:  # noqa: BLE001
+            if not self.cancelled:
+                self.signals.error.emit(str(exc))
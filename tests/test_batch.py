@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from twod_to_threed_relief.core.batch import BatchOptions, collect_jobs, run_batch
+from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings
+
+
+def test_batch_resumes_and_records_errors(tmp_path: Path) -> None:
+    src = tmp_path / "in"
+    src.mkdir()
+    for name, color in [("a", "gray"), ("b", "white")]:
+        Image.new("RGB", (32, 24), color).save(src / f"{name}.png")
+    (src / "broken.png").write_text("not an image")
+    manifest = tmp_path / "list.txt"
+    manifest.write_text("# same image again\nin/a.png\n")
+    out = tmp_path / "out"
+    opts = BatchOptions(ReliefSettings(mesh_res=16), PlanSettings(), no_cache=True)
+    jobs = collect_jobs(out, src, manifest)
+    assert [j.output_dir.name for j in jobs] == ["a", "b", "broken", "a-2"]
+
+    log = tmp_path / "results.jsonl"
+    first = [r["status"] for r in run_batch(jobs, opts, results_path=log)]
+    assert sorted(first) == ["error", "ok", "ok", "ok"]
+    assert (out / "a" / "relief.stl").exists() and (out / "a-2" / "preview.png").exists()
+
+    second = [r["status"] for r in run_batch(jobs, opts, results_path=log)]
+    assert sorted(second) == ["error", "skipped", "skipped", "skipped"]
+    assert len([json.loads(line) for line in log.read_text().splitlines()]) == 8
+
+
+def test_collect_jobs_keeps_output_dirs_distinct(tmp_path: Path) -> None:
+    out = tmp_path / "out"
+    manifest = tmp_path / "list.json"
+    manifest.write_text(json.dumps(["a.png", {"input": "b.png", "output_dir": "out/a"}]))
+    jobs = collect_jobs(out, manifest=manifest)
+    # The auto-named "a" listed first steps aside for the explicit out/a.
+    assert [j.output_dir.name for j in jobs] == ["a-2", "a"]
+
+    manifest.write_text(
+        json.dumps(
+            [{"input": "a.png", "output_dir": "out/x"}, {"input": "b.png", "output_dir": "out/./x"}]
+        )
+    )
+    with pytest.raises(ValueError, match="more than one input"):
+        collect_jobs(out, manifest=manifest)
@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+import numpy as np
+from typer.testing import CliRunner
+
+from twod_to_threed_relief.cli import app
+from twod_to_threed_relief.core.bench import (
+    BENCH_STAGES,
+    compare_results,
+    run_bench,
+    synthetic_image,
+)
+
+
+def test_bench_times_every_stage_and_flags_regressions() -> None:
+    assert np.array_equal(np.asarray(synthetic_image(40, 30)), np.asarray(synthetic_image(40, 30)))
+    results = run_bench([(64, 48)], [16], repeat=1)
+    (case,) = results["cases"]
+    assert case["name"] == "64x48@16" and tuple(case["stages"]) == BENCH_STAGES
+    assert all(m["seconds"] >= 0 and m["peak_bytes"] >= 0 for m in case["stages"].values())
+    assert compare_results(results, results) == []
+
+    slow = json.loads(json.dumps(results))
+    stage = slow["cases"][0]["stages"]["build_relief_mesh"]
+    stage["seconds"] += 1.0
+    (reg,) = compare_results(slow, results)
+    assert (reg.stage, reg.metric) == ("build_relief_mesh", "seconds") and reg.ratio > 1.25
+
+
+def test_bench_cli_compare_exit_code(tmp_path: Path) -> None:
+    runner = CliRunner()
+    args = ["bench", "--sizes", "64x48", "--mesh-res", "128", "--repeat", "1"]
+    base, new = tmp_path / "base.json", tmp_path / "new.json"
+    assert runner.invoke(app, [*args, "--output", str(base)]).exit_code == 0
+    compare = [*args, "--output", str(new), "--compare", str(base)]
+    assert runner.invoke(app, [*compare, "--threshold", "10"]).exit_code == 0
+
+    data = json.loads(base.read_text())
+    data["cases"][0]["stages"]["write_binary_stl"]["peak_bytes"] = 0
+    base.write_text(json.dumps(data))
+    res = runner.invoke(app, compare)
+    assert res.exit_code == 1 and "write_binary_stl peak_bytes" in res.stdout
@@ -0,0 +1,62 @@
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.cache import ArtifactCache
+from twod_to_threed_relief.core.imageproc import load_image
+from twod_to_threed_relief.core.models import ReliefSettings
+from twod_to_threed_relief.core.pipeline import PipelineContext
+
+
+def test_cache_roundtrip_and_lru_prune(tmp_path: Path) -> None:
+    cache = ArtifactCache(tmp_path / "cache")
+    calls = []
+    key = cache.key("heightmap", "abc", {"gamma": 1.0})
+
+    def compute() -> np.ndarray:
+        calls.append(1)
+        return np.arange(6, dtype=np.float32).reshape(2, 3)
+
+    first = cache.cached_array("heightmap", key, compute)
+    second = cache.cached_array("heightmap", key, compute)
+    assert len(calls) == 1
+    assert np.array_equal(first, second)
+    assert cache.key("heightmap", "abc", {"gamma": 1.2}) != key
+
+    cache.save_json("palette", "old", ["#000000"])
+    old = tmp_path / "cache" / "palette" / "old.json"
+    os.utime(old, (1, 1))
+    assert cache.prune(max_bytes=160) == 1
+    assert not old.exists()
+    assert cache.stats()["kinds"] == {"heightmap": {"entries": 1, "bytes": 152}}
+
+
+def test_disabled_cache_stores_nothing(tmp_path: Path) -> None:
+    cache = ArtifactCache(tmp_path / "cache", enabled=False)
+    cache.save_json("palette", "k", ["#ffffff"])
+    assert cache.load_json("palette", "k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_heightmap_cache_is_keyed_by_decode_path(tmp_path: Path) -> None:
+    src = tmp_path / "in.jpg"
+    rng = np.random.default_rng(3)
+    Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)).save(src)
+    relief = ReliefSettings(mesh_res=16)
+    cache = ArtifactCache(tmp_path / "cache")
+
+    hinted = PipelineContext(src, relief=relief, cache=cache)
+    hinted.write_relief(tmp_path / "hinted.stl")
+    # As when the plan stage, batch or the GUI already decoded the image.
+    full = PipelineContext(src, relief=relief, cache=cache, image=load_image(str(src)))
+    full.write_relief(tmp_path / "full.stl")
+    assert hinted.mesh_key != full.mesh_key
+
+    # Each cached file matches what its decode path computes without a cache.
+    fresh = PipelineContext(src, relief=relief, image=load_image(str(src)))
+    fresh.write_relief(tmp_path / "fresh.stl")
+    assert (tmp_path / "full.stl").read_bytes() == (tmp_path / "fresh.stl").read_bytes()
+    # JPEG draft decoding really does give a different mesh here.
+    assert (tmp_path / "hinted.stl").read_bytes() != (tmp_path / "fresh.stl").read_bytes()
@@ -0,0 +1,57 @@
+import numpy as np
+
+from twod_to_threed_relief.core.dither import (
+    DITHER_MODES,
+    _diffuse,
+    bayer_matrix,
+    blue_noise_mask,
+    dither_heights,
+)
+
+
+def _floyd_steinberg(levels: np.ndarray) -> np.ndarray:
+    x = levels.astype(np.float64)
+    h, w = x.shape
+    for y in range(h):
+        for i in range(w):
+            q = np.rint(x[y, i])
+            e, x[y, i] = x[y, i] - q, q
+            if i + 1 < w:
+                x[y, i + 1] += e * 7 / 16
+            for dx, weight in [(-1, 3), (0, 5), (1, 1)]:
+                if y + 1 < h and 0 <= i + dx < w:
+                    x[y + 1, i + dx] += e * weight / 16
+    return x
+
+
+def test_masks_are_permutations_of_levels() -> None:
+    for mask in [bayer_matrix(), blue_noise_mask(16)]:
+        ranks = np.sort((mask * mask.size - 0.5).round().reshape(-1))
+        assert np.array_equal(ranks, np.arange(mask.size))
+
+
+def test_dither_keeps_mean_and_snaps_to_layers() -> None:
+    flat = np.full((96, 80), 0.73, np.float32)
+    for mode in DITHER_MODES:
+        out = dither_heights(flat, 0.2, mode, limits=(0.6, 0.8))
+        assert np.allclose(np.unique(out), [0.6, 0.8])
+        assert abs(out.mean() - 0.73) < 0.005
+
+
+def test_limits_clip_to_whole_layers() -> None:
+    ramp = np.linspace(0.3, 1.1, 96 * 80, dtype=np.float32).reshape(96, 80)
+    for mode in DITHER_MODES:
+        out = dither_heights(ramp, 0.2, mode, limits=(0.3, 1.1))
+        layers = out / np.float32(0.2)
+        assert np.allclose(layers, np.rint(layers), atol=1e-5)
+        assert out.min() >= np.float32(0.4) and out.max() <= np.float32(1.0)
+        # Clipped cells hold exactly the values unclipped ones do.
+        assert set(np.unique(out)) <= set(np.float32(np.arange(6)) * np.float32(0.2))
+
+
+def test_diffusion_matches_serial_floyd_steinberg() -> None:
+    x = np.random.default_rng(1).random((37, 53)).astype(np.float32) * 5
+    assert np.array_equal(_diffuse(x, 64), _floyd_steinberg(x))
+    strips = _diffuse(x, 10)
+    for r0 in range(0, 37, 10):
+        assert np.array_equal(strips[r0 : r0 + 10], _floyd_steinberg(x[r0 : r0 + 10]))
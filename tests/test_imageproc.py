@@ -1,6 +1,14 @@
-from PIL import Image
+import numpy as np
+from PIL import Image, ImageFilter
 
-from twod_to_threed_relief.core.imageproc import build_heightmap, map_height_range
+from twod_to_threed_relief.core.imageproc import (
+    SourceRows,
+    build_heightmap,
+    load_image,
+    luminance_array,
+    map_height_range,
+    stream_heightmap,
+)
 
 
 def test_heightmap_shape_and_range() -> None:
@@ -10,3 +18,79 @@ def test_heightmap_shape_and_range() -> None:
     th = map_height_range(hm, 0.8, 3.2)
     assert float(th.min()) >= 0.8
     assert float(th.max()) <= 3.2
+
+
+def _reference_heightmap(img: Image.Image, blur: float, mx: int, my: int) -> np.ndarray:
+    img = img.filter(ImageFilter.GaussianBlur(radius=blur))
+    img = img.resize((mx, my), Image.Resampling.LANCZOS)
+    lum = np.asarray(img.convert("L"), dtype=np.float32)
+    return (lum - lum.min()) / (lum.max() - lum.min())
+
+
+def test_oversized_input_is_reduced_before_blur(tmp_path) -> None:
+    y, x = np.mgrid[0:1200, 0:1600]
+    a = ((np.sin(x / 90) + np.cos(y / 70)) * 60 + 128).astype(np.uint8)
+    img = Image.fromarray(np.stack([a, a, a], axis=-1))
+    hm = build_heightmap(img, blur=6.0, mesh_x=64, mesh_y=48)
+    assert np.abs(hm - _reference_heightmap(img, 6.0, 64, 48)).mean() < 0.01
+
+    path = tmp_path / "big.jpg"
+    img.save(path, quality=95)
+    small = load_image(str(path), size_hint=(64, 48))
+    assert 128 <= small.size[0] < 400 and small.size[1] >= 96
+    hm_small = build_heightmap(small, blur=6.0, mesh_x=64, mesh_y=48, source_width=1600)
+    assert np.abs(hm_small - hm).mean() < 0.02
+
+
+def test_stream_heightmap_matches_in_memory(tmp_path) -> None:
+    rng = np.random.default_rng(3)
+    img = Image.fromarray(rng.integers(0, 256, (300, 410, 3), dtype=np.uint8))
+    src = tmp_path / "in.png"
+    img.save(src)
+    cases = [(0.0, (50, 37), 0, "box"), (2.5, (120, 90), 7, "guided"), (1.0, (600, 450), 0, "")]
+    for blur, grid, smooth, mode in cases:
+        ref = build_heightmap(img, 1.4, True, blur, *grid, smooth=smooth, smooth_mode=mode)
+        hm = stream_heightmap(
+            src, tmp_path / "hm.npy", 1.4, True, blur, *grid, 16, smooth=smooth, smooth_mode=mode
+        )
+        assert isinstance(hm, np.memmap)
+        # Strip resampling may round a rare pixel to the neighbouring 8-bit level.
+        assert np.abs(hm - ref).max() <= 2 / 255
+        out = np.lib.format.open_memmap(tmp_path / "t.npy", "w+", np.float32, hm.shape)
+        mapped = map_height_range(hm, 0.8, 3.2, out=out)
+        assert np.array_equal(mapped, map_height_range(np.asarray(hm), 0.8, 3.2))
+
+
+def test_stream_heightmap_reads_uncompressed_sources_in_strips(tmp_path, caplog) -> None:
+    rng = np.random.default_rng(6)
+    img = Image.fromarray(rng.integers(0, 256, (301, 410, 3), dtype=np.uint8))
+    png = tmp_path / "in.png"
+    img.save(png)
+    with caplog.at_level("WARNING"):
+        ref = np.array(stream_heightmap(png, tmp_path / "ref.npy", 1.2, False, 2.0, 60, 45, 16))
+    assert "cannot be read in strips" in caplog.text
+    for name in ["in.tif", "in.bmp", "in.ppm"]:
+        img.save(tmp_path / name)
+        # Reduced 3x by strips of source rows, exactly as the whole-image decode is.
+        source = SourceRows(tmp_path / name, (60, 45))
+        assert source.streamed and source.factor == 3
+        hm = stream_heightmap(tmp_path / name, tmp_path / "hm.npy", 1.2, False, 2.0, 60, 45, 16)
+        assert np.array_equal(hm, ref)
+
+
+def test_luminance_luts_and_out_buffers() -> None:
+    rng = np.random.default_rng(5)
+    rgb = rng.integers(0, 256, (40, 30, 3), dtype=np.uint8)
+    c = rgb.astype(np.float64) / 255.0
+    lin = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    weights = [0.2126, 0.7152, 0.0722]
+    out = np.empty((40, 30), np.float32)
+    assert luminance_array(Image.fromarray(rgb), out=out) is out
+    assert np.allclose(out, c @ weights, atol=1e-6)
+    assert np.allclose(luminance_array(Image.fromarray(rgb), linear=True), lin @ weights, atol=1e-6)
+
+    gray = Image.fromarray(rgb[..., 0])
+    hm = np.empty((10, 12), np.float32)
+    assert build_heightmap(gray, 1.7, True, mesh_x=12, mesh_y=10, out=hm) is hm
+    ref = build_heightmap(gray.convert("RGB"), 1.7, True, mesh_x=12, mesh_y=10)
+    assert np.allclose(hm, ref, atol=1e-5)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from twod_to_threed_relief.core.kmeans import kmeans
+
+
+def test_kmeans_recovers_clusters_deterministically() -> None:
+    rng = np.random.default_rng(0)
+    true = np.array([[20, 20, 20], [200, 40, 40], [40, 200, 40], [240, 240, 240]], np.float32)
+    pts = true[rng.integers(4, size=5000)] + rng.normal(0, 3, (5000, 3)).astype(np.float32)
+    res = kmeans(pts, 4, seed=7)
+    err = np.abs(res.centers[:, None, :] - true[None, :, :]).max(axis=2)
+    assert sorted(err.argmin(axis=1)) == [0, 1, 2, 3]
+    assert err.min(axis=1).max() < 2
+    again = kmeans(pts, 4, seed=7, workers=1)
+    assert np.array_equal(res.centers, again.centers)
+    mini = kmeans(pts, 4, seed=7, batch_size=512)
+    assert mini.inertia < res.inertia * 1.1
+
+
+def test_kmeans_weighted_with_fewer_points_than_clusters() -> None:
+    pts = np.array([[0, 0, 0], [255, 255, 255]], np.float32)
+    res = kmeans(pts, 3, weights=np.array([1.0, 9.0]))
+    assert res.inertia == 0
+    assert {tuple(c) for c in res.centers} == {(0, 0, 0), (255, 255, 255)}
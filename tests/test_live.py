@@ -0,0 +1,31 @@
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.live import LIVE_PREVIEW_WIDTH, LivePreview
+from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings
+
+
+def test_live_preview_stages_and_memoized_heightmap(tmp_path) -> None:
+    y, x = np.mgrid[0:900, 0:1600]
+    a = ((np.sin(x / 90) + np.cos(y / 70)) * 60 + 128).astype(np.uint8)
+    path = tmp_path / "in.jpg"
+    Image.fromarray(np.stack([a, 255 - a, a], axis=-1)).save(path)
+    live = LivePreview(path)
+    palette = ["#000000", "#FF0000", "#FFFFFF"]
+
+    updates = list(live.render(ReliefSettings(blur=2.0), PlanSettings(), palette))
+    stages = [u.stage for u in updates]
+    assert stages[:3] == ["heightmap", "quantized", "plan"]
+    assert set(stages[3:]) == {"preview"} and updates[-1].final
+    assert updates[-1].image.size == (LIVE_PREVIEW_WIDTH, 576)
+
+    # Only the plan changed: heightmap and preview thickness come from the memo.
+    again = list(live.render(ReliefSettings(blur=2.0), PlanSettings(swap_count=3), palette))
+    assert [u.stage for u in again] == ["heightmap", "quantized", "plan", "preview"]
+    assert again[1].image is updates[1].image
+    assert len(again[2].plan.steps) == 3
+
+    # Stopping iteration early skips the remaining stages.
+    render = live.render(ReliefSettings(gamma=1.5), PlanSettings(), palette)
+    assert next(render).stage == "heightmap"
+    render.close()
@@ -0,0 +1,94 @@
+import zipfile
+from collections import Counter
+
+import numpy as np
+
+from twod_to_threed_relief.core.mesh import (
+    build_adaptive_relief_mesh,
+    build_indexed_relief_mesh,
+    build_relief_mesh,
+    triangle_count,
+    write_binary_stl,
+    write_mesh,
+    write_relief_stl,
+    write_relief_stl_parallel,
+)
+
+
+def _directed_edges(tris: np.ndarray) -> Counter:
+    edges: Counter = Counter()
+    for tri in tris:
+        pts = [tuple(p) for p in tri.tolist()]
+        for i in range(3):
+            edges[(pts[i], pts[(i + 1) % 3])] += 1
+    return edges
+
+
+def test_relief_mesh_is_closed_array() -> None:
+    th = np.linspace(1.0, 3.2, 5 * 7, dtype=np.float32).reshape(5, 7)
+    tris = build_relief_mesh(th, width_mm=60.0, height_mm=40.0, min_mm=0.8)
+    assert tris.shape == (triangle_count(5, 7), 3, 3)
+    assert tris.dtype == np.float32
+    edges = _directed_edges(tris)
+    assert all(n == 1 for n in edges.values())
+    assert all((b, a) in edges for a, b in edges)
+
+
+def test_binary_stl_matches_list_input(tmp_path) -> None:
+    th = np.linspace(1.0, 3.2, 4 * 6, dtype=np.float32).reshape(4, 6)
+    tris = build_relief_mesh(th, width_mm=30.0, height_mm=20.0, min_mm=0.8)
+    flat = np.zeros((3, 3), dtype=np.float32)
+    as_list = [tuple(t) for t in tris] + [(flat[0], flat[1], flat[2])]
+    write_binary_stl(tmp_path / "a.stl", np.concatenate([tris, flat[None]]), chunk=7)
+    write_binary_stl(tmp_path / "b.stl", as_list)
+    data = (tmp_path / "a.stl").read_bytes()
+    assert data == (tmp_path / "b.stl").read_bytes()
+    assert len(data) == 84 + 50 * len(as_list)
+    last = np.frombuffer(data[-50:-38], dtype="<f4")
+    assert last.tolist() == [0.0, 0.0, 1.0]
+
+
+def test_indexed_mesh_matches_soup_and_exports(tmp_path) -> None:
+    th = np.linspace(1.0, 3.2, 4 * 5, dtype=np.float32).reshape(4, 5)
+    mesh = build_indexed_relief_mesh(th, width_mm=30.0, height_mm=20.0, min_mm=0.8)
+    assert mesh.vertices.shape == (2 * 4 * 5, 3)
+    assert mesh.faces.dtype == np.int32
+    assert np.array_equal(mesh.triangles(), build_relief_mesh(th, 30.0, 20.0, 0.8))
+
+    write_mesh(tmp_path / "m.ply", mesh, "ply")
+    data = (tmp_path / "m.ply").read_bytes()
+    header_len = data.index(b"end_header\n") + len(b"end_header\n")
+    assert len(data) - header_len == 12 * len(mesh.vertices) + 13 * len(mesh.faces)
+
+    write_mesh(tmp_path / "m.obj", mesh, "obj")
+    lines = (tmp_path / "m.obj").read_text().splitlines()
+    assert sum(line.startswith("f ") for line in lines) == len(mesh.faces)
+
+    write_mesh(tmp_path / "m.3mf", mesh, "3mf")
+    with zipfile.ZipFile(tmp_path / "m.3mf") as zf:
+        model = zf.read("3D/3dmodel.model").decode()
+    assert model.count("<triangle ") == len(mesh.faces)
+
+
+def test_streamed_stl_matches_in_memory(tmp_path) -> None:
+    th = np.linspace(1.0, 3.2, 9 * 6, dtype=np.float32).reshape(9, 6)
+    write_binary_stl(tmp_path / "a.stl", build_relief_mesh(th, 30.0, 40.0, 0.8))
+    write_relief_stl(tmp_path / "b.stl", th, 30.0, 40.0, 0.8, strip_rows=3)
+    write_relief_stl_parallel(tmp_path / "c.stl", th, 30.0, 40.0, 0.8, workers=2, strip_rows=2)
+    expected = (tmp_path / "a.stl").read_bytes()
+    assert (tmp_path / "b.stl").read_bytes() == expected
+    assert (tmp_path / "c.stl").read_bytes() == expected
+
+
+def test_adaptive_mesh_is_closed_and_decimated() -> None:
+    th = np.full((33, 41), 1.5, dtype=np.float32)
+    th[9:20, 12:30] = 3.0
+    th[20:, :] += np.arange(41, dtype=np.float32) * 0.02
+    mesh = build_adaptive_relief_mesh(th, 60.0, 40.0, min_mm=0.8, tolerance_mm=0.05)
+    tris = mesh.triangles()
+    edges = _directed_edges(tris)
+    assert all(n == 1 for n in edges.values())
+    assert all((b, a) in edges for a, b in edges)
+    assert len(tris) < triangle_count(33, 41) // 4
+    on_bottom = (tris[:, :, 2] == np.float32(0.8)).all(axis=1)
+    assert on_bottom.sum() == 2
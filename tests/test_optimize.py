@@ -0,0 +1,55 @@
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.imageproc import build_heightmap, map_height_range
+from twod_to_threed_relief.core.models import FilamentProfile, PlanSettings
+from twod_to_threed_relief.core.optimize import SwapSearch, layer_stats
+from twod_to_threed_relief.core.palette import srgb_to_lab
+from twod_to_threed_relief.core.plan import build_swap_plan
+from twod_to_threed_relief.core.tdblend import composite, filament_optics, plan_layer_lut
+
+FILAMENTS = [
+    FilamentProfile(name=name, color_hex=color, td_mm=td)
+    for name, color, td in [
+        ("Black", "#111111", 0.6),
+        ("Red", "#E02020", 1.5),
+        ("Green", "#20C040", 1.5),
+        ("White", "#F5F5F5", 3.0),
+    ]
+]
+
+
+def _gradient() -> Image.Image:
+    y, x = np.mgrid[0:64, 0:64] * 4
+    return Image.fromarray(np.stack([x, y, (x + y) // 2], axis=-1).astype(np.uint8))
+
+
+def _predicted_error(img: Image.Image, hm: np.ndarray, strategy: str) -> tuple[float, object]:
+    settings = PlanSettings(strategy=strategy, swap_count=3, time_budget=2)
+    plan = build_swap_plan(img, settings, filaments=FILAMENTS, heightmap=hm)
+    pred = composite(map_height_range(hm, 0.8, 3.2), plan_layer_lut(plan, 3.2))
+    diff = srgb_to_lab(pred) - srgb_to_lab(np.asarray(img))
+    return float(np.sqrt((diff**2).sum(-1).mean())), plan
+
+
+def test_optimize_strategy_beats_fixed_bands() -> None:
+    img = _gradient()
+    hm = build_heightmap(img, mesh_x=64, mesh_y=64)
+    bands, _ = _predicted_error(img, hm, "bands")
+    optimized, plan = _predicted_error(img, hm, "optimize")
+    assert optimized < bands
+    assert 1 <= len(plan.steps) <= 3
+    assert all(s.height_mm >= 0.8 for s in plan.steps)
+    # The plan reports the same error its predicted preview has.
+    assert f"{optimized:.1f}" in plan.notes[-1]
+
+
+def test_refine_can_swap_at_the_first_allowed_layer() -> None:
+    thickness = np.linspace(0, 1.2, 16, dtype=np.float32).reshape(4, 4)
+    source = np.full((4, 4, 3), 128, dtype=np.uint8)
+    rgb, trans = filament_optics(FILAMENTS[:2], 0.2)
+    stats = layer_stats(thickness, source, 0.2, 6)
+    search = SwapSearch(stats, rgb, trans, np.ones(3), first_layer=3, max_swaps=2)
+    moves = set(search._moves((0,) * 6))
+    assert (0, 0, 0, 1, 1, 1) in moves
+    assert (0, 0, 1, 1, 1, 1) not in moves
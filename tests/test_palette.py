@@ -0,0 +1,42 @@
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.palette import (
+    auto_palette,
+    build_palette_lut,
+    color_histogram,
+    median_cut,
+    quantize_image,
+)
+
+
+def _two_tone() -> Image.Image:
+    arr = np.zeros((40, 50, 3), np.uint8)
+    arr[:, :30] = (250, 10, 10)
+    arr[:, 30:] = (12, 12, 200)
+    return Image.fromarray(arr)
+
+
+def test_color_histogram_weights_and_means() -> None:
+    hist = color_histogram(_two_tone())
+    assert hist.total == 2000
+    assert sorted(hist.counts.tolist()) == [800, 1200]
+    assert hist.top(1) == [("#fa0a0a", 0.6)]
+    assert len(median_cut(hist, 4)) == 2
+
+
+def test_auto_palette_methods_find_both_tones() -> None:
+    for method in ["kmeans", "median-cut"]:
+        assert sorted(auto_palette(_two_tone(), 2, method)) == ["#0c0cc8", "#fa0a0a"]
+
+
+def test_quantize_image_maps_to_nearest_palette_entry() -> None:
+    palette = ["#000000", "#ff0000", "#00ff00", "#ffffff"]
+    rng = np.random.default_rng(1)
+    pal = np.array([[0, 0, 0], [255, 0, 0], [0, 255, 0], [255, 255, 255]], np.int16)
+    truth = rng.integers(0, 4, size=(30, 40))
+    noisy = np.clip(pal[truth] + rng.integers(-20, 21, (30, 40, 3)), 0, 255).astype(np.uint8)
+    for metric in ["rgb", "lab"]:
+        idx, rgb = quantize_image(Image.fromarray(noisy), build_palette_lut(palette, metric=metric))
+        assert np.array_equal(idx, truth)
+        assert np.array_equal(rgb, pal[truth])
@@ -1,6 +1,8 @@
+import numpy as np
 from PIL import Image
 
-from twod_to_threed_relief.core.models import PlanSettings
+from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings
+from twod_to_threed_relief.core.pipeline import PipelineContext
 from twod_to_threed_relief.core.plan import build_swap_plan
 
 
@@ -9,3 +11,24 @@ def test_build_swap_plan_steps() -> None:
     plan = build_swap_plan(img, PlanSettings(strategy="bands", swap_count=4))
     assert len(plan.steps) == 4
     assert plan.steps[0].layer >= 1
+
+
+def test_build_swap_plan_uses_given_heightmap() -> None:
+    img = Image.new("RGB", (64, 64), "gray")
+    hm = np.tile(np.linspace(0.0, 1.0, 32, dtype=np.float32), (32, 1))
+    plan = build_swap_plan(img, PlanSettings(strategy="bands", swap_count=3), heightmap=hm)
+    layers = [s.layer for s in plan.steps]
+    assert layers == sorted(layers)
+    assert len(set(layers)) == 3
+
+
+def test_pipeline_context_decodes_once(tmp_path) -> None:
+    path = tmp_path / "in.png"
+    Image.new("RGB", (48, 32), "gray").save(path)
+    ctx = PipelineContext(path, relief=ReliefSettings(mesh_res=16))
+    assert ctx.size == (48, 32)
+    assert "image" not in ctx.__dict__
+    ctx.write_relief(tmp_path / "relief.stl")
+    plan = ctx.swap_plan(palette=["#000000", "#FFFFFF"])
+    assert ctx.heightmap.shape == (16, 16)
+    assert len(plan.steps) == ctx.plan.swap_count
@@ -0,0 +1,45 @@
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.models import PlanSettings
+from twod_to_threed_relief.core.pipeline import PipelineContext
+from twod_to_threed_relief.core.preview import ImagePyramid, TilePyramid
+
+
+def test_pyramid_picks_smallest_level_covering_size() -> None:
+    pyramid = ImagePyramid(Image.new("RGB", (1000, 600)))
+    assert pyramid.for_size(200, 100).size == (250, 150)
+    assert pyramid.for_size(260, 100).size == (500, 300)
+    assert pyramid.for_size(2000, 10).size == (1000, 600)
+    assert len(pyramid.levels) == 3
+
+
+def test_tile_pyramid_builds_only_visible_tiles() -> None:
+    rng = np.random.default_rng(2)
+    a = rng.integers(0, 256, (300, 517, 3), dtype=np.uint8)
+    pyramid = TilePyramid(a, tile=64)
+    assert pyramid.shapes[-1] == (19, 33) and pyramid.level_for_scale(0.3) == 1
+    tiles = pyramid.visible((0, 0, 517, 300), 0.3)
+    assert {t[:3] for t in tiles} == {(1, y, x) for y in range(3) for x in range(5)}
+    assert tiles[-1][3] == (512, 256, 517, 300)
+    level = np.concatenate(
+        [np.concatenate([pyramid.get(1, y, x) for x in range(5)], axis=1) for y in range(3)]
+    )
+    assert np.array_equal(level, np.asarray(Image.fromarray(a).reduce(2)))
+    assert pyramid.visible((130, 70, 190, 120), 2.0) == [(0, 1, 2, (128, 64, 192, 128))]
+    assert np.shares_memory(pyramid.get(0, 1, 2), a) and len(pyramid._tiles) == 15
+
+
+def test_progressive_preview_ends_with_final_preview(tmp_path) -> None:
+    y, x = np.mgrid[0:1024, 0:2048]
+    a = ((np.sin(x / 90) + np.cos(y / 70)) * 60 + 128).astype(np.uint8)
+    path = tmp_path / "in.png"
+    Image.fromarray(np.stack([a, 255 - a, a], axis=-1)).save(path)
+    ctx = PipelineContext(path, plan=PlanSettings(preview_scale=1.0))
+    plan = ctx.swap_plan(palette=["#000000", "#FF0000", "#FFFFFF"])
+    frames = list(ctx.preview_frames(plan))
+    assert [f.image.size for f in frames[:2]] == [(256, 128), (512, 256)]
+    assert [f.final for f in frames].count(True) == 1 and frames[-1].final
+    progress = [f.progress for f in frames]
+    assert progress == sorted(progress) and progress[-1] == 1.0
+    assert np.array_equal(np.asarray(frames[-1].image), np.asarray(ctx.preview(plan)))
@@ -0,0 +1,94 @@
+import json
+import threading
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+from typer.testing import CliRunner
+
+from twod_to_threed_relief.cli import app
+from twod_to_threed_relief.core.profiling import _NULL_SPAN, profile, span
+
+
+def test_spans_nest_and_export_chrome_trace(tmp_path) -> None:
+    with span("idle") as s:
+        s.note(array=np.zeros(4))
+    trace = tmp_path / "trace.json"
+    with profile(trace) as prof:
+        with span("outer", size=3) as outer:
+            with span("inner"):
+                data = np.ones((256, 1024), dtype=np.float32)
+            outer.note(data=data)
+    events = {e["name"]: e for e in json.loads(trace.read_text())["traceEvents"]}
+    assert set(events) == {"outer", "inner"}
+    outer, inner = events["outer"], events["inner"]
+    assert outer["ph"] == "X" and outer["tid"] == inner["tid"]
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert outer["args"]["size"] == 3
+    assert outer["args"]["data"] == {"shape": [256, 1024], "dtype": "float32", "bytes": 1 << 20}
+    # The array was allocated inside the inner span; the outer one still sees the peak.
+    assert inner["args"]["peak_bytes"] >= 1 << 20 and outer["args"]["peak_bytes"] >= 1 << 20
+    assert [row["name"] for row in prof.summary()] == ["outer", "inner"]
+    with span("after"):
+        pass
+    assert len(prof.events) == 2
+
+
+def test_cli_profile_traces_relief_stages(tmp_path) -> None:
+    src = tmp_path / "in.png"
+    rng = np.random.default_rng(2)
+    Image.fromarray(rng.integers(0, 256, (40, 50, 3), dtype=np.uint8)).save(src)
+    trace = tmp_path / "trace.json"
+    args = ["relief", "--input", str(src), "--output", str(tmp_path / "r.stl")]
+    res = CliRunner().invoke(
+        app, [*args, "--blur", "1", "--mesh-res", "16", "--no-cache", "--profile", str(trace)]
+    )
+    assert res.exit_code == 0, res.output
+    assert "Trace written" in res.output
+    names = {e["name"] for e in json.loads(trace.read_text())["traceEvents"]}
+    assert {"decode", "blur", "heightmap", "thickness", "build_mesh", "write_mesh"} <= names
+
+
+def _live_span() -> None:
+    with span("live"):
+        pass
+
+
+def test_overlapping_profiles_on_threads_stay_separate(tmp_path) -> None:
+    a_in, b_in, a_out = threading.Event(), threading.Event(), threading.Event()
+    profs = {}
+
+    def run_a() -> None:
+        with profile(tmp_path / "a.json") as profs["a"]:
+            with span("a"):
+                a_in.set()
+                b_in.wait(5)
+        a_out.set()
+
+    def run_b() -> None:
+        a_in.wait(5)
+        with profile(tmp_path / "b.json") as profs["b"]:
+            b_in.set()
+            a_out.wait(5)
+            # A has ended: B still records, with memory, and sees no spans from A.
+            with span("b"):
+                np.ones(1 << 18, dtype=np.float32)
+            # Like a live preview running alongside: other threads are not recorded.
+            outside = threading.Thread(target=_live_span)
+            outside.start()
+            outside.join()
+
+    threads = [threading.Thread(target=run_a), threading.Thread(target=run_b)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with span("later"):
+        pass
+    assert [e["name"] for e in profs["a"].events] == ["a"]
+    b_events = profs["b"].events
+    assert [e["name"] for e in b_events] == ["b"]
+    assert b_events[0]["args"]["peak_bytes"] >= 1 << 20
+    assert span("later") is _NULL_SPAN
+    assert not tracemalloc.is_tracing()
+    assert len(json.loads((tmp_path / "b.json").read_text())["traceEvents"]) == 1
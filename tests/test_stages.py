@@ -0,0 +1,48 @@
+import numpy as np
+from PIL import Image
+
+from twod_to_threed_relief.core.models import PlanSettings, ReliefSettings
+from twod_to_threed_relief.core.pipeline import PipelineContext
+from twod_to_threed_relief.core.stages import StageGraph
+
+
+def _ran(graph: StageGraph) -> set[str]:
+    return {name for name, status in graph.report.items() if status == "ran"}
+
+
+def test_stage_graph_reruns_only_invalidated_stages(tmp_path) -> None:
+    rng = np.random.default_rng(4)
+    src = tmp_path / "in.png"
+    Image.fromarray(rng.integers(0, 256, (60, 80, 3), dtype=np.uint8)).save(src)
+    out = tmp_path / "out"
+    out.mkdir()
+    relief, plan = ReliefSettings(mesh_res=24), PlanSettings(colors=3)
+    graph = StageGraph(src)
+    targets = ("stl", "plan_files", "preview", "quantized")
+
+    graph.run(relief, plan, out, targets=targets)
+    assert _ran(graph) == set(graph.report) and "mesh" in graph.report
+    ref = tmp_path / "ref.stl"
+    PipelineContext(src, relief=relief, plan=plan).write_relief(ref)
+    assert (out / "relief.stl").read_bytes() == ref.read_bytes()
+
+    graph.run(relief, plan, out, targets=targets)
+    assert _ran(graph) == set()
+
+    plan = plan.model_copy(update={"layer_height": 0.12})
+    graph.run(relief, plan, out, targets=targets)
+    assert _ran(graph) == {"plan", "plan_files", "preview"}
+
+    relief = relief.model_copy(update={"max_mm": 2.4})
+    stages = []
+    graph.run(relief, plan, out, progress=stages.append)
+    assert stages == ["thickness", "stl", "mesh", "preview_thickness", "preview"]
+
+    (out / "preview.png").unlink()
+    graph.run(relief, plan, out)
+    assert _ran(graph) == {"preview"} and (out / "preview.png").exists()
+
+    plan = plan.model_copy(update={"preview_scale": 0.25})
+    result = graph.run(relief, plan, out)
+    assert _ran(graph) == {"plan_files", "preview_thickness", "preview"}
+    assert result["plan_files"].settings == plan.model_dump()
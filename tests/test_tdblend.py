@@ -0,0 +1,30 @@
+import numpy as np
+
+from twod_to_threed_relief.core import tdblend
+from twod_to_threed_relief.core.models import FilamentProfile
+from twod_to_threed_relief.core.tdblend import build_layer_lut, composite
+
+BLACK = FilamentProfile(name="Black", color_hex="#000000", td_mm=0.1)
+WHITE = FilamentProfile(name="White", color_hex="#FFFFFF", td_mm=0.1)
+RED = FilamentProfile(name="Red", color_hex="#FF0000", td_mm=2.0)
+
+
+def test_layer_lut_follows_swaps_and_attenuation() -> None:
+    lut = build_layer_lut([BLACK, WHITE, RED], [(1.0, 1), (2.0, 2)], 0.2, 3.2)
+    assert lut.filament.tolist() == [0] * 5 + [1] * 5 + [2] * 6
+    assert lut.colors[0].tolist() == [255, 255, 255]
+    assert lut.colors[5].tolist() == [0, 0, 0]
+    assert lut.colors[10].tolist() == [255, 255, 255]
+    # A thin translucent red layer over white only tints it.
+    assert lut.colors[11][0] == 255 and 200 < lut.colors[11][1] < 255
+    assert np.all(np.diff(lut.transmittance) <= 0)
+
+
+def test_composite_gathers_layer_colors_in_chunks(monkeypatch) -> None:
+    lut = build_layer_lut([BLACK, WHITE, RED], [(1.0, 1), (2.0, 2)], 0.2, 3.2)
+    thickness = np.random.default_rng(0).uniform(0.0, 3.4, (37, 29)).astype(np.float32)
+    monkeypatch.setattr(tdblend, "COMPOSITE_CHUNK", 100)
+    rgb = composite(thickness, lut)
+    k = np.clip(np.rint(thickness / 0.2), 0, 16).astype(int)
+    assert rgb.shape == (37, 29, 3)
+    assert np.array_equal(rgb, lut.colors[k])